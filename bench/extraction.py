@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+'''
+Time the extractor, the generator and the SQL and database outputters on
+synthetic databases, see synthetic.py. The results can be written as JSON
+and checked against thresholds in seconds, or against the results of an
+earlier run, in which case the exit status is 1 if any stage regressed.
+Run from the top level directory with:
+
+    PYTHONPATH=./lib python bench/extraction.py -o results.json
+    PYTHONPATH=./lib python bench/extraction.py --baseline results.json
+    PYTHONPATH=./lib python bench/extraction.py \\
+        --thresholds bench/thresholds.json
+'''
+
+from __future__ import print_function
+from collections import OrderedDict
+from tempfile import mkdtemp
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import time
+
+from abridger.abridge_db import DbOutputter, SqlOutputter
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+from abridger.generator import Generator
+import abridger.database
+
+from synthetic import SyntheticSchema
+
+
+SCENARIOS = OrderedDict([
+    ('chain', dict(tables=8, depth=7, fan_out=1, rows=2000, subjects=1000)),
+    ('wide', dict(tables=31, depth=1, fan_out=5, rows=500, subjects=100)),
+    ('deep', dict(tables=12, roots=2, depth=5, fan_out=2, rows=100,
+                  subjects=50)),
+    ('compound', dict(tables=12, depth=3, fan_out=3, rows=200, subjects=50,
+                      compound_keys=True)),
+    ('cycles', dict(tables=12, depth=3, fan_out=3, rows=200, subjects=50,
+                    cycles=True)),
+])
+
+STAGES = ['extraction', 'generation', 'sql-output', 'db-output']
+
+# Differences below this many seconds are considered noise
+MIN_DIFFERENCE = 0.01
+
+
+def output(outputter, generator):
+    outputter.begin()
+    for insert_statement in generator.insert_statements:
+        outputter.insert_row(insert_statement)
+    for update_statement in generator.update_statements:
+        outputter.update_row(update_statement)
+    for delete_statement in generator.delete_statements:
+        outputter.delete_row(delete_statement)
+    outputter.commit()
+
+
+def best_of(repeat, setup, run):
+    '''Return the best time of repeat runs of run(setup()).'''
+    best = None
+    for i in range(repeat):
+        arg = setup()
+        start = time.time()
+        run(arg)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_scenario(temp_dir, name, params, repeat):
+    synthetic_schema = SyntheticSchema(**params)
+    src_path = os.path.join(temp_dir, '%s.sqlite3' % name)
+    conn = sqlite3.connect(src_path)
+    synthetic_schema.create(conn)
+    conn.close()
+
+    database = abridger.database.load('sqlite:///%s' % src_path)
+    extraction_model = ExtractionModel.load(database.schema,
+                                            synthetic_schema.make_config())
+
+    def make_extractor():
+        return Extractor(database, extraction_model)
+
+    def make_generator():
+        extractor = make_extractor()
+        extractor.launch()
+        return Generator(database.schema, extractor)
+
+    generator = make_generator()
+    generator.generate_statements()
+
+    def make_sql_outputter():
+        return SqlOutputter(database, os.path.join(temp_dir, 'out.sql'), 0)
+
+    def make_db_outputter():
+        dst_path = os.path.join(temp_dir, 'dst.sqlite3')
+        if os.path.exists(dst_path):
+            os.unlink(dst_path)
+        conn = sqlite3.connect(dst_path)
+        for tables in synthetic_schema.levels:
+            for table in tables:
+                for stmt in synthetic_schema.create_table_stmts(table):
+                    conn.execute(stmt)
+        conn.close()
+        return DbOutputter('sqlite:///%s' % dst_path, 0)
+
+    def finish_outputter(outputter):
+        output(outputter, generator)
+        if isinstance(outputter, SqlOutputter):
+            outputter.file.close()
+
+    times = OrderedDict([
+        ('extraction', best_of(repeat, make_extractor,
+                               lambda extractor: extractor.launch())),
+        ('generation', best_of(repeat, make_generator,
+                               lambda g: g.generate_statements())),
+        ('sql-output', best_of(repeat, make_sql_outputter,
+                               finish_outputter)),
+        ('db-output', best_of(repeat, make_db_outputter, finish_outputter)),
+    ])
+    database.disconnect()
+
+    return OrderedDict([
+        ('params', synthetic_schema.params()),
+        ('rows', sum([synthetic_schema.row_count(t)
+                      for level in synthetic_schema.levels for t in level])),
+        ('statements', len(generator.insert_statements) +
+         len(generator.update_statements) +
+         len(generator.delete_statements)),
+        ('times', times),
+    ])
+
+
+def find_regressions(results, limits, tolerance=0):
+    '''
+        Return (scenario, stage, time, limit) for each stage that took longer
+        than its limit plus the tolerance, a fraction of the limit. limits
+        has seconds per stage per scenario. Scenarios and stages without a
+        limit aren't checked.
+    '''
+    regressions = []
+    for (name, result) in results['scenarios'].items():
+        for (stage, elapsed) in result['times'].items():
+            limit = limits.get(name, {}).get(stage)
+            if limit is None:
+                continue
+            allowed = max(limit * (1 + tolerance), limit + MIN_DIFFERENCE)
+            if elapsed > allowed:
+                regressions.append((name, stage, elapsed, limit))
+    return regressions
+
+
+def print_results(results):
+    print('%-12s %8s %8s  %s' % ('Scenario', 'Rows', 'Output',
+                                 ' '.join(['%10s' % s for s in STAGES])))
+    for (name, result) in results['scenarios'].items():
+        print('%-12s %8d %8d  %s' % (
+            name, result['rows'], result['statements'],
+            ' '.join(['%9.3fs' % result['times'][s] for s in STAGES])))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark extraction on synthetic databases')
+    parser.add_argument('-s', '--scenario', dest='scenarios',
+                        action='append', choices=list(SCENARIOS.keys()),
+                        help='scenario to run, can be repeated (default: '
+                             'all of them)')
+    parser.add_argument('-x', '--scale', dest='scale', type=float,
+                        default=1, help='multiply the amount of rows and '
+                                        'subjects by this (default: 1)')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int,
+                        default=3, help='amount of runs, the best one is '
+                                        'reported (default: 3)')
+    parser.add_argument('-o', '--output', dest='output_path',
+                        metavar='PATH', help='write the results as JSON to '
+                                             'PATH')
+    parser.add_argument('--thresholds', dest='thresholds_path',
+                        metavar='PATH',
+                        help='fail if a stage takes longer than the seconds '
+                             'in the JSON file at PATH')
+    parser.add_argument('--baseline', dest='baseline_path', metavar='PATH',
+                        help='fail if a stage takes longer than in the '
+                             'results at PATH plus the tolerance')
+    parser.add_argument('--tolerance', dest='tolerance', type=float,
+                        default=0.25, help='with --baseline, the allowed '
+                                           'slowdown as a fraction '
+                                           '(default: 0.25)')
+    args = parser.parse_args()
+
+    limits = []
+    if args.thresholds_path is not None:
+        with open(args.thresholds_path) as f:
+            limits.append(('threshold', json.load(f), 0))
+    if args.baseline_path is not None:
+        with open(args.baseline_path) as f:
+            baseline = dict([(name, result['times']) for (name, result) in
+                             json.load(f)['scenarios'].items()])
+        limits.append(('baseline', baseline, args.tolerance))
+
+    results = OrderedDict([
+        ('python', platform.python_version()),
+        ('sqlite', sqlite3.sqlite_version),
+        ('scale', args.scale),
+        ('repeat', args.repeat),
+        ('scenarios', OrderedDict()),
+    ])
+
+    temp_dir = mkdtemp()
+    try:
+        for name in args.scenarios or SCENARIOS.keys():
+            params = dict(SCENARIOS[name])
+            params['rows'] = max(1, int(params['rows'] * args.scale))
+            params['subjects'] = max(1, int(params['subjects'] * args.scale))
+            results['scenarios'][name] = run_scenario(
+                temp_dir, name, params, args.repeat)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    print_results(results)
+    if args.output_path is not None:
+        with open(args.output_path, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+    failed = False
+    for (kind, stage_limits, tolerance) in limits:
+        for (name, stage, elapsed, limit) in find_regressions(
+                results, stage_limits, tolerance):
+            print('Regression: %s %s took %.3fs, %s is %.3fs' % (
+                name, stage, elapsed, kind, limit))
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+'''
+Measure the CPU time the extractor spends per fetched row, without any
+database latency: the scenarios of extraction.py are recorded once and the
+extraction is timed against a replay of the recording. Run from the top
+level directory with:
+
+    PYTHONPATH=./lib python bench/extractor_cpu.py
+'''
+
+from __future__ import print_function
+from tempfile import mkdtemp
+import argparse
+import os
+import shutil
+import sqlite3
+import time
+
+from abridger.database.recording import Recorder, ReplayDatabase
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+import abridger.database
+
+from extraction import SCENARIOS
+from synthetic import SyntheticSchema
+
+
+# Python 2 doesn't have process_time, clock is the CPU time on Unix
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+
+def record(temp_dir, name, params):
+    synthetic_schema = SyntheticSchema(**params)
+    src_path = os.path.join(temp_dir, '%s.sqlite3' % name)
+    conn = sqlite3.connect(src_path)
+    synthetic_schema.create(conn)
+    conn.close()
+
+    database = abridger.database.load('sqlite:///%s' % src_path)
+    recording_path = os.path.join(temp_dir, '%s.rec' % name)
+    database.recorder = Recorder(recording_path, database)
+    extraction_model = ExtractionModel.load(database.schema,
+                                            synthetic_schema.make_config())
+    Extractor(database, extraction_model).launch()
+    database.recorder.close()
+    database.disconnect()
+    return (recording_path, synthetic_schema.make_config())
+
+
+def time_extraction(recording_path, config, repeat):
+    '''Return the best CPU time and the amount of fetched rows.'''
+    database = ReplayDatabase(recording_path)
+    extraction_model = ExtractionModel.load(database.schema, config)
+    best = None
+    for i in range(repeat):
+        extractor = Extractor(database, extraction_model)
+        start = cpu_time()
+        extractor.launch()
+        elapsed = cpu_time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, extractor.fetched_row_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the CPU time of the extractor per fetched '
+                    'row')
+    parser.add_argument('-s', '--scenario', dest='scenarios',
+                        action='append', choices=list(SCENARIOS.keys()),
+                        help='scenario to run, can be repeated (default: '
+                             'all of them)')
+    parser.add_argument('-x', '--scale', dest='scale', type=float,
+                        default=1, help='multiply the amount of rows and '
+                                        'subjects by this (default: 1)')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int,
+                        default=5, help='amount of runs, the best one is '
+                                        'reported (default: 5)')
+    args = parser.parse_args()
+
+    print('%-12s %8s %10s %12s' % ('Scenario', 'Rows', 'CPU', 'Per row'))
+    temp_dir = mkdtemp()
+    try:
+        for name in args.scenarios or SCENARIOS.keys():
+            params = dict(SCENARIOS[name])
+            params['rows'] = max(1, int(params['rows'] * args.scale))
+            params['subjects'] = max(1, int(params['subjects'] * args.scale))
+            (recording_path, config) = record(temp_dir, name, params)
+            (elapsed, rows) = time_extraction(recording_path, config,
+                                              args.repeat)
+            print('%-12s %8d %9.3fs %10.2fus' % (
+                name, rows, elapsed, 1e6 * elapsed / rows))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+'''
+Time how long it takes to start abridge-db by importing it in a fresh
+interpreter, compared to starting an interpreter that imports nothing. Run
+from the top level directory with:
+
+    PYTHONPATH=./lib python bench/import_time.py
+'''
+
+from __future__ import print_function
+from time import time
+import argparse
+import os
+import subprocess
+import sys
+
+
+def time_import(module, repeat):
+    if module is None:
+        stmt = 'pass'
+    else:
+        stmt = 'import %s' % module
+
+    timings = []
+    for i in range(repeat):
+        start = time()
+        subprocess.check_call([sys.executable, '-c', stmt], env=os.environ)
+        timings.append(time() - start)
+    timings.sort()
+    return (timings[0], timings[len(timings) // 2])
+
+
+def print_slowest_imports(module, count):
+    # -X importtime is available from python 3.7 on
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stderr=subprocess.STDOUT, env=os.environ).decode('utf-8')
+    imports = []
+    for line in output.splitlines()[1:]:
+        (self_time, cumulative, name) = line.split('|')
+        imports.append((int(cumulative), name.strip()))
+    imports.sort(reverse=True)
+
+    print('\nSlowest imports, cumulative:')
+    for (cumulative, name) in imports[:count]:
+        print('%8.1fms %s' % (cumulative / 1000.0, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the abridge-db startup time')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int,
+                        default=20, help='amount of runs (default: 20)')
+    parser.add_argument('-m', '--module', dest='module',
+                        default='abridger.abridge_db',
+                        help='module to import (default: abridger.abridge_db)')
+    args = parser.parse_args()
+
+    for (name, module) in [('interpreter', None), (args.module, args.module)]:
+        (best, median) = time_import(module, args.repeat)
+        print('%-25s best %7.1fms median %7.1fms' % (
+            name, best * 1000, median * 1000))
+
+    if sys.version_info >= (3, 7):
+        print_slowest_imports(args.module, 15)
+
+
+if __name__ == '__main__':
+    main()
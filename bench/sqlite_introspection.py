@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+'''
+Time sqlite schema introspection with and without pragma functions on a
+generated schema. Run from the top level directory with:
+
+    PYTHONPATH=./lib python bench/sqlite_introspection.py -t 2000
+'''
+
+from __future__ import print_function
+from tempfile import NamedTemporaryFile
+import argparse
+import mock
+import sqlite3
+import time
+
+from abridger.schema import SqliteSchema
+
+
+def create_schema(conn, table_count):
+    for i in range(table_count):
+        fks = ''
+        if i > 0:
+            fks = (', parent_id INTEGER NOT NULL REFERENCES table%d, '
+                   'CONSTRAINT table%d_fk FOREIGN KEY (other_id) '
+                   'REFERENCES table0' % (i - 1, i))
+        conn.execute('''
+            CREATE TABLE table%d (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE,
+                value INTEGER,
+                other_id INTEGER%s)''' % (i, fks))
+        conn.execute('CREATE INDEX table%d_value_idx ON table%d (value)' % (
+            i, i))
+    conn.commit()
+
+
+def time_introspection(conn, repeat, pragma_functions):
+    with mock.patch.object(SqliteSchema, 'has_pragma_functions',
+                           return_value=pragma_functions):
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            SqliteSchema.create_from_conn(conn)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark sqlite schema introspection')
+    parser.add_argument('-t', '--tables', dest='tables', type=int,
+                        default=1000, help='amount of tables (default: 1000)')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int,
+                        default=3, help='amount of runs, the best one is '
+                                        'reported (default: 3)')
+    args = parser.parse_args()
+
+    with NamedTemporaryFile(suffix='.sqlite3') as f:
+        conn = sqlite3.connect(f.name)
+        create_schema(conn, args.tables)
+
+        print('sqlite %s, %d tables' % (sqlite3.sqlite_version, args.tables))
+        results = [('per-table pragmas', False)]
+        if SqliteSchema.has_pragma_functions(conn):
+            results.append(('pragma functions', True))
+        for (name, pragma_functions) in results:
+            elapsed = time_introspection(conn, args.repeat, pragma_functions)
+            print('%-20s %8.3fs' % (name, elapsed))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+'''
+Generate a synthetic sqlite database and an extraction config for it. The
+tables form trees: each table below the root tables has a not null foreign
+key to a table one level up, and each row of a table has fan-out rows
+referring to it in each of its child tables. Optionally, the keys are
+compound and the root tables have nullable foreign keys to the deepest
+tables of their trees, which makes cycles.
+
+The extraction config takes some rows of the first root table as subject
+and follows everything. Run from the top level directory with:
+
+    PYTHONPATH=./lib python bench/synthetic.py -d 3 -n 2 synthetic.sqlite3
+'''
+
+from __future__ import print_function
+import argparse
+import json
+import sqlite3
+
+from abridger.extraction_model import Relation
+
+
+class SyntheticSchema(object):
+    def __init__(self, tables=10, roots=1, depth=2, fan_out=2, rows=100,
+                 subjects=10, compound_keys=False, cycles=False):
+        if depth < 0 or roots < 1 or tables < roots + depth:
+            raise ValueError('At least roots + depth tables are needed')
+        self.table_count = tables
+        self.roots = roots
+        self.depth = depth
+        self.fan_out = fan_out
+        self.rows = rows
+        self.subjects = min(subjects, rows)
+        self.compound_keys = compound_keys
+        self.cycles = cycles
+
+        # Spread the tables that aren't roots evenly over the levels
+        self.levels = [['table%d' % i for i in range(roots)]]
+        self.levels.extend([[] for i in range(depth)])
+        for i in range(tables - roots):
+            self.levels[1 + i * depth // (tables - roots)].append(
+                'table%d' % (roots + i))
+
+        self.parents = {}
+        for level in range(1, depth + 1):
+            parent_level = self.levels[level - 1]
+            for (i, table) in enumerate(self.levels[level]):
+                self.parents[table] = parent_level[i % len(parent_level)]
+
+        # Each root table refers to a deepest table of its own tree
+        self.cycle_targets = {}
+        if cycles and depth > 0:
+            for table in self.levels[depth]:
+                root = self.root_of(table)
+                self.cycle_targets.setdefault(root, table)
+
+    def params(self):
+        return {
+            'tables': self.table_count,
+            'roots': self.roots,
+            'depth': self.depth,
+            'fan_out': self.fan_out,
+            'rows': self.rows,
+            'subjects': self.subjects,
+            'compound_keys': self.compound_keys,
+            'cycles': self.cycles,
+        }
+
+    def root_of(self, table):
+        while table in self.parents:
+            table = self.parents[table]
+        return table
+
+    def level_of(self, table):
+        for (level, tables) in enumerate(self.levels):
+            if table in tables:
+                return level
+
+    def row_count(self, table):
+        return self.rows * self.fan_out ** self.level_of(table)
+
+    def key_cols(self, prefix=''):
+        if self.compound_keys:
+            return ['%sid' % prefix, '%spart' % prefix]
+        return ['%sid' % prefix]
+
+    def key(self, i):
+        if self.compound_keys:
+            return (i, i % 3)
+        return (i,)
+
+    def create_table_stmts(self, table):
+        cols = ['id INTEGER NOT NULL']
+        if self.compound_keys:
+            cols.append('part INTEGER NOT NULL')
+        cols.append('name TEXT')
+        cols.append('value INTEGER')
+        constraints = ['PRIMARY KEY (%s)' % ', '.join(self.key_cols())]
+
+        indexes = []
+        for (prefix, dst_table, null) in self.foreign_keys(table):
+            fk_cols = self.key_cols(prefix)
+            for col in fk_cols:
+                cols.append('%s INTEGER%s' % (col, null))
+            constraints.append('FOREIGN KEY (%s) REFERENCES %s (%s)' % (
+                ', '.join(fk_cols), dst_table, ', '.join(self.key_cols())))
+            indexes.append('CREATE INDEX %s_%sidx ON %s (%s)' % (
+                table, prefix, table, ', '.join(fk_cols)))
+
+        return ['CREATE TABLE %s (\n    %s\n)' % (
+            table, ',\n    '.join(cols + constraints))] + indexes
+
+    def foreign_keys(self, table):
+        '''Return (column prefix, table, null) for the foreign keys of a
+           table.'''
+        foreign_keys = []
+        if table in self.parents:
+            foreign_keys.append(('parent_', self.parents[table], ' NOT NULL'))
+        if table in self.cycle_targets:
+            foreign_keys.append(('last_', self.cycle_targets[table], ''))
+        return foreign_keys
+
+    def make_row(self, table, i):
+        row = list(self.key(i)) + ['name%d' % i, i % 10]
+        for (prefix, dst_table, null) in self.foreign_keys(table):
+            if prefix == 'parent_':
+                # Row i of a parent has rows i * fan_out and up referring
+                # to it.
+                row.extend(self.key(i // self.fan_out))
+            else:
+                # The first row of the deepest table that descends from
+                # this row
+                row.extend(self.key(
+                    i * self.fan_out ** self.depth))
+        return tuple(row)
+
+    def create(self, conn):
+        for tables in self.levels:
+            for table in tables:
+                for stmt in self.create_table_stmts(table):
+                    conn.execute(stmt)
+
+        for tables in self.levels:
+            for table in tables:
+                rows = [self.make_row(table, i)
+                        for i in range(self.row_count(table))]
+                conn.executemany('INSERT INTO %s VALUES (%s)' % (
+                    table, ', '.join(['?'] * len(rows[0]))), rows)
+        conn.commit()
+
+    def make_config(self):
+        return [
+            {'subject': [{'tables': [{
+                'table': self.levels[0][0],
+                'column': 'id',
+                'values': list(range(self.subjects))}]}]},
+            {'relations': [{'defaults': Relation.DEFAULT_EVERYTHING}]},
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic sqlite database')
+    parser.add_argument(dest='path', metavar='PATH',
+                        help='path of the sqlite database to create')
+    parser.add_argument('-t', '--tables', dest='tables', type=int,
+                        default=10, help='amount of tables (default: 10)')
+    parser.add_argument('--roots', dest='roots', type=int,
+                        default=1, help='amount of root tables (default: 1)')
+    parser.add_argument('-d', '--depth', dest='depth', type=int,
+                        default=2, help='amount of levels of foreign keys '
+                                        'below the root tables (default: 2)')
+    parser.add_argument('-n', '--fan-out', dest='fan_out', type=int,
+                        default=2, help='amount of rows referring to each '
+                                        'row of a parent table (default: 2)')
+    parser.add_argument('-r', '--rows', dest='rows', type=int,
+                        default=100, help='amount of rows in each root '
+                                          'table (default: 100)')
+    parser.add_argument('-s', '--subjects', dest='subjects', type=int,
+                        default=10, help='amount of subject rows '
+                                         '(default: 10)')
+    parser.add_argument('--compound-keys', dest='compound_keys',
+                        action='store_true', default=False,
+                        help='use two column primary and foreign keys')
+    parser.add_argument('--cycles', dest='cycles', action='store_true',
+                        default=False,
+                        help='add nullable foreign keys from the root '
+                             'tables to the deepest tables')
+    parser.add_argument('-c', '--config', dest='config_path',
+                        metavar='CONFIG_PATH',
+                        help='write the extraction config to CONFIG_PATH')
+    args = parser.parse_args()
+
+    synthetic_schema = SyntheticSchema(
+        tables=args.tables, roots=args.roots, depth=args.depth,
+        fan_out=args.fan_out, rows=args.rows, subjects=args.subjects,
+        compound_keys=args.compound_keys, cycles=args.cycles)
+    conn = sqlite3.connect(args.path)
+    synthetic_schema.create(conn)
+    conn.close()
+
+    if args.config_path is not None:
+        # JSON is valid YAML
+        with open(args.config_path, 'w') as f:
+            json.dump(synthetic_schema.make_config(), f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,19 +7,30 @@ import os
 import sys
 import textwrap
 
-from abridger.extraction_model import ExtractionModel
+from abridger.extraction_model import ExtractionModel, SchemaScope
+from abridger.database.governor import Governor
+from abridger.exc import (CheckpointError, HooksError, QueryTimeoutError,
+                          TransferError)
 from abridger.extractor import Extractor
+from abridger.extractor.checkpoint import (Checkpoint, CheckpointState,
+                                           config_fingerprint,
+                                           restore_extractor)
 from abridger.generator import Generator
+from abridger.metrics import Metrics
+from abridger.planner import DEFAULT_MAX_ROWS, Planner
+from abridger.progress import ProgressReporter
 import abridger.config_file_loader
 import abridger.database
 
 
 EPILOG = '''
-    Unless -e is being used, exactly one of -f and -u must be specified.
+    Unless -e or --plan is being used, exactly one of -f and -u must be
+    specified.
     Use -f - to output the SQL results to stdout.
 
     Note that using -e is very inefficient since the extractor will do one
-    query for each row.
+    query for each row. Use --provenance to record why rows were extracted
+    during a normal extraction instead, and abridger-why to show it.
 
     Examples
         Extract data from a postgresql database and add it to another:
@@ -31,36 +42,88 @@ EPILOG = '''
         Extract data from a sqlite3 database and output SQL to stdout:
         {0} config.yaml sqlite:///test-db.sqlite3 -q -f -
 
+        Record the fetched rows and replay them without the source database:
+        {0} config.yaml postgresql://user@localhost/test -f test.sql --record test.rec
+        {0} config.yaml replay://test.rec -u postgresql://user@localhost/abridged_test
+
 '''.format(os.path.basename(sys.argv[0]))  # noqa
 
 
-class DbOutputter(object):
-    def __init__(self, url, verbosity):
+class Outputter(object):
+    hooks = None
+
+    def _start_output(self):
+        self.start_time = time()
+        if self.hooks is not None:
+            from abridger.hooks import TableEmitter
+            self.table_emitter = TableEmitter(self.hooks)
+            self.hooks.on_phase_start('output')
+
+    def _row_inserted(self, row):
+        if self.hooks is not None:
+            self.table_emitter.add(row[0])
+
+    def _finish_output(self):
+        if self.hooks is not None:
+            self.table_emitter.flush()
+            self.hooks.on_phase_end('output', time() - self.start_time)
+
+
+class DbOutputter(Outputter):
+    def __init__(self, url, verbosity, fast_load=False, unlogged=False,
+                 index_jobs=1, schema_cache=None, hooks=None):
         self.verbosity = verbosity
-        self.database = abridger.database.load(url, verbose=verbosity > 0)
+        self.hooks = hooks
+        self.database = abridger.database.load(url, verbose=verbosity > 0,
+                                               schema_cache=schema_cache)
         self.connection = self.database.connection
         self.cursor = self.connection.cursor()
+        self.fast_load = fast_load
+        self.unlogged = unlogged
+        self.index_jobs = index_jobs
+        self.fast_load_state = None
 
     def insert_row(self, row):
         self.database.insert_rows([row], cursor=self.cursor)
+        self._row_inserted(row)
 
     def update_row(self, row):
         self.database.update_rows([row], cursor=self.cursor)
 
+    def delete_row(self, row):
+        self.database.delete_rows([row], cursor=self.cursor)
+
     def begin(self):
-        pass
+        self._start_output()
+        if self.fast_load:
+            self.fast_load_state = self.database.begin_fast_load(
+                unlogged=self.unlogged)
+
+    def _end_fast_load(self):
+        if self.fast_load_state is None:
+            return
+
+        if self.verbosity > 0:
+            print('Rebuilding indexes...')
+        state = self.fast_load_state
+        self.fast_load_state = None
+        self.database.end_fast_load(state, jobs=self.index_jobs)
 
     def commit(self):
         self.connection.commit()
+        self._end_fast_load()
+        self._finish_output()
 
     def rollback(self):
         self.connection.rollback()
+        self._end_fast_load()
 
 
-class SqlOutputter(object):
-    def __init__(self, src_database, path, verbosity):
+class SqlOutputter(Outputter):
+    def __init__(self, src_database, path, verbosity, hooks=None):
         self.src_db = src_database
         self.verbosity = verbosity
+        self.hooks = hooks
         self.path = path
         self.cursor = self.src_db.connection.cursor()
 
@@ -75,13 +138,20 @@ class SqlOutputter(object):
         stmt = self.src_db.make_insert_stmt(self.cursor, row)
         self.file.write(stmt)
         self.file.write(b"\n")
+        self._row_inserted(row)
 
     def update_row(self, row):
         stmt = self.src_db.make_update_stmt(self.cursor, row)
         self.file.write(stmt)
         self.file.write(b"\n")
 
+    def delete_row(self, row):
+        stmt = self.src_db.make_delete_stmt(self.cursor, row)
+        self.file.write(stmt)
+        self.file.write(b"\n")
+
     def begin(self):
+        self._start_output()
         for stmt in self.src_db.make_begin_stmts():
             self.file.write(stmt)
             self.file.write(b"\n")
@@ -90,11 +160,34 @@ class SqlOutputter(object):
         for stmt in self.src_db.make_commit_stmts():
             self.file.write(stmt)
             self.file.write(b"\n")
+        self._finish_output()
 
     def rollback(self):
         pass
 
 
+def add_load_times(metrics, database, start_time):
+    elapsed_time = time() - start_time
+    metrics.add_phase_time('connect',
+                           elapsed_time - database.introspection_time)
+    metrics.add_phase_time('introspection', database.introspection_time)
+
+
+def write_stats(metrics, path):
+    if path is not None:
+        metrics.write_json(path)
+
+
+def finish_memory_report(memory_report, args):
+    if memory_report is None:
+        return
+    memory_report.stop()
+    if args.memory_report:
+        memory_report.print_summary()
+    if args.memory_report_json is not None:
+        memory_report.write_json(args.memory_report_json)
+
+
 def main(args):
     parser = argparse.ArgumentParser(
         description='Minimize a database',
@@ -112,6 +205,154 @@ def main(args):
     parser.add_argument('-e', '--explain', dest='explain', action='store_true',
                         default=False,
                         help='explain where rows are coming from')
+    parser.add_argument('--provenance', dest='provenance', metavar='PATH',
+                        help='record why each row was extracted to PATH, '
+                             'which abridger-why can show')
+    parser.add_argument('--plan', dest='plan', action='store_true',
+                        default=False,
+                        help='estimate the rows and queries of each table '
+                             'from the database statistics without '
+                             'extracting anything')
+    parser.add_argument('--plan-max-rows', dest='plan_max_rows', type=int,
+                        metavar='ROWS', default=None,
+                        help='with --plan, warn about tables estimated to '
+                             'exceed ROWS rows (default: %d)' %
+                             DEFAULT_MAX_ROWS)
+    parser.add_argument('--direct', dest='direct', action='store_true',
+                        default=False,
+                        help='with -u, copy rows directly from the source to '
+                             'the destination database without decoding '
+                             'them')
+    parser.add_argument('--direct-format', dest='direct_format',
+                        choices=['text', 'binary'], default='text',
+                        help='with --direct, the postgresql COPY format '
+                             '(default: text)')
+    parser.add_argument('--fast-load', dest='fast_load', action='store_true',
+                        default=False,
+                        help='drop secondary indexes and disable triggers '
+                             'on the destination database during the load')
+    parser.add_argument('--unlogged', dest='unlogged', action='store_true',
+                        default=False,
+                        help='with --fast-load, make postgresql tables '
+                             'without foreign keys unlogged during the load')
+    parser.add_argument('--index-jobs', dest='index_jobs', metavar='N',
+                        type=int, default=4,
+                        help='with --fast-load, the amount of indexes to '
+                             'rebuild in parallel (default: 4)')
+    parser.add_argument('--max-qps', dest='max_qps', metavar='N',
+                        type=float,
+                        help='maximum amount of queries per second on the '
+                             'source database')
+    parser.add_argument('--max-concurrent-queries',
+                        dest='max_concurrent_queries', metavar='N', type=int,
+                        help='maximum amount of concurrent queries on the '
+                             'source database')
+    parser.add_argument('--max-rows-per-second', dest='max_rows_per_second',
+                        metavar='N', type=float,
+                        help='maximum amount of rows per second fetched '
+                             'from the source database')
+    parser.add_argument('--statement-timeout', dest='statement_timeout',
+                        metavar='SECONDS', type=float,
+                        help='maximum duration of a source query. Queries '
+                             'that take longer are split and retried')
+    parser.add_argument('--checkpoint', dest='checkpoint', metavar='PATH',
+                        help='periodically save the extraction state to PATH')
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval',
+                        metavar='SECONDS', type=float, default=60,
+                        help='seconds between checkpoints (default: 60)')
+    parser.add_argument('--resume', dest='resume', metavar='PATH',
+                        help='resume an extraction from a checkpoint. New '
+                             'checkpoints are appended to PATH')
+    parser.add_argument('--save-state', dest='save_state', metavar='PATH',
+                        help='save the extraction state to PATH for use '
+                             'with --incremental')
+    parser.add_argument('--incremental', dest='incremental', metavar='PATH',
+                        help='only output the changes since the extraction '
+                             'that saved the state in PATH')
+    parser.add_argument('--fetch-cache', dest='fetch_cache', metavar='PATH',
+                        help='cache fetched rows in PATH and reuse them in '
+                             'later runs against the same source. Writes to '
+                             'a postgresql source are detected with its '
+                             'table statistics, which lag behind commits; '
+                             'use --invalidate-fetch-cache after writing')
+    parser.add_argument('--fetch-cache-size', dest='fetch_cache_size',
+                        metavar='MB', type=float, default=1024,
+                        help='maximum size of the fetch cache. The least '
+                             'recently used rows are evicted first '
+                             '(default: 1024)')
+    parser.add_argument('--fetch-cache-source', dest='fetch_cache_source',
+                        metavar='NAME',
+                        help='identify the source in the fetch cache by NAME '
+                             'instead of by its URL')
+    parser.add_argument('--invalidate-fetch-cache',
+                        dest='invalidate_fetch_cache', action='store_true',
+                        default=False,
+                        help='remove the cached rows of the source before '
+                             'extracting')
+    parser.add_argument('--query-journal', dest='query_journal',
+                        metavar='PATH',
+                        help='write the shape, parameter count, row count '
+                             'and latency of every source query to PATH as '
+                             'JSON lines')
+    parser.add_argument('--explain-slower-than', dest='explain_slower_than',
+                        metavar='SECONDS', type=float,
+                        help='add the query plan of source queries that '
+                             'take at least SECONDS to the query journal, '
+                             'once per statement shape')
+    parser.add_argument('--record', dest='record', metavar='PATH',
+                        help='record the rows fetched from the source to '
+                             'PATH, which can be replayed without the '
+                             'source with a replay://PATH source url')
+    parser.add_argument('--schema-cache', dest='schema_cache', metavar='DIR',
+                        help='cache database schemas and compiled configs '
+                             'in DIR')
+    parser.add_argument('--prune-schema', dest='prune_schema',
+                        action='store_true', default=False,
+                        help='only introspect the source tables that the '
+                             'config can reach')
+    parser.add_argument('--progress', dest='progress', nargs='?',
+                        const='text', choices=['text', 'json'],
+                        help='report progress on stderr with rates and an '
+                             'ETA, as text lines or JSON lines')
+    parser.add_argument('--progress-interval', dest='progress_interval',
+                        metavar='SECONDS', type=float, default=1.0,
+                        help='seconds between progress reports '
+                             '(default: 1)')
+    parser.add_argument('--progress-estimate', dest='progress_estimate',
+                        action='store_true', default=False,
+                        help='estimate the rows to extract like --plan '
+                             'does to give the extraction an ETA. This '
+                             'queries the statistics of each table first')
+    parser.add_argument('--memory-report', dest='memory_report',
+                        action='store_true', default=False,
+                        help='print the memory used at the end of each '
+                             'phase, which slows down the run')
+    parser.add_argument('--memory-report-json', dest='memory_report_json',
+                        metavar='PATH',
+                        help='write the memory report to PATH as JSON')
+    parser.add_argument('--memory-sample-interval',
+                        dest='memory_sample_interval', metavar='N', type=int,
+                        default=1000,
+                        help='also sample the memory every N work items of '
+                             'the extraction (default: 1000)')
+    parser.add_argument('--check-indexes', dest='check_indexes',
+                        action='store_true', default=False,
+                        help='warn about lookups on source columns without '
+                             'an index before extracting')
+    parser.add_argument('--stats-json', dest='stats_json', metavar='PATH',
+                        help='write the time spent in each phase and '
+                             'statistics of the queries on each table to '
+                             'PATH as JSON')
+    parser.add_argument('--traversal-stats', dest='traversal_stats',
+                        metavar='PATH',
+                        help='write the queries, rows and time of each '
+                             'followed relation and depth to PATH, as DOT '
+                             'if PATH ends with .dot, otherwise as JSON')
+    parser.add_argument('--hooks', dest='hooks', metavar='MODULE:CALLABLE',
+                        help='call CALLABLE in MODULE to make an '
+                             'abridger.hooks.Hooks that receives '
+                             'callbacks for phases, queries, work items '
+                             'and written tables')
     parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
                         default=False,
                         help="don't output anything")
@@ -130,43 +371,402 @@ def main(args):
     if args.verbose:
         verbosity = 2
 
-    if args.explain:
+    if args.plan and args.explain:
+        print('--plan can\'t be used with -e')
+        exit(1)
+    if args.plan_max_rows is not None and not args.plan:
+        print('--plan-max-rows can only be used with --plan')
+        exit(1)
+    if args.progress_estimate and args.progress is None:
+        print('--progress-estimate can only be used with --progress')
+        exit(1)
+
+    if args.explain or args.plan:
         if args.dst_url is not None:
-            print('-u is meaningless when using -e')
+            print('-u is meaningless when using %s' % (
+                '-e' if args.explain else '--plan'))
             exit(1)
         if args.dst_file is not None:
-            print('-f is meaningless when using -e')
+            print('-f is meaningless when using %s' % (
+                '-e' if args.explain else '--plan'))
             exit(1)
     else:
         if (args.dst_url is None) == (args.dst_file is None):
             print('Either -u or -f must be passed')
             exit(1)
 
-    src_database = abridger.database.load(args.src_url, verbose=verbosity > 0)
+    if args.explain and (args.checkpoint or args.resume):
+        print('--checkpoint and --resume can\'t be used with -e')
+        exit(1)
+    if args.checkpoint and args.resume:
+        print('--checkpoint can\'t be used with --resume')
+        exit(1)
+    if args.explain and (args.save_state or args.incremental):
+        print('--save-state and --incremental can\'t be used with -e')
+        exit(1)
+    if (args.checkpoint or args.resume) and \
+            (args.save_state or args.incremental):
+        print('--checkpoint and --resume can\'t be used with --save-state '
+              'or --incremental')
+        exit(1)
+    if args.incremental and args.direct:
+        print('--incremental can\'t be used with --direct')
+        exit(1)
+    if args.fetch_cache is None and (args.fetch_cache_source or
+                                     args.invalidate_fetch_cache):
+        print('--fetch-cache-source and --invalidate-fetch-cache can only be '
+              'used with --fetch-cache')
+        exit(1)
+    if args.explain_slower_than is not None and args.query_journal is None:
+        print('--explain-slower-than can only be used with --query-journal')
+        exit(1)
+    if args.fetch_cache and args.incremental:
+        print('--fetch-cache can\'t be used with --incremental')
+        exit(1)
+    if args.provenance is not None and (args.plan or args.resume or
+                                        args.incremental):
+        print('--provenance can\'t be used with --plan, --resume or '
+              '--incremental')
+        exit(1)
+    if args.record is not None and args.plan:
+        print('--record can\'t be used with --plan')
+        exit(1)
+    if args.src_url.startswith(abridger.database.REPLAY_URL_PREFIX):
+        for (option, value) in [('-f', args.dst_file),
+                                ('--direct', args.direct),
+                                ('--save-state', args.save_state),
+                                ('--incremental', args.incremental)]:
+            if value:
+                print('%s can\'t be used with a %s source' % (
+                    option, abridger.database.REPLAY_URL_PREFIX))
+                exit(1)
 
-    if not args.explain:
+    if args.direct and args.dst_url is None:
+        print('--direct can only be used with -u')
+        exit(1)
+    if args.fast_load and args.dst_url is None:
+        print('--fast-load can only be used with -u')
+        exit(1)
+    if args.unlogged and not args.fast_load:
+        print('--unlogged can only be used with --fast-load')
+        exit(1)
+
+    metrics = Metrics()
+
+    hooks = None
+    if args.hooks is not None:
+        from abridger.hooks import load_hooks
+        try:
+            hooks = load_hooks(args.hooks)
+        except HooksError as e:
+            print(str(e))
+            exit(1)
+
+    memory_report = None
+    if args.memory_report or args.memory_report_json is not None:
+        from abridger.memory import MemoryReport
+        memory_report = MemoryReport(interval=args.memory_sample_interval)
+
+    # Modules that are only needed for some of the options are imported
+    # when they're used to keep the startup time down.
+    schema_cache = None
+    if args.schema_cache is not None:
+        from abridger.schema_cache import SchemaCache
+        schema_cache = SchemaCache(args.schema_cache)
+
+    with metrics.phase('config'):
+        extraction_model_data = abridger.config_file_loader.load(
+            args.config_path)
+        schema_scope = None
+        if args.prune_schema:
+            schema_scope = SchemaScope.from_config(extraction_model_data)
+
+    # Direct transfers stage keys in temporary tables, so the source can't
+    # be read-only for them.
+    start_time = time()
+    src_database = abridger.database.load(args.src_url,
+                                          verbose=verbosity > 0,
+                                          read_only=not args.direct,
+                                          consistent=True,
+                                          schema_cache=schema_cache,
+                                          schema_scope=schema_scope)
+    add_load_times(metrics, src_database, start_time)
+    if memory_report is not None:
+        memory_report.sample('schema')
+    if args.stats_json is not None:
+        src_database.metrics = metrics
+    src_database.hooks = hooks
+    if verbosity > 1 and schema_scope is not None:
+        print('Introspected %d tables' % len(src_database.schema.tables))
+
+    if (args.max_qps, args.max_concurrent_queries, args.max_rows_per_second,
+            args.statement_timeout) != (None, None, None, None):
+        src_database.governor = Governor(
+            max_qps=args.max_qps,
+            max_concurrent_queries=args.max_concurrent_queries,
+            max_rows_per_second=args.max_rows_per_second,
+            statement_timeout=args.statement_timeout)
+
+    fetch_cache = None
+    if args.fetch_cache is not None:
+        from abridger.database.fetch_cache import FetchCache
+        fetch_cache = FetchCache(
+            args.fetch_cache,
+            args.fetch_cache_source or src_database.cache_fingerprint(),
+            max_size=int(args.fetch_cache_size * 1024 * 1024))
+        if args.invalidate_fetch_cache:
+            count = fetch_cache.invalidate()
+            if verbosity > 0:
+                print('Removed %d entries from the fetch cache' % count)
+        src_database.fetch_cache = fetch_cache
+
+    journal = None
+    if args.query_journal is not None:
+        from abridger.database.journal import QueryJournal
+        journal = QueryJournal(args.query_journal,
+                               slow_threshold=args.explain_slower_than)
+        src_database.journal = journal
+
+    recorder = None
+    if args.record is not None:
+        from abridger.database.recording import Recorder
+        recorder = Recorder(args.record, src_database)
+        src_database.recorder = recorder
+
+    if not args.explain and not args.plan:
         if args.dst_url is not None:
-            outputter = DbOutputter(args.dst_url, verbosity)
-            if not isinstance(src_database, type(outputter.database)):
+            start_time = time()
+            outputter = DbOutputter(args.dst_url, verbosity,
+                                    fast_load=args.fast_load,
+                                    unlogged=args.unlogged,
+                                    index_jobs=args.index_jobs,
+                                    schema_cache=schema_cache,
+                                    hooks=hooks)
+            add_load_times(metrics, outputter.database, start_time)
+            if not src_database.is_compatible_with(outputter.database):
                 print('src and dst databases must be of the same type')
                 exit(1)
+            if args.direct:
+                from abridger.transfer import get_transfer_class
+                try:
+                    transfer_cls = get_transfer_class(
+                        src_database, outputter.database)
+                except TransferError as e:
+                    print(str(e))
+                    exit(1)
         else:
-            outputter = SqlOutputter(src_database, args.dst_file, verbosity)
+            outputter = SqlOutputter(src_database, args.dst_file, verbosity,
+                                     hooks=hooks)
 
     if verbosity > 0:
         print('Querying...')
-    extraction_model_data = abridger.config_file_loader.load(args.config_path)
-    extraction_model = ExtractionModel.load(src_database.schema,
-                                            extraction_model_data)
+    with metrics.phase('config'):
+        if schema_cache is not None:
+            extraction_model = schema_cache.load_extraction_model(
+                src_database.schema, extraction_model_data)
+            if verbosity > 1:
+                print('Schema cache: %s' % schema_cache)
+        else:
+            extraction_model = ExtractionModel.load(src_database.schema,
+                                                    extraction_model_data)
+
+    if args.check_indexes:
+        from abridger.index_advisor import find_unindexed_lookups
+        for lookup in find_unindexed_lookups(extraction_model, src_database):
+            print('Warning: no index for lookups on %s' % lookup.describe())
+
+    if args.plan:
+        planner = Planner(src_database, extraction_model,
+                          max_rows=args.plan_max_rows or DEFAULT_MAX_ROWS)
+        planner.plan()
+        planner.print_plan()
+        src_database.disconnect()
+        exit(0)
+
+    fingerprint = config_fingerprint(extraction_model_data)
+    checkpoint = None
+    checkpoint_path = args.checkpoint or args.resume
+    if checkpoint_path is not None:
+        checkpoint = Checkpoint(checkpoint_path, extraction_model,
+                                fingerprint=fingerprint,
+                                interval=args.checkpoint_interval,
+                                append=args.resume is not None)
+
+    if args.save_state is not None:
+        # The state is written once the extraction is done, and only
+        # replaces any previous state once the output has succeeded.
+        from abridger.incremental import capture_high_water_marks
+        high_water_marks = capture_high_water_marks(src_database,
+                                                    extraction_model)
+        checkpoint = Checkpoint(args.save_state + '.tmp', extraction_model,
+                                fingerprint=fingerprint,
+                                interval=float('inf'),
+                                high_water_marks=high_water_marks)
+
+    progress = None
+    if args.progress is not None:
+        progress = ProgressReporter(interval=args.progress_interval,
+                                    json_lines=args.progress == 'json')
+        progress.start()
+
+    provenance = None
+    if args.provenance is not None:
+        from abridger.extractor.provenance import Provenance
+        provenance = Provenance()
+
     extractor = Extractor(src_database, extraction_model, explain=args.explain,
-                          verbosity=verbosity)
-    extractor.launch()
+                          verbosity=verbosity, checkpoint=checkpoint,
+                          progress=progress, memory_report=memory_report,
+                          provenance=provenance, hooks=hooks)
+
+    if args.resume is not None:
+        try:
+            restore_extractor(extractor, CheckpointState.load(args.resume),
+                              fingerprint=fingerprint)
+        except CheckpointError as e:
+            print(str(e))
+            exit(1)
+        if verbosity > 0:
+            print('Resuming with %d queued work items and %d fetched rows' % (
+                extractor.work_queue.qsize(), extractor.fetched_row_count))
+
+    incremental = None
+    if args.incremental is not None:
+        from abridger.incremental import IncrementalExtraction
+        try:
+            incremental = IncrementalExtraction(
+                extractor, CheckpointState.load(args.incremental),
+                fingerprint=fingerprint)
+        except CheckpointError as e:
+            print(str(e))
+            exit(1)
+        try:
+            with metrics.phase('extraction'):
+                incremental.prepare()
+        except QueryTimeoutError as e:
+            print(str(e))
+            exit(1)
+        if verbosity > 0:
+            print('Processed %d changed rows and found %d deleted rows' % (
+                incremental.processed_row_count,
+                len(incremental.deleted_rows)))
+
+    if progress is not None:
+        # The planner's estimate of the rows gives the extraction an ETA
+        total_rows = None
+        if args.progress_estimate:
+            planner = Planner(src_database, extraction_model)
+            planner.plan()
+            total_rows = int(sum(
+                [p.estimated_rows for p in planner.table_plans.values()]))
+        progress.start_phase('extraction', total_rows=total_rows,
+                             start_rows=extractor.new_row_count,
+                             start_queries=extractor.fetch_count)
+    try:
+        with metrics.phase('extraction'):
+            extractor.launch()
+    except QueryTimeoutError as e:
+        # A single value that can't be fetched in time can't be split up
+        print(str(e))
+        exit(1)
+    if progress is not None:
+        progress.finish_phase()
+    if args.traversal_stats is not None:
+        extractor.traversal_stats.write(args.traversal_stats)
+    if checkpoint is not None:
+        checkpoint.close()
+    if fetch_cache is not None:
+        if verbosity > 0:
+            print('Fetch cache: %s' % fetch_cache)
+        fetch_cache.close()
+        src_database.fetch_cache = None
+    if journal is not None:
+        if verbosity > 0:
+            print('Query journal: %s' % journal)
+        journal.close()
+        src_database.journal = None
+    if provenance is not None:
+        if verbosity > 0:
+            print('Provenance: %s' % provenance)
+        provenance.write(args.provenance)
+    if recorder is not None:
+        if verbosity > 0:
+            print('Recording: %s' % recorder)
+        recorder.close()
+        src_database.recorder = None
+
+    if memory_report is not None:
+        from abridger.memory import extractor_structures
+        memory_report.sample('extraction', rows=extractor.new_row_count,
+                             structures=extractor_structures(extractor))
 
     if args.explain:
+        write_stats(metrics, args.stats_json)
+        finish_memory_report(memory_report, args)
         exit(0)
 
-    generator = Generator(src_database.schema, extractor)
-    generator.generate_statements()
+    if progress is not None:
+        progress.start_phase('generation')
+    with metrics.phase('generation'):
+        if incremental is not None:
+            from abridger.incremental import DeltaGenerator
+            generator = DeltaGenerator(
+                src_database.schema, extractor, incremental.previous_rows,
+                incremental.deleted_rows, hooks=hooks)
+        elif args.direct:
+            # Direct transfers copy the rows themselves and only need the
+            # updates of the deferred foreign keys.
+            generator = Generator(src_database.schema, extractor,
+                                  generate=False, hooks=hooks)
+            generator.generate_update_statements()
+        else:
+            generator = Generator(src_database.schema, extractor,
+                                  hooks=hooks)
+
+    if progress is not None:
+        progress.finish_phase()
+    if memory_report is not None:
+        from abridger.memory import generator_structures
+        memory_report.sample('generation',
+                             rows=len(generator.insert_statements),
+                             structures=generator_structures(generator))
+
+    if args.direct:
+        start_time = time()
+        if progress is not None:
+            progress.start_phase('output')
+        transfer = transfer_cls(src_database, outputter.database, generator,
+                                verbosity=verbosity,
+                                copy_format=args.direct_format,
+                                hooks=hooks)
+        try:
+            outputter.begin()
+            transfer.run()
+            outputter.commit()
+        finally:
+            try:
+                outputter.rollback()
+            except:   # pragma: no cover
+                pass  # pragma: no cover
+
+            src_database.disconnect()
+
+        if args.save_state is not None:
+            os.rename(args.save_state + '.tmp', args.save_state)
+
+        elapsed_time = time() - start_time
+        metrics.add_phase_time('output', elapsed_time)
+        write_stats(metrics, args.stats_json)
+        if progress is not None:
+            progress.finish_phase()
+        if memory_report is not None:
+            memory_report.sample('output')
+            finish_memory_report(memory_report, args)
+        if verbosity > 0:
+            print('Copied %d rows and performed %d updates' % (
+                transfer.insert_count, transfer.update_count))
+            print('Data loading completed in %0.1f seconds' % elapsed_time)
+        return
 
     if args.dst_url is not None:
         # The src database isn't needed any more
@@ -178,7 +778,9 @@ def main(args):
     table_update_counts = defaultdict(int)
     total_insert_count = len(generator.insert_statements)
     total_update_count = len(generator.update_statements)
-    total_count = total_insert_count + total_update_count
+    total_delete_count = len(generator.delete_statements)
+    total_count = total_insert_count + total_update_count + \
+        total_delete_count
 
     start_time = time()
 
@@ -205,9 +807,13 @@ def main(args):
                     'Writing SQL for %d inserts and %d updates '
                     'in %d tables...' % (
                         total_insert_count, total_update_count, len(tables)))
+            if total_delete_count > 0:
+                print('Deleting %d rows...' % total_delete_count)
 
         insert_count = 0
         count = 0
+        if progress is not None:
+            progress.start_phase('output', total_rows=total_count)
         outputter.begin()
         for insert_statement in generator.insert_statements:
             (table, values) = insert_statement
@@ -222,8 +828,9 @@ def main(args):
                     table_insert_counts[table],
                     total_table_insert_counts[table],
                     table))
-            outputter
             outputter.insert_row(insert_statement)
+            if progress is not None:
+                progress.update(count)
 
         update_count = 0
         for update_statement in generator.update_statements:
@@ -240,6 +847,21 @@ def main(args):
                     table_update_counts[table],
                     table))
             outputter.update_row(update_statement)
+            if progress is not None:
+                progress.update(count)
+
+        delete_count = 0
+        for delete_statement in generator.delete_statements:
+            table = delete_statement[0]
+            delete_count += 1
+            count += 1
+            if verbosity > 1:
+                percentage = math.floor(1000 * (count / total_count)) / 10
+                print("%5.1f%% Deleting  (%6d/%6d) row in %s" % (
+                    percentage, delete_count, total_delete_count, table))
+            outputter.delete_row(delete_statement)
+            if progress is not None:
+                progress.update(count)
 
         outputter.commit()
     finally:
@@ -251,9 +873,19 @@ def main(args):
 
         src_database.disconnect()
 
+    if args.save_state is not None:
+        os.rename(args.save_state + '.tmp', args.save_state)
+
+    elapsed_time = time() - start_time
+    metrics.add_phase_time('output', elapsed_time)
+    write_stats(metrics, args.stats_json)
+    if progress is not None:
+        progress.close()
+    if memory_report is not None:
+        memory_report.sample('output')
+        finish_memory_report(memory_report, args)
     if verbosity > 0:
         if args.dst_url is not None:
-            elapsed_time = time() - start_time
             print('Data loading completed in %0.1f seconds' % elapsed_time)
         else:
             print('Done')
@@ -0,0 +1,46 @@
+from signal import signal, SIGPIPE, SIG_DFL
+import argparse
+
+from abridger.database import load
+from abridger.extraction_model import ExtractionModel
+from abridger.index_advisor import find_unindexed_lookups
+from abridger.schema_cache import SchemaCache
+import abridger.config_file_loader
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Find the lookups an extraction does on columns '
+                    'without an index')
+    parser.add_argument(dest='config_path', metavar='CONFIG_PATH',
+                        help='path to extraction config file')
+    parser.add_argument(dest='url', help="database url")
+    parser.add_argument('--sql', dest='sql', action='store_true',
+                        default=False,
+                        help='output CREATE INDEX statements')
+    parser.add_argument('--schema-cache', dest='schema_cache', metavar='DIR',
+                        help='cache the database schema in DIR')
+
+    # Ignore SIG_PIPE and don't throw exceptions on it
+    signal(SIGPIPE, SIG_DFL)
+
+    args = parser.parse_args(args)
+    schema_cache = None
+    if args.schema_cache is not None:
+        schema_cache = SchemaCache(args.schema_cache)
+
+    data = abridger.config_file_loader.load(args.config_path)
+    database = load(args.url, schema_cache=schema_cache)
+    extraction_model = ExtractionModel.load(database.schema, data)
+    lookups = find_unindexed_lookups(extraction_model, database)
+    database.disconnect()
+
+    for lookup in lookups:
+        if args.sql:
+            print('-- %s' % lookup.describe())
+            print(lookup.create_index_statement())
+        else:
+            print(lookup.describe())
+
+    if not args.sql and len(lookups) == 0:
+        print('All lookups are indexed')
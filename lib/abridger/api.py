@@ -0,0 +1,141 @@
+'''
+Library API for embedding abridger. The extracted rows, or the statements
+that load them, are yielded one table at a time so that they can be
+written to any sink without building the whole output in memory:
+
+    for table, rows in abridge('sqlite:///src.sqlite3', 'config.yaml'):
+        sink.write(table.name, rows)
+
+Nothing is printed.
+'''
+
+from collections import namedtuple
+
+import six
+
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+from abridger.generator import Generator
+import abridger.config_file_loader
+import abridger.database
+
+
+class TableRows(namedtuple('TableRows', ['table', 'rows'])):
+    '''Extracted rows of a table, as tuples in the order of table.cols.'''
+    __slots__ = ()
+
+    @property
+    def col_names(self):
+        return [c.name for c in self.table.cols]
+
+
+InsertStatement = namedtuple('InsertStatement', ['table', 'values'])
+UpdateStatement = namedtuple('UpdateStatement', [
+    'table', 'pk_cols', 'pk_values', 'cols', 'values'])
+
+
+class _Abridgement(object):
+    '''Runs the extraction and hands out the results of each table once,
+       dropping them from the extractor as soon as they're handed out.'''
+
+    def __init__(self, database, config, hooks=None):
+        self.own_database = isinstance(database, six.string_types)
+        if self.own_database:
+            database = abridger.database.load(database)
+        self.database = database
+        self.hooks = hooks
+        self.previous_hooks = database.hooks
+        database.hooks = hooks
+
+        if isinstance(config, six.string_types):
+            config = abridger.config_file_loader.load(config)
+        self.extraction_model = ExtractionModel.load(database.schema, config)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.database.hooks = self.previous_hooks
+        if self.own_database:
+            self.database.disconnect()
+
+    def launch(self):
+        self.extractor = Extractor(self.database, self.extraction_model,
+                                   hooks=self.hooks)
+        self.extractor.launch()
+        self.generator = Generator(self.database.schema, self.extractor,
+                                   generate=False)
+
+    def release(self, table):
+        del self.extractor.results[table]
+
+    def emitted(self, table, rows):
+        if self.hooks is not None:
+            self.hooks.on_table_emitted(table, rows)
+
+
+def _batches(rows, batch_size):
+    if batch_size is None:
+        yield rows
+        return
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+
+def abridge(database, config, batch_size=None, hooks=None):
+    '''
+        Extract a subset and yield a TableRows for each table with extracted
+        rows. Tables come in the order they can be loaded in: tables with
+        not null foreign keys come after the tables they reference.
+
+        database is a database URL or a Database, which is left connected.
+        config is the path to a config file or its loaded contents. With a
+        batch_size, a table's rows are split over several TableRows of at
+        most batch_size rows. hooks is an abridger.hooks.Hooks, its
+        on_table_emitted is called once the caller has taken all rows of a
+        table.
+
+        All rows are held by the extractor until the extraction is done,
+        since a table can get new rows until then. After that each table's
+        rows are released once the caller asks for the next table.
+    '''
+    with _Abridgement(database, config, hooks=hooks) as abridgement:
+        abridgement.launch()
+        for table in abridgement.generator.table_order:
+            if table not in abridgement.extractor.results:
+                continue
+            epk = table.effective_primary_key
+            rows = []
+            for results_row in sorted(
+                    abridgement.extractor.results[table][epk].values()):
+                for i in range(results_row.count):
+                    rows.append(results_row.row)
+            abridgement.release(table)
+            for batch in _batches(rows, batch_size):
+                yield TableRows(table, batch)
+            abridgement.emitted(table, len(rows))
+            del rows
+
+
+def abridge_statements(database, config, hooks=None):
+    '''
+        Extract a subset and yield the statements that load it into an
+        empty database: an InsertStatement per row, one table at a time,
+        followed by the UpdateStatements that set the foreign keys which
+        couldn't be set when inserting. The database, config and hooks
+        arguments are the same as for abridge.
+    '''
+    with _Abridgement(database, config, hooks=hooks) as abridgement:
+        abridgement.launch()
+        update_statements = []
+        for (table, table_insert_statements, table_update_statements) in \
+                abridgement.generator.iter_table_statements():
+            abridgement.release(table)
+            update_statements.extend(table_update_statements)
+            for insert_statement in table_insert_statements:
+                yield InsertStatement(*insert_statement)
+            abridgement.emitted(table, len(table_insert_statements))
+            del table_insert_statements
+
+        for update_statement in update_statements:
+            yield UpdateStatement(*update_statement)
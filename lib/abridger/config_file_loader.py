@@ -1,5 +1,4 @@
 import os.path
-import yaml
 
 from abridger.exc import IncludeError, DataError, FileNotFoundError
 
@@ -24,6 +23,14 @@ def walk(node, process_include):
     return node
 
 
+def _yaml_load(f):
+    # yaml is only imported when a config is read, and parsed with the C
+    # accelerated loader if it's available
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(f, Loader=loader)
+
+
 def _load(filename, include_paths):
     full_filename = None
     found_file = False
@@ -37,7 +44,8 @@ def _load(filename, include_paths):
         raise IncludeError('Unable to locate "%s" in include paths %s' %
                            (filename, ','.join(sorted(include_paths))))
 
-    data = yaml.load(open(full_filename))
+    with open(full_filename) as f:
+        data = _yaml_load(f)
     if not isinstance(data, list):
         raise DataError(
             'The root data in "%s" must be a sequence' % full_filename)
@@ -1,7 +1,6 @@
-import dj_database_url
+from importlib import import_module
+import sys
 
-from .postgresql import PostgresqlDatabase
-from .sqlite import SqliteDatabase
 from abridger.exc import DatabaseUrlError
 
 
@@ -9,16 +8,50 @@ __all__ = [
     'load', 'SqliteDatabase', 'PostgresqlDatabase',
 ]
 
+# The backends are only imported when they're used
+DATABASE_CLASSES = {
+    'SqliteDatabase': 'abridger.database.sqlite',
+    'PostgresqlDatabase': 'abridger.database.postgresql',
+}
+
 DJANGO_ENGINE_TO_DBCONN_MAP = {
-    'django.db.backends.sqlite3': SqliteDatabase,
-    'django.db.backends.postgresql_psycopg2': PostgresqlDatabase,
+    'django.db.backends.sqlite3': 'SqliteDatabase',
+    'django.db.backends.postgresql_psycopg2': 'PostgresqlDatabase',
 }
 
 
-def load(url, verbose=False):
+def get_database_class(name):
+    return getattr(import_module(DATABASE_CLASSES[name]), name)
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in DATABASE_CLASSES:
+            return get_database_class(name)
+        raise AttributeError("module '%s' has no attribute '%s'" % (
+            __name__, name))
+else:
+    from .postgresql import PostgresqlDatabase  # noqa
+    from .sqlite import SqliteDatabase  # noqa
+
+
+# Recordings made with --record are replayed with replay://PATH
+REPLAY_URL_PREFIX = 'replay://'
+
+
+def load(url, verbose=False, read_only=False, consistent=False,
+         schema_cache=None, schema_scope=None):
+    if url.startswith(REPLAY_URL_PREFIX):
+        from .recording import ReplayDatabase
+        return ReplayDatabase(url[len(REPLAY_URL_PREFIX):], verbose=verbose)
+
+    import dj_database_url
     dj_details = dj_database_url.parse(url)
-    database_cls = DJANGO_ENGINE_TO_DBCONN_MAP.get(dj_details['ENGINE'])
-    if database_cls is None:
+    database_cls_name = DJANGO_ENGINE_TO_DBCONN_MAP.get(dj_details['ENGINE'])
+    if database_cls_name is None:
         raise DatabaseUrlError(
             'Unable to determine the database from the URL')
-    return database_cls.create_from_django_database(dj_details, verbose)
+    database_cls = get_database_class(database_cls_name)
+    return database_cls.create_from_django_database(
+        dj_details, verbose, read_only=read_only, consistent=consistent,
+        schema_cache=schema_cache, schema_scope=schema_scope)
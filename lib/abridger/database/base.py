@@ -1,9 +1,41 @@
+from time import time
+
+from abridger.exc import QueryTimeoutError
+
+
 class Database(object):
+    governor = None
+    fetch_cache = None
+    schema_cache = None
+    schema_scope = None
+    metrics = None
+    journal = None
+    recorder = None
+    hooks = None
+    introspection_time = 0
+
     def connect(self, input):  # pragma: no cover
         return
 
     def create_schema(self, schema_cls):
-        self.schema = schema_cls.create_from_conn(self.connection)
+        start_time = time()
+        if self.schema_cache is not None:
+            self.schema = self.schema_cache.load_schema(
+                schema_cls, self.connection, scope=self.schema_scope)
+        else:
+            self.schema = schema_cls.create_from_conn(
+                self.connection, scope=self.schema_scope)
+        self.introspection_time = time() - start_time
+
+    def begin_fast_load(self, unlogged=False):  # pragma: no cover
+        '''Prepare a freshly created database for a bulk load.
+           Returns state which must be passed to end_fast_load().'''
+        raise NotImplementedError
+
+    def end_fast_load(self, state, jobs=1):  # pragma: no cover
+        '''Undo begin_fast_load() and rebuild any dropped indexes using
+           up to jobs connections. Returns the amount of rebuilt indexes.'''
+        raise NotImplementedError
 
     def disconnect(self):
         if self.connection is not None:
@@ -15,11 +47,115 @@ class Database(object):
         cursor.execute(*args, **kwargs)
 
     def execute_and_fetchall(self, *args, **kwargs):
+        if self.journal is None:
+            return self._governed_execute_and_fetchall(*args, **kwargs)
+
+        (stmt, params) = (args[0], args[1] if len(args) > 1 else None)
+        start_time = time()
+        try:
+            rows = self._governed_execute_and_fetchall(*args, **kwargs)
+        except QueryTimeoutError:
+            self.journal.record(self, stmt, params, 0, time() - start_time,
+                                timed_out=True)
+            raise
+        self.journal.record(self, stmt, params, len(rows),
+                            time() - start_time)
+        return rows
+
+    def _governed_execute_and_fetchall(self, *args, **kwargs):
+        if self.governor is None:
+            return self._execute_and_fetchall(*args, **kwargs)
+
+        self.governor.before_query()
+        rows = []
+        timed_out = False
+        try:
+            if self.governor.statement_timeout is None:
+                rows = self._execute_and_fetchall(*args, **kwargs)
+            else:
+                rows = self._execute_and_fetchall_with_timeout(
+                    self.governor.statement_timeout, *args, **kwargs)
+        except QueryTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.governor.after_query(len(rows), timed_out=timed_out)
+        return rows
+
+    def _execute_and_fetchall(self, *args, **kwargs):
         cursor = self.connection.cursor()
         cursor.execute(*args, **kwargs)
         return cursor.fetchall()
 
+    def _execute_and_fetchall_with_timeout(self, timeout, *args,
+                                           **kwargs):  # pragma: no cover
+        '''Like _execute_and_fetchall, raising QueryTimeoutError if the
+           query takes longer than timeout seconds.'''
+        raise NotImplementedError
+
+    def explain_query(self, stmt, params):  # pragma: no cover
+        '''Return the lines of the query plan of a statement.'''
+        raise NotImplementedError
+
+    def cache_fingerprint(self):
+        '''Identify the source data for the fetch cache.'''
+        return self.url()
+
+    def is_compatible_with(self, database):
+        '''Return whether rows of this database can be written to
+           database.'''
+        return isinstance(self, type(database))
+
     def fetch_rows(self, table, cols, values):
+        rows = self._fetch_cached_rows(table, cols, values)
+        if self.recorder is not None:
+            self.recorder.record(table, cols, values, rows)
+        return rows
+
+    def _fetch_cached_rows(self, table, cols, values):
+        if self.fetch_cache is None:
+            return self._fetch_rows(table, cols, values)
+
+        if values is not None and len(values) == 0:
+            return []
+
+        (found, missing) = self.fetch_cache.get(table, cols, values)
+        if values is None:
+            if len(missing) > 0:
+                found[None] = self._fetch_rows(table, None, None)
+                self.fetch_cache.put(table, None, found)
+            return list(found[None])
+
+        uncached_rows = []
+        if len(missing) > 0:
+            fetched_rows = self._fetch_rows(table, cols, missing)
+            rows_by_value = self._group_rows_by_value(table, cols, missing,
+                                                      fetched_rows)
+            if rows_by_value is None:
+                uncached_rows = fetched_rows
+            else:
+                self.fetch_cache.put(table, cols, rows_by_value)
+                found.update(rows_by_value)
+
+        rows = []
+        for value in values:
+            rows.extend(found.pop(value, []))
+        return rows + uncached_rows
+
+    def _group_rows_by_value(self, table, cols, values, rows):
+        col_indexes = [table.cols.index(c) for c in cols]
+        rows_by_value = dict([(v, []) for v in values])
+        for row in rows:
+            value = tuple([row[i] for i in col_indexes])
+            if value not in rows_by_value:
+                # The database matched a value that doesn't compare equal
+                # in python, e.g. due to a type conversion or a collation,
+                # so the rows can't be attributed to values.
+                return None
+            rows_by_value[value].append(row)
+        return rows_by_value
+
+    def _fetch_rows(self, table, cols, values):
         if values is not None and len(values) == 0:
             return []
 
@@ -40,7 +176,70 @@ class Database(object):
                 table, cols, values)
             stmt += ' WHERE ' + where_clause
 
-        return list(self.execute_and_fetchall(stmt, stmt_values))
+        start_time = time()
+        try:
+            rows = list(self.execute_and_fetchall(stmt, stmt_values))
+        except QueryTimeoutError as e:
+            if values is None:
+                raise QueryTimeoutError('Fetching all rows of %s failed: %s' %
+                                        (table.name, e))
+            if len(values) < 2:
+                raise QueryTimeoutError(
+                    'Fetching the rows of %s with %s=%s failed: %s' % (
+                        table.name, ','.join([c.name for c in cols]),
+                        ','.join([repr(v) for v in values[0]]), e))
+        else:
+            elapsed_time = time() - start_time
+            if self.metrics is not None:
+                self.metrics.record_query(table, rows, elapsed_time)
+            if self.hooks is not None:
+                self.hooks.on_query(
+                    table, cols, len(values) if values is not None else None,
+                    elapsed_time, len(rows))
+            return rows
+
+        # Retry a batch that took too long in two halves
+        if self.governor is not None:
+            self.governor.record_split()
+        half = len(values) // 2
+        return self._fetch_rows(table, cols, values[:half]) + \
+            self._fetch_rows(table, cols, values[half:])
+
+    def fetch_max_value(self, table, col):
+        rows = self.execute_and_fetchall(
+            'SELECT max(%s) FROM %s' % (col.name, table.name))
+        return rows[0][0]
+
+    def estimate_row_count(self, table):
+        '''Return the approximate amount of rows in a table, or None if it
+           isn't known.'''
+        rows = self.execute_and_fetchall(
+            'SELECT count(*) FROM %s' % table.name)
+        return rows[0][0]
+
+    def estimate_rows_per_value(self, table, cols):
+        '''Return the average amount of rows with the same non-null values
+           in cols according to the planner statistics, or None if there
+           are none.'''
+        return None
+
+    def transaction_high_water_mark(self):
+        '''Return a mark that fetch_changed_rows() can use to find rows
+           written by transactions that weren't visible when the mark was
+           taken, or None if the database can't do that.'''
+        return None
+
+    def fetch_changed_rows(self, table, col, since):
+        '''Fetch rows that changed since a high water mark. If col is
+           None, since is a transaction_high_water_mark(), otherwise it is
+           the maximum value col had.'''
+        if col is None:  # pragma: no cover
+            raise NotImplementedError
+
+        cols_csv = ', '.join([c.name for c in table.cols])
+        stmt = 'SELECT %s FROM %s WHERE %s >= %s' % (
+            cols_csv, table.name, col.name, self.placeholder_symbol)
+        return list(self.execute_and_fetchall(stmt, [since]))
 
     def make_multi_col_where_clause(self, table, cols, values):
         # Produce something like
@@ -63,7 +262,8 @@ class Database(object):
 
         return ' OR '.join(or_clauses), stmt_values
 
-    def make_insert_statement(self, row, placeholder_symbol=None):
+    def make_insert_statement(self, row, placeholder_symbol=None,
+                              schema_name=None):
         table_cols = {}
         phs = placeholder_symbol or self.placeholder_symbol
 
@@ -77,7 +277,11 @@ class Database(object):
         else:
             (cols_csv, q) = table_cols[table]
 
-        stmt = 'INSERT INTO %s (%s) VALUES(%s)' % (table.name, cols_csv, q)
+        table_name = table.name
+        if schema_name is not None:
+            table_name = '%s.%s' % (schema_name, table_name)
+
+        stmt = 'INSERT INTO %s (%s) VALUES(%s)' % (table_name, cols_csv, q)
         return stmt, values
 
     def insert_rows(self, rows, cursor=None):
@@ -87,7 +291,8 @@ class Database(object):
             (stmt, values) = self.make_insert_statement(row)
             self.execute(stmt, values)
 
-    def make_update_statement(self, row, placeholder_symbol=None):
+    def make_update_statement(self, row, placeholder_symbol=None,
+                              schema_name=None):
         table_cols = {}
         phs = placeholder_symbol or self.placeholder_symbol
 
@@ -110,7 +315,6 @@ class Database(object):
         where = []
         for i, col_name in enumerate(value_col_names):
             value = values[i]
-            assert value is not None
             sets.append("%s=%s" % (col_name, phs))
             placeholder_values.append(value)
 
@@ -120,8 +324,12 @@ class Database(object):
             where.append("%s=%s" % (col_name, phs))
             placeholder_values.append(pk_value)
 
+        table_name = table.name
+        if schema_name is not None:
+            table_name = '%s.%s' % (schema_name, table_name)
+
         stmt = 'UPDATE %s SET %s WHERE %s' % (
-            table.name,
+            table_name,
             ', '.join(sets),
             ' AND '.join(where))
         return stmt, placeholder_values
@@ -132,3 +340,24 @@ class Database(object):
         for row in rows:
             (stmt, values) = self.make_update_statement(row)
             self.execute(stmt, values)
+
+    def make_delete_statement(self, row, placeholder_symbol=None):
+        phs = placeholder_symbol or self.placeholder_symbol
+
+        (table, pk_cols, pk_values) = row
+        assert len(pk_cols) > 0
+
+        where = []
+        for col, pk_value in zip(pk_cols, pk_values):
+            assert pk_value is not None
+            where.append("%s=%s" % (col.name, phs))
+
+        stmt = 'DELETE FROM %s WHERE %s' % (table.name, ' AND '.join(where))
+        return stmt, list(pk_values)
+
+    def delete_rows(self, rows, cursor=None):
+        if cursor is None:
+            cursor = self.connection.cursor()
+        for row in rows:
+            (stmt, values) = self.make_delete_statement(row)
+            self.execute(stmt, values)
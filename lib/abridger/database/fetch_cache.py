@@ -0,0 +1,169 @@
+import pickle
+import sqlite3
+
+
+# Stay well below sqlite's limit on the amount of query parameters
+BATCH_SIZE = 500
+
+
+class FetchCache(object):
+    '''
+        A persistent cache of fetched rows, stored in an sqlite file and
+        shared between runs against the same source. Entries are keyed by
+        the source's fingerprint, the table, the lookup columns and the
+        lookup value, and hold all rows for that value. The table's columns
+        are part of the key, so that rows cached before a column was added,
+        dropped or renamed aren't reused.
+
+        When max_size is set, the least recently used entries are evicted
+        once the rows in the cache take up more than max_size bytes.
+    '''
+
+    def __init__(self, path, source, max_size=None):
+        self.path = path
+        self.source = source
+        self.max_size = max_size
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+
+        self.connection = sqlite3.connect(path)
+        # It's only a cache; a crash can at worst lose some entries
+        self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS fetch_cache (
+                source TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                cols TEXT NOT NULL,
+                value TEXT NOT NULL,
+                rows BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (source, table_name, cols, value))''')
+        self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS fetch_cache_last_used
+                ON fetch_cache (last_used)''')
+
+        (self.size, self.clock) = self.connection.execute(
+            'SELECT coalesce(sum(size), 0), coalesce(max(last_used), 0) '
+            'FROM fetch_cache').fetchone()
+
+    def __str__(self):
+        return 'hits=%d misses=%d evictions=%d size=%dkB' % (
+            self.hit_count,
+            self.miss_count,
+            self.eviction_count,
+            self.size / 1024)
+
+    def __repr__(self):
+        return '<FetchCache %s>' % str(self)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    @staticmethod
+    def _make_key(table, cols, value):
+        table_cols = ','.join([c.name for c in table.cols])
+        if cols is None:
+            return (table.name, ':' + table_cols, '')
+        return (table.name,
+                '%s:%s' % (','.join([c.name for c in cols]), table_cols),
+                repr(value))
+
+    def get(self, table, cols, values):
+        '''Look up values. Returns a dict of the rows of the values that
+           were found and a list of the values that weren't.'''
+        if values is None:
+            values = [None]
+
+        self.clock += 1
+        keys = [self._make_key(table, cols, v) for v in values]
+        key_values = dict([(k[2], v) for (k, v) in zip(keys, values)])
+        (table_name, cols_csv) = keys[0][:2]
+
+        found = {}
+        for i in range(0, len(keys), BATCH_SIZE):
+            batch = [k[2] for k in keys[i:i + BATCH_SIZE]]
+            q = ', '.join(['?'] * len(batch))
+            where = 'source=? AND table_name=? AND cols=? AND value IN ' \
+                '(%s)' % q
+            params = (self.source, table_name, cols_csv) + tuple(batch)
+            for (value, data) in self.connection.execute(
+                    'SELECT value, rows FROM fetch_cache WHERE ' + where,
+                    params):
+                found[key_values[value]] = pickle.loads(bytes(data))
+            self.connection.execute(
+                'UPDATE fetch_cache SET last_used=? WHERE ' + where,
+                (self.clock,) + params)
+
+        missing = [v for v in values if v not in found]
+        self.hit_count += len(found)
+        self.miss_count += len(missing)
+        return (found, missing)
+
+    def put(self, table, cols, rows_by_value):
+        '''Store the rows of each value. Returns False if the rows can't be
+           stored.'''
+        try:
+            entries = [(value, pickle.dumps(rows, 2))
+                       for (value, rows) in rows_by_value.items()]
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+
+        self.clock += 1
+        for (value, data) in entries:
+            key = self._make_key(table, cols, value)
+            old = self.connection.execute(
+                'SELECT size FROM fetch_cache WHERE source=? AND '
+                'table_name=? AND cols=? AND value=?',
+                (self.source,) + key).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.connection.execute(
+                'INSERT OR REPLACE INTO fetch_cache VALUES (?, ?, ?, ?, ?, ?, '
+                '?)',
+                (self.source,) + key + (sqlite3.Binary(data), len(data),
+                                        self.clock))
+            self.size += len(data)
+
+        self._evict()
+        self.connection.commit()
+        return True
+
+    def _evict(self):
+        if self.max_size is None or self.size <= self.max_size:
+            return
+
+        cursor = self.connection.execute(
+            'SELECT rowid, size FROM fetch_cache ORDER BY last_used')
+        evicted_rowids = []
+        for (rowid, size) in cursor:
+            if self.size <= self.max_size:
+                break
+            evicted_rowids.append(rowid)
+            self.size -= size
+        cursor.close()
+
+        for rowid in evicted_rowids:
+            self.connection.execute(
+                'DELETE FROM fetch_cache WHERE rowid=?', (rowid,))
+        self.eviction_count += len(evicted_rowids)
+
+    def invalidate(self, table=None):
+        '''Remove the source's entries, optionally only for one table.
+           Returns the amount of removed entries.'''
+        where = 'source=?'
+        params = (self.source,)
+        if table is not None:
+            where += ' AND table_name=?'
+            params += (table.name,)
+
+        (count, size) = self.connection.execute(
+            'SELECT count(*), coalesce(sum(size), 0) FROM fetch_cache '
+            'WHERE ' + where, params).fetchone()
+        self.connection.execute('DELETE FROM fetch_cache WHERE ' + where,
+                                params)
+        self.connection.commit()
+        self.size -= size
+        return count
@@ -0,0 +1,77 @@
+from threading import BoundedSemaphore, Lock
+from time import sleep, time
+
+
+class Governor(object):
+    '''
+        Limits the load put on a database by limiting the amount of queries
+        per second, the amount of concurrent queries and the amount of
+        fetched rows per second. statement_timeout is the maximum duration
+        of a single query in seconds.
+    '''
+
+    def __init__(self, max_qps=None, max_concurrent_queries=None,
+                 max_rows_per_second=None, statement_timeout=None):
+        self.max_qps = max_qps
+        self.max_concurrent_queries = max_concurrent_queries
+        self.max_rows_per_second = max_rows_per_second
+        self.statement_timeout = statement_timeout
+
+        if max_concurrent_queries is not None:
+            self.semaphore = BoundedSemaphore(max_concurrent_queries)
+        else:
+            self.semaphore = None
+
+        self.lock = Lock()
+        self.next_query_time = 0
+        self.next_rows_time = 0
+        self.query_count = 0
+        self.row_count = 0
+        self.throttled_time = 0
+        self.timeout_count = 0
+        self.split_count = 0
+
+    def __str__(self):
+        return 'queries=%d rows=%d throttled=%0.1fs timeouts=%d splits=%d' % (
+            self.query_count,
+            self.row_count,
+            self.throttled_time,
+            self.timeout_count,
+            self.split_count)
+
+    def __repr__(self):
+        return '<Governor %s>' % str(self)
+
+    def before_query(self):
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+
+        with self.lock:
+            now = time()
+            start_time = max(now, self.next_query_time, self.next_rows_time)
+            if self.max_qps is not None:
+                self.next_query_time = start_time + 1.0 / self.max_qps
+            delay = start_time - now
+            self.throttled_time += delay
+
+        if delay > 0:
+            sleep(delay)
+
+    def record_split(self):
+        with self.lock:
+            self.split_count += 1
+
+    def after_query(self, row_count, timed_out=False):
+        with self.lock:
+            self.query_count += 1
+            self.row_count += row_count
+            if timed_out:
+                self.timeout_count += 1
+
+            # Pay back the rows by delaying the next query
+            if self.max_rows_per_second is not None:
+                self.next_rows_time = max(time(), self.next_rows_time) + \
+                    float(row_count) / self.max_rows_per_second
+
+        if self.semaphore is not None:
+            self.semaphore.release()
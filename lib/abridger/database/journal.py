@@ -0,0 +1,71 @@
+import json
+import re
+
+
+# A parenthesized group repeated in a list or a chain of ORs, e.g. the
+# value tuples of a multi column lookup
+REPEATED_GROUP_RE = re.compile(r'(\([^()]*\))(, | OR )(?:\1\2)*\1')
+
+# A list of placeholders, e.g. the values of an IN clause
+PLACEHOLDER_LIST_RE = re.compile(r'(\?|%s)(, (\?|%s))+')
+
+
+class QueryJournal(object):
+    '''
+        Writes a JSON line for every query with its statement shape, the
+        amount of parameters and rows, and its latency in seconds. The shape
+        is the statement with value lists collapsed, so that lookups of
+        different amounts of values have the same shape.
+
+        Queries that take at least slow_threshold seconds also get the
+        database's query plan, once per shape.
+    '''
+
+    def __init__(self, path, slow_threshold=None):
+        self.path = path
+        self.slow_threshold = slow_threshold
+        self.query_count = 0
+        self.slow_query_count = 0
+        self.explained_shapes = set()
+        self.file = open(path, 'w')
+
+    def __str__(self):
+        return 'queries=%d slow=%d explained=%d' % (
+            self.query_count,
+            self.slow_query_count,
+            len(self.explained_shapes))
+
+    def __repr__(self):
+        return '<QueryJournal %s>' % str(self)
+
+    @staticmethod
+    def statement_shape(stmt):
+        shape = ' '.join(stmt.split())
+        shape = REPEATED_GROUP_RE.sub(r'\1\2...', shape)
+        shape = PLACEHOLDER_LIST_RE.sub(r'\1, ...', shape)
+        return shape
+
+    def record(self, database, stmt, params, row_count, elapsed_time,
+               timed_out=False):
+        shape = self.statement_shape(stmt)
+        entry = {
+            'shape': shape,
+            'params': len(params) if params is not None else 0,
+            'rows': row_count,
+            'latency': elapsed_time,
+        }
+        self.query_count += 1
+
+        if timed_out:
+            entry['timed_out'] = True
+        elif self.slow_threshold is not None and \
+                elapsed_time >= self.slow_threshold:
+            self.slow_query_count += 1
+            if shape not in self.explained_shapes:
+                self.explained_shapes.add(shape)
+                entry['explain'] = database.explain_query(stmt, params)
+
+        self.file.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def close(self):
+        self.file.close()
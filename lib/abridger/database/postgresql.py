@@ -1,12 +1,15 @@
 from importlib import import_module
+from threading import Thread
 
 from .base import Database
+from abridger.exc import QueryTimeoutError
 from abridger.schema import PostgresqlSchema
 
 
 class PostgresqlDatabase(Database):
     def __init__(self, host=None, port=None, dbname=None, user=None,
-                 password=None, connect=True, verbose=False):
+                 password=None, connect=True, verbose=False, read_only=False,
+                 consistent=False, schema_cache=None, schema_scope=None):
         if dbname is None:
             raise ValueError('dbname must have a value')
         if user is None:
@@ -21,7 +24,12 @@ class PostgresqlDatabase(Database):
         self.password = password
         self.placeholder_symbol = '%s'
         self.schema_class = PostgresqlSchema
+        self.read_only = read_only
+        self.consistent = consistent
+        self.schema_cache = schema_cache
+        self.schema_scope = schema_scope
         self.connection = None
+        self.snapshot_id = None
 
         if connect:
             if verbose:
@@ -30,19 +38,65 @@ class PostgresqlDatabase(Database):
             self.create_schema(PostgresqlSchema)
 
     @staticmethod
-    def create_from_django_database(dj_details, verbose):
+    def create_from_django_database(dj_details, verbose, read_only=False,
+                                    consistent=False, schema_cache=None,
+                                    schema_scope=None):
         return PostgresqlDatabase(
             host=dj_details['HOST'],
             port=dj_details['PORT'] or 5432,
             dbname=dj_details['NAME'],
             user=dj_details['USER'],
             password=dj_details['PASSWORD'],
-            verbose=verbose)
+            verbose=verbose,
+            read_only=read_only,
+            consistent=consistent,
+            schema_cache=schema_cache,
+            schema_scope=schema_scope)
 
     def connect(self):
         if self.connection is not None:
             return
 
+        self.connection = self._make_connection()
+        self.snapshot_id = None
+        self._set_session(self.connection)
+
+    def _set_session(self, connection):
+        # All queries are done in one repeatable read transaction, so that
+        # everything is read from the same point in time.
+        if self.consistent:
+            connection.set_session(isolation_level='REPEATABLE READ',
+                                   readonly=self.read_only)
+        elif self.read_only:
+            connection.set_session(readonly=True)
+
+    def disconnect(self):
+        super(PostgresqlDatabase, self).disconnect()
+        self.snapshot_id = None
+
+    def export_snapshot(self):
+        '''Export the snapshot of the main connection's transaction, so that
+           other connections can see the same data.'''
+        if self.snapshot_id is None:
+            cur = self.connection.cursor()
+            cur.execute('SELECT pg_export_snapshot()')
+            self.snapshot_id = cur.fetchone()[0]
+            cur.close()
+        return self.snapshot_id
+
+    def connect_worker(self):
+        '''Open an additional connection. If consistent is set, it imports the
+           main connection's snapshot and sees exactly the same data.'''
+        connection = self._make_connection()
+        self._set_session(connection)
+        if self.consistent:
+            snapshot_id = self.export_snapshot()
+            cur = connection.cursor()
+            cur.execute('SET TRANSACTION SNAPSHOT %s', [snapshot_id])
+            cur.close()
+        return connection
+
+    def _make_connection(self):
         psycopg2_package = 'psycopg2'
         try:
             psycopg2 = import_module(psycopg2_package)
@@ -52,13 +106,129 @@ class PostgresqlDatabase(Database):
                 'pip install -U {0}'.format(psycopg2_package)
             )
 
-        self.connection = psycopg2.connect(
+        return psycopg2.connect(
             database=self.dbname,
             user=self.user,
             password=self.password,
             host=self.host,
             port=self.port)
 
+    def _execute_and_fetchall_with_timeout(self, timeout, *args, **kwargs):
+        extensions = import_module('psycopg2.extensions')
+
+        # A cancelled query aborts the transaction, so the query is wrapped
+        # in a savepoint which can be rolled back to. Rolling back undoes the
+        # SET LOCAL, but releasing the savepoint doesn't, so the previous
+        # timeout is put back before that. Otherwise later statements in the
+        # transaction, such as the COPY of a direct transfer, would get the
+        # timeout too.
+        cursor = self.connection.cursor()
+        cursor.execute('SAVEPOINT abridger_query; SHOW statement_timeout')
+        previous_timeout = cursor.fetchone()[0]
+        cursor.execute('SET LOCAL statement_timeout = %d' % (timeout * 1000))
+        try:
+            cursor.execute(*args, **kwargs)
+            rows = cursor.fetchall()
+        except extensions.QueryCanceledError:
+            # Rolling back also undoes the SET LOCAL
+            cursor.execute('ROLLBACK TO SAVEPOINT abridger_query; '
+                           'RELEASE SAVEPOINT abridger_query')
+            raise QueryTimeoutError(
+                'Query took longer than %s seconds' % timeout)
+        cursor.execute("SELECT set_config('statement_timeout', %s, true); "
+                       'RELEASE SAVEPOINT abridger_query',
+                       (previous_timeout,))
+        return rows
+
+    def begin_fast_load(self, unlogged=False):
+        # Secondary indexes are dropped so that they can be built once after
+        # the load. Unique indexes are kept since foreign keys may depend on
+        # them.
+        stmt = '''
+            SELECT nspname, c2.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class c1 ON c1.oid = i.indrelid
+            JOIN pg_class c2 ON c2.oid = i.indexrelid
+            JOIN pg_namespace ON (c2.relnamespace = pg_namespace.oid)
+            LEFT JOIN pg_constraint c ON (i.indexrelid = c.conindid)
+            WHERE c1.relkind = 'r' AND
+                nspname not in ('information_schema', 'pg_catalog') AND
+                NOT i.indisunique AND
+                c.oid IS NULL
+            ORDER BY nspname, c2.relname
+        '''
+
+        cur = self.connection.cursor()
+        cur.execute(stmt)
+        indexes = list(cur.fetchall())
+        for (namespace, name, sql) in indexes:
+            cur.execute('DROP INDEX "%s"."%s"' % (namespace, name))
+
+        # Disable triggers, including the ones enforcing foreign keys
+        cur.execute('SET session_replication_role = replica')
+
+        # Logged tables can't reference unlogged tables and vice versa, so
+        # only tables without any foreign keys can be made unlogged.
+        unlogged_tables = []
+        if unlogged:
+            for table in self.schema.tables:
+                if table.foreign_keys or table.incoming_foreign_keys:
+                    continue
+                cur.execute('ALTER TABLE "%s" SET UNLOGGED' % table.name)
+                unlogged_tables.append(table)
+
+        cur.close()
+        return (indexes, unlogged_tables)
+
+    def end_fast_load(self, state, jobs=1):
+        (indexes, unlogged_tables) = state
+
+        cur = self.connection.cursor()
+        cur.execute('RESET session_replication_role')
+        for table in unlogged_tables:
+            cur.execute('ALTER TABLE "%s" SET LOGGED' % table.name)
+        self.connection.commit()
+
+        # Index definitions that still exist are left alone, e.g. after
+        # a rollback.
+        missing_indexes = []
+        for (namespace, name, sql) in indexes:
+            cur.execute('SELECT to_regclass(%s)',
+                        ['"%s"."%s"' % (namespace, name)])
+            if cur.fetchone()[0] is None:
+                missing_indexes.append(sql)
+        cur.close()
+
+        # Build the indexes in parallel, each job using its own connection
+        errors = []
+
+        def build(stmts):
+            try:
+                conn = self._make_connection()
+                try:
+                    cur = conn.cursor()
+                    for stmt in stmts:
+                        cur.execute(stmt)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                errors.append(e)
+
+        jobs = max(1, min(jobs, len(missing_indexes)))
+        threads = []
+        for i in range(jobs):
+            thread = Thread(target=build, args=(missing_indexes[i::jobs],))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return len(missing_indexes)
+
     def url(self, include_password=True):
         if include_password:
             if self.password:
@@ -75,6 +245,21 @@ class PostgresqlDatabase(Database):
             ':%s' % self.port if self.port is not None else '',
             self.dbname)
 
+    def explain_query(self, stmt, params):
+        rows = self._execute_and_fetchall('EXPLAIN ' + stmt, params)
+        return [row[0] for row in rows]
+
+    def cache_fingerprint(self):
+        # The statistics count the rows written to each table. They are
+        # updated shortly after a transaction commits, so writes made right
+        # before a run can go unnoticed.
+        rows = self._execute_and_fetchall('''
+            SELECT coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+            FROM pg_stat_user_tables
+            WHERE schemaname NOT LIKE 'pg_temp%%'
+        ''', ())
+        return '%s:%d' % (self.url(include_password=False), rows[0][0])
+
     def make_multi_col_where_clause(self, table, cols, values):
         # Produce something like
         # (col1, col2) IN ((1, 'foo'), (2, 'bar'))
@@ -96,6 +281,58 @@ class PostgresqlDatabase(Database):
         where_clause += ')'
         return where_clause, stmt_values
 
+    def estimate_row_count(self, table):
+        # Use the planner's estimate, which is negative or zero if the
+        # table has never been vacuumed or analyzed.
+        rows = self.execute_and_fetchall(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [table.name])
+        if rows[0][0] <= 0:
+            return None
+        return int(rows[0][0])
+
+    def estimate_rows_per_value(self, table, cols):
+        if len(cols) != 1:
+            return None
+
+        rows = self.execute_and_fetchall('''
+            SELECT null_frac, n_distinct FROM pg_stats
+            WHERE tablename = %s AND attname = %s
+        ''', [table.name, cols[0].name])
+        if len(rows) == 0:
+            return None
+
+        # A negative n_distinct is minus the fraction of rows that are
+        # distinct, which is used for columns that grow with the table.
+        (null_frac, n_distinct) = rows[0]
+        if n_distinct < 0:
+            return (1 - null_frac) / -n_distinct
+        row_count = self.estimate_row_count(table)
+        if n_distinct == 0 or row_count is None:
+            return None
+        return row_count * (1 - null_frac) / n_distinct
+
+    def transaction_high_water_mark(self):
+        # Everything written by transactions older than the snapshot's
+        # xmin is visible to it. Later transactions may or may not be, so
+        # rows they wrote are treated as changed. xmin is a 32 bit xid.
+        rows = self.execute_and_fetchall(
+            'SELECT txid_snapshot_xmin(txid_current_snapshot()) '
+            '% 4294967296')
+        return rows[0][0]
+
+    def fetch_changed_rows(self, table, col, since):
+        if col is not None:
+            return super(PostgresqlDatabase, self).fetch_changed_rows(
+                table, col, since)
+
+        # Rows written after the mark have a younger xmin. Frozen rows
+        # have the maximum age and are never included.
+        cols_csv = ', '.join([c.name for c in table.cols])
+        stmt = 'SELECT %s FROM %s WHERE age(xmin) <= age(%%s::text::xid)' % (
+            cols_csv, table.name)
+        return list(self.execute_and_fetchall(stmt, [since]))
+
     def make_begin_stmts(self):
         return [b'BEGIN;', b'\\set ON_ERROR_STOP']
 
@@ -109,3 +346,7 @@ class PostgresqlDatabase(Database):
     def make_update_stmt(self, cursor, row):
         (stmt, values) = list(self.make_update_statement(row))
         return cursor.mogrify(stmt, values) + b';'
+
+    def make_delete_stmt(self, cursor, row):
+        (stmt, values) = list(self.make_delete_statement(row))
+        return cursor.mogrify(stmt, values) + b';'
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from time import time
+import gzip
+import os
+import pickle
+
+from .base import Database
+from abridger.exc import ReplayError
+import abridger.schema
+
+
+# Bump when the format of the recording changes
+FORMAT_VERSION = 1
+
+
+class Recorder(object):
+    '''
+        Records the rows returned by each fetch_rows() call of a database
+        to a gzipped stream of pickles, together with the schema, so that
+        ReplayDatabase can serve them without the database.
+    '''
+
+    def __init__(self, path, database):
+        self.path = path
+        self.call_count = 0
+        self.row_count = 0
+        self.file = gzip.open(path, 'wb')
+        pickle.dump({
+            'version': FORMAT_VERSION,
+            'database_class': type(database).__name__,
+            'schema_class': type(database.schema).__name__,
+            'schema': database.schema.dump(),
+        }, self.file, 2)
+
+    def __str__(self):
+        return 'calls=%d rows=%d' % (self.call_count, self.row_count)
+
+    def __repr__(self):
+        return '<Recorder %s>' % str(self)
+
+    def record(self, table, cols, values, rows):
+        col_names = None
+        if cols is not None:
+            col_names = tuple([c.name for c in cols])
+        try:
+            pickle.dump((table.name, col_names, values, rows), self.file, 2)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            raise ReplayError('Unable to record rows of %s: %s' % (
+                table.name, e))
+        self.call_count += 1
+        self.row_count += len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayDatabase(Database):
+    '''
+        Serves the rows recorded by a Recorder instead of querying a
+        database, so that the extractor and generator can be benchmarked
+        and profiled without any database latency. Rows are looked up by
+        value, so the lookups don't have to be batched the way they were
+        when recording. Anything other than fetching rows can't be
+        replayed.
+    '''
+
+    def __init__(self, path, verbose=False):
+        self.path = path
+        self.connection = None
+        self.placeholder_symbol = '?'
+        self.call_count = 0
+
+        # (table name, column names) -> {value: rows}. Rows of lookups
+        # that can't be attributed to values, e.g. because the database
+        # converted the values, are kept by the whole set of values.
+        self.rows_by_value = defaultdict(dict)
+        self.rows_by_values = {}
+
+        if verbose:
+            print('Replaying %s' % path)
+        start_time = time()
+        self._load()
+        self.introspection_time = time() - start_time
+
+    def url(self):
+        return 'replay://%s' % self.path
+
+    def _load(self):
+        with gzip.open(self.path, 'rb') as f:
+            try:
+                header = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError) as e:
+                raise ReplayError('Unable to read %s: %s' % (self.path, e))
+            if not isinstance(header, dict) or \
+                    header.get('version') != FORMAT_VERSION:
+                raise ReplayError('%s is not a recording or was made by an '
+                                  'incompatible version' % self.path)
+
+            self.database_class_name = header['database_class']
+            schema_cls = getattr(abridger.schema, header['schema_class'])
+            self.schema = schema_cls.restore(header['schema'])
+
+            while True:
+                try:
+                    (table_name, col_names, values, rows) = pickle.load(f)
+                except EOFError:
+                    break
+                self._add(table_name, col_names, values, rows)
+
+    def _add(self, table_name, col_names, values, rows):
+        key = (table_name, col_names)
+        if values is None:
+            self.rows_by_value[key][None] = rows
+            return
+
+        table = self.schema.tables_by_name[table_name]
+        cols = [table.cols_by_name[name] for name in col_names]
+        rows_by_value = self._group_rows_by_value(table, cols, values, rows)
+        if rows_by_value is None:
+            self.rows_by_values[key + (frozenset(values),)] = rows
+        else:
+            self.rows_by_value[key].update(rows_by_value)
+
+    def is_compatible_with(self, database):
+        return type(database).__name__ == self.database_class_name
+
+    def cache_fingerprint(self):
+        stat = os.stat(self.path)
+        return '%s:%d:%d' % (self.url(), stat.st_size, stat.st_mtime)
+
+    def _execute_and_fetchall(self, *args, **kwargs):
+        raise ReplayError('Only fetched rows can be replayed')
+
+    def estimate_row_count(self, table):
+        return None
+
+    def _fetch_rows(self, table, cols, values):
+        if values is not None and len(values) == 0:
+            return []
+
+        self.call_count += 1
+        col_names = None
+        if cols is not None:
+            col_names = tuple([c.name for c in cols])
+        key = (table.name, col_names)
+
+        rows_by_value = self.rows_by_value.get(key, {})
+        rows = []
+        for value in values or [None]:
+            value_rows = rows_by_value.get(value)
+            if value_rows is None:
+                break
+            rows.extend(value_rows)
+        else:
+            return rows
+
+        if values is not None:
+            rows = self.rows_by_values.get(key + (frozenset(values),))
+            if rows is not None:
+                return list(rows)
+
+        if cols is None:
+            raise ReplayError('No rows of %s were recorded' % table.name)
+        raise ReplayError('No rows of %s with %s in %s were recorded' % (
+            table.name, ', '.join(col_names), values))
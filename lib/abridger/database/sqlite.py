@@ -1,24 +1,37 @@
+from time import time
+import os
 import re
 import six
 import sqlite3
 
 from .base import Database
+from abridger.exc import QueryTimeoutError
 from abridger.schema import SqliteSchema
 
 
 class SqliteDatabase(Database):
-    def __init__(self, path=None, verbose=False):
+    def __init__(self, path=None, verbose=False, read_only=False,
+                 schema_cache=None, schema_scope=None):
         self.path = path
         self.placeholder_symbol = '?'
+        self.read_only = read_only
+        self.schema_cache = schema_cache
+        self.schema_scope = schema_scope
         self.connection = None
+        self.stat1 = None
         if verbose:
             print('Connecting to %s' % self.url())
         self.connect()
         self.create_schema(SqliteSchema)
 
     @staticmethod
-    def create_from_django_database(dj_details, verbose):
-        return SqliteDatabase(path=dj_details['NAME'], verbose=verbose)
+    def create_from_django_database(dj_details, verbose, read_only=False,
+                                    consistent=False, schema_cache=None,
+                                    schema_scope=None):
+        # A single sqlite connection is always consistent enough
+        return SqliteDatabase(path=dj_details['NAME'], verbose=verbose,
+                              read_only=read_only, schema_cache=schema_cache,
+                              schema_scope=schema_scope)
 
     def connect(self):
         if self.connection is not None:
@@ -26,10 +39,132 @@ class SqliteDatabase(Database):
 
         self.connection = sqlite3.connect(self.path)
         self.connection.execute('pragma foreign_keys=ON')
+        if self.read_only:
+            self.connection.execute('pragma query_only=ON')
 
     def url(self):
         return 'sqlite:///%s' % (self.path)
 
+    def explain_query(self, stmt, params):
+        rows = self._execute_and_fetchall('EXPLAIN QUERY PLAN ' + stmt,
+                                          params or ())
+        return [row[3] for row in rows]
+
+    def _stat1_rows(self, table):
+        '''Return the (index name, stat) rows of sqlite_stat1 for a table,
+           which ANALYZE fills in.'''
+        if self.stat1 is None:
+            self.stat1 = {}
+            rows = self.execute_and_fetchall('''
+                SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'
+            ''')
+            if len(rows) > 0:
+                for (tbl, idx, stat) in self.execute_and_fetchall(
+                        'SELECT tbl, idx, stat FROM sqlite_stat1'):
+                    self.stat1.setdefault(tbl, []).append((idx, stat))
+        return self.stat1.get(table.name, [])
+
+    def estimate_row_count(self, table):
+        # The first number of a stat is the amount of rows in the table
+        for (idx, stat) in self._stat1_rows(table):
+            return int(stat.split()[0])
+        return super(SqliteDatabase, self).estimate_row_count(table)
+
+    def estimate_rows_per_value(self, table, cols):
+        # The stat of an index is the amount of rows followed by the
+        # average amount of rows per distinct value of the first column,
+        # of the first two columns, etc.
+        indexes = dict([(index.name, index) for index in table.indexes])
+        for (idx, stat) in self._stat1_rows(table):
+            index = indexes.get(idx)
+            if index is None or not index.covers(cols):
+                continue
+            numbers = [n for n in stat.split() if n.isdigit()]
+            if len(numbers) > len(cols):
+                return float(numbers[len(cols)])
+        return None
+
+    def cache_fingerprint(self):
+        # Any change to the file invalidates the fetch cache, including
+        # the changes that haven't been checkpointed from the WAL yet
+        fingerprint = self.url()
+        for path in (self.path, self.path + '-wal'):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                fingerprint += ':%d:%r' % (stat.st_size, stat.st_mtime)
+        return fingerprint
+
+    def _execute_and_fetchall_with_timeout(self, timeout, *args, **kwargs):
+        deadline = time() + timeout
+
+        def progress_handler():
+            return time() > deadline
+
+        self.connection.set_progress_handler(progress_handler, 1000)
+        try:
+            return self._execute_and_fetchall(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if str(e) != 'interrupted':
+                raise
+            raise QueryTimeoutError(
+                'Query took longer than %s seconds' % timeout)
+        finally:
+            self.connection.set_progress_handler(None, 1000)
+
+    def begin_fast_load(self, unlogged=False):
+        # unlogged is meaningless for sqlite; turning off the journal
+        # syncing is the closest equivalent.
+        conn = self.connection
+        pragmas = {}
+        for pragma in ('synchronous', 'journal_mode'):
+            pragmas[pragma] = conn.execute('PRAGMA %s' % pragma).fetchone()[0]
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA journal_mode=MEMORY')
+
+        # Drop the non-unique indexes so that they can be built once after
+        # the load. Unique indexes are kept since foreign keys may depend on
+        # them. Automatic indexes have no sql and are skipped too.
+        indexes = []
+        for table in self.schema.tables:
+            rs = conn.execute("PRAGMA index_list('%s')" % table.name)
+            for row in rs.fetchall():
+                (index_name, is_unique) = (row[1], row[2])
+                if is_unique:
+                    continue
+                stmt = '''
+                    SELECT sql FROM sqlite_master
+                    WHERE type = 'index' AND name = ? AND sql IS NOT NULL
+                '''
+                sql = conn.execute(stmt, [index_name]).fetchone()
+                if sql is not None:
+                    indexes.append((index_name, sql[0]))
+
+        for (index_name, sql) in indexes:
+            conn.execute('DROP INDEX "%s"' % index_name)
+
+        return (indexes, pragmas)
+
+    def end_fast_load(self, state, jobs=1):
+        # sqlite only has one writer, so jobs is ignored
+        (indexes, pragmas) = state
+        conn = self.connection
+        conn.commit()
+
+        # Index definitions that still exist are left alone, e.g. after
+        # a rollback.
+        rebuilt_count = 0
+        for (index_name, sql) in indexes:
+            stmt = "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?"
+            if conn.execute(stmt, [index_name]).fetchone() is None:
+                conn.execute(sql)
+                rebuilt_count += 1
+        conn.commit()
+
+        for pragma, value in sorted(pragmas.items()):
+            conn.execute('PRAGMA %s=%s' % (pragma, value))
+
+        return rebuilt_count
+
     def make_begin_stmts(self):
         return [b'BEGIN;']
 
@@ -72,3 +207,7 @@ class SqliteDatabase(Database):
     def make_update_stmt(self, cursor, row):
         (stmt, values) = list(self.make_update_statement(row))
         return self._make_sql(stmt, values) + b';'
+
+    def make_delete_stmt(self, cursor, row):
+        (stmt, values) = list(self.make_delete_statement(row))
+        return self._make_sql(stmt, values) + b';'
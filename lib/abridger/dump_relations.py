@@ -3,17 +3,23 @@ import argparse
 import sys
 
 from abridger.database import load
+from abridger.schema_cache import SchemaCache
 
 
 def main(args):
     parser = argparse.ArgumentParser(
         description='Dump relations from a database')
     parser.add_argument(dest='url', help="database url")
+    parser.add_argument('--schema-cache', dest='schema_cache', metavar='DIR',
+                        help='cache the database schema in DIR')
 
     # Ignore SIG_PIPE and don't throw exceptions on it
     signal(SIGPIPE, SIG_DFL)
 
     args = parser.parse_args(args)
-    database = load(args.url)
+    schema_cache = None
+    if args.schema_cache is not None:
+        schema_cache = SchemaCache(args.schema_cache)
+    database = load(args.url, schema_cache=schema_cache)
     database.schema.dump_relations(sys.stdout)
     database.disconnect()
@@ -22,6 +22,10 @@ class DatabaseUrlError(AbridgerError):
     pass
 
 
+class QueryTimeoutError(AbridgerError):
+    pass
+
+
 class ExtractionModelError(AbridgerError):
     pass
 
@@ -42,6 +46,26 @@ class RelationIntegrityError(ExtractionModelError):
     pass
 
 
+class CheckpointError(AbridgerError):
+    pass
+
+
+class TransferError(AbridgerError):
+    pass
+
+
+class ReplayError(AbridgerError):
+    pass
+
+
+class ProvenanceError(AbridgerError):
+    pass
+
+
+class HooksError(AbridgerError):
+    pass
+
+
 class GeneratorError(Exception):
     pass
 
@@ -1,2 +1,3 @@
 from .model import ExtractionModel  # noqa
 from .relation import Relation, merge_relations  # noqa
+from .scope import SchemaScope  # noqa
@@ -1,4 +1,4 @@
-from jsonschema import Draft4Validator
+from collections import defaultdict
 
 from .not_null_column import NotNullColumn  # noqa
 from .relation import Relation, dedupe_relations, merge_relations  # noqa
@@ -68,6 +68,19 @@ class ExtractionModel(object):
         'type': 'array',
         'items': {'$ref': '#/definitions/not_null_cols'}}
 
+    change_tracking_cols_definition = {
+        'type': 'object',
+        'required': ['table', 'column'],
+        'properties': {
+            'table': {'type': 'string'},
+            'column': {'type': 'string'},
+        },
+        'additionalProperties': False}
+
+    change_tracking_cols_arr = {
+        'type': 'array',
+        'items': {'$ref': '#/definitions/change_tracking_cols'}}
+
     root_definition = {
         'type': 'array',
         'items': {
@@ -76,6 +89,7 @@ class ExtractionModel(object):
                 'subject': subject_definition,
                 'relations': rels_arr,
                 'not-null-columns': not_null_cols_arr,
+                'change-tracking-columns': change_tracking_cols_arr,
             },
             'additionalProperties': False,
         }
@@ -87,6 +101,7 @@ class ExtractionModel(object):
         'table': table_definition,
         'subject': subject_definition,
         'not_null_cols': not_null_cols_definition,
+        'change_tracking_cols': change_tracking_cols_definition,
     }
 
     relation_schema = {'$ref': '#/definitions/relation',
@@ -97,15 +112,27 @@ class ExtractionModel(object):
                       'definitions': definitions}
     root_schema = {'$ref': '#/definitions/root',
                    'definitions': definitions}
-    root_validator = Draft4Validator(root_schema)
+    _root_validator = None
 
     def __init__(self, schema):
         self.schema = schema
         self.relations = []
         self.subjects = []
         self.not_null_cols = []
+        self.change_tracking_cols = {}
+        self.compiled_relations = None
         self._got_relation_defaults = False
 
+    @staticmethod
+    def get_root_validator():
+        '''Return the config validator. jsonschema is slow to import, so
+           the validator is only built when the first config is loaded.'''
+        if ExtractionModel._root_validator is None:
+            from jsonschema import Draft4Validator
+            ExtractionModel._root_validator = Draft4Validator(
+                ExtractionModel.root_schema)
+        return ExtractionModel._root_validator
+
     @staticmethod
     def _get_single_key_dict(data):
         assert isinstance(data, dict)
@@ -120,7 +147,7 @@ class ExtractionModel(object):
     @staticmethod
     def load(schema, data):
         model = ExtractionModel(schema)
-        ExtractionModel.root_validator.validate(data)
+        ExtractionModel.get_root_validator().validate(data)
 
         for top_level_element in data:
             (key, list_data) = ExtractionModel._get_single_key_dict(
@@ -132,10 +159,126 @@ class ExtractionModel(object):
                 model._add_subject(model.relations, list_data)
             elif key == 'not-null-columns':
                 model._add_not_null_cols(list_data)
+            elif key == 'change-tracking-columns':
+                model._add_change_tracking_cols(list_data)
 
         model._finalize_default_relations()
         return model
 
+    def compile(self):
+        '''Merge the global relations with each subject's relations.'''
+        self.compiled_relations = {}
+        for subject in self.subjects:
+            self.compiled_relations[subject] = merge_relations(
+                self.relations + subject.relations)
+
+    def merged_relations(self, subject):
+        if self.compiled_relations is None:
+            self.compile()
+        return self.compiled_relations[subject]
+
+    def lookup_relations(self, subject):
+        '''
+            Return a subject's relations by the table whose rows make them
+            look up rows, as (relation, cols) tuples where cols are the
+            columns the rows are looked up by.
+        '''
+        table_relations = defaultdict(list)
+        for relation in self.merged_relations(subject):
+            fk = relation.foreign_key
+            if relation.type == Relation.TYPE_INCOMING:
+                table_relations[fk.dst_cols[0].table].append(
+                    (relation, fk.src_cols))
+            else:
+                table_relations[fk.src_cols[0].table].append(
+                    (relation, fk.dst_cols))
+        return table_relations
+
+    @staticmethod
+    def _dump_relation(relation):
+        fk_col_names = None
+        if relation.foreign_key is not None:
+            fk_col_names = [c.name for c in relation.foreign_key.src_cols]
+        return (relation.table.name, fk_col_names, relation.name,
+                relation.disabled, relation.propagate_sticky,
+                relation.only_if_sticky, relation.type)
+
+    def _restore_relation(self, data):
+        (table_name, fk_col_names, name, disabled, propagate_sticky,
+         only_if_sticky, type) = data
+        table = self.schema.tables_by_name[table_name]
+        foreign_key = None
+        if fk_col_names is not None:
+            for fk in table.foreign_keys:
+                if [c.name for c in fk.src_cols] == fk_col_names:
+                    foreign_key = fk
+        relation = Relation(table, foreign_key, name, disabled,
+                            propagate_sticky, type)
+        relation.only_if_sticky = only_if_sticky
+        return relation
+
+    def dump(self):
+        '''Return the compiled model as plain data, which restore()
+           accepts.'''
+        if self.compiled_relations is None:
+            self.compile()
+
+        def col_name(col):
+            return col.name if col is not None else None
+
+        subjects = []
+        for subject in self.subjects:
+            subjects.append({
+                'tables': [(t.table.name, col_name(t.col), t.values)
+                           for t in subject.tables],
+                'relations': [self._dump_relation(r)
+                              for r in subject.relations],
+                'compiled_relations': [
+                    self._dump_relation(r)
+                    for r in self.compiled_relations[subject]],
+            })
+
+        return {
+            'relations': [self._dump_relation(r) for r in self.relations],
+            'subjects': subjects,
+            'not_null_cols': [(c.table.name, c.col.name)
+                              for c in self.not_null_cols],
+            'change_tracking_cols': [
+                (t.name, c.name)
+                for (t, c) in sorted(self.change_tracking_cols.items())],
+        }
+
+    @staticmethod
+    def restore(schema, data):
+        model = ExtractionModel(schema)
+        model.relations = [model._restore_relation(r)
+                           for r in data['relations']]
+
+        model.compiled_relations = {}
+        for subject_data in data['subjects']:
+            subject = Subject()
+            for (table_name, col_name, values) in subject_data['tables']:
+                (table, col) = model._check_table_and_column(table_name,
+                                                             col_name)
+                subject.tables.append(Table(table=table, col=col,
+                                            values=values))
+            subject.relations = [model._restore_relation(r)
+                                 for r in subject_data['relations']]
+            model.compiled_relations[subject] = [
+                model._restore_relation(r)
+                for r in subject_data['compiled_relations']]
+            model.subjects.append(subject)
+
+        for (table_name, col_name) in data['not_null_cols']:
+            model._add_not_null_cols([{'table': table_name,
+                                       'column': col_name}])
+        for (table_name, col_name) in data['change_tracking_cols']:
+            (table, col) = model._check_table_and_column(table_name,
+                                                         col_name)
+            model.change_tracking_cols[table] = col
+
+        return model
+
     def _check_table_and_column(self, table_name, column_name):
         '''Ensure the table exists and if not-None, column exists on the
            table'''
@@ -317,3 +460,13 @@ class ExtractionModel(object):
 
             self.not_null_cols.append(NotNullColumn(
                 table, col, found_fk))
+
+    def _add_change_tracking_cols(self, data):
+        for row in data:
+            (table, col) = self._check_table_and_column(row['table'],
+                                                        row['column'])
+            if table in self.change_tracking_cols:
+                raise InvalidConfigError(
+                    'Table %s has more than one change tracking column' %
+                    table.name)
+            self.change_tracking_cols[table] = col
@@ -0,0 +1,104 @@
+from collections import defaultdict
+import hashlib
+
+from .relation import Relation
+
+
+class SchemaScope(object):
+    '''
+        The part of a database schema an extraction config can reach. It
+        starts from every table named in the config and follows outgoing
+        foreign keys, as well as incoming foreign keys from tables that
+        have incoming relations enabled. This is a superset of what the
+        extraction can visit, since it ignores stickiness and disabled
+        relations.
+    '''
+
+    def __init__(self, table_names=None, incoming_table_names=None,
+                 all_incoming=False):
+        self.table_names = set(table_names or [])
+        self.incoming_table_names = set(incoming_table_names or [])
+        self.all_incoming = all_incoming
+
+    def __repr__(self):
+        return '<SchemaScope tables=%s incoming=%s all_incoming=%s>' % (
+            sorted(self.table_names),
+            sorted(self.incoming_table_names),
+            self.all_incoming)
+
+    @staticmethod
+    def from_config(data):
+        # Avoid a circular import
+        from .model import ExtractionModel
+        ExtractionModel.get_root_validator().validate(data)
+
+        scope = SchemaScope()
+        for top_level_element in data:
+            (key, list_data) = ExtractionModel._get_single_key_dict(
+                top_level_element)
+            if key == 'subject':
+                for subject_element in list_data:
+                    (subject_key, subject_data) = \
+                        ExtractionModel._get_single_key_dict(subject_element)
+                    if subject_key == 'tables':
+                        scope._add_tables(subject_data)
+                    elif subject_key == 'relations':
+                        scope._add_relations(subject_data)
+            elif key == 'relations':
+                scope._add_relations(list_data)
+            else:
+                scope._add_tables(list_data)
+        return scope
+
+    def _add_tables(self, data):
+        for table_data in data:
+            self.table_names.add(table_data['table'])
+
+    def _add_relations(self, data):
+        for relation_data in data:
+            defaults = relation_data.get('defaults')
+            if defaults in (Relation.DEFAULT_INCOMING,
+                            Relation.DEFAULT_EVERYTHING):
+                self.all_incoming = True
+
+            table_name = relation_data.get('table')
+            if table_name is None:
+                continue
+            self.table_names.add(table_name)
+            type = relation_data.get('type', Relation.TYPE_INCOMING)
+            if type == Relation.TYPE_INCOMING and \
+                    not relation_data.get('disabled', False):
+                self.incoming_table_names.add(table_name)
+
+    def key(self):
+        '''Return a string that identifies the scope.'''
+        serialized = repr((sorted(self.table_names),
+                           sorted(self.incoming_table_names),
+                           self.all_incoming))
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+    def reachable_tables(self, table_names, edges):
+        '''
+            table_names maps table keys, e.g. names or oids, to names and
+            edges is a list of (src_key, dst_key) foreign keys. Returns the
+            set of reachable table keys.
+        '''
+        outgoing = defaultdict(set)
+        incoming = defaultdict(set)
+        for (src_key, dst_key) in edges:
+            outgoing[src_key].add(dst_key)
+            if self.all_incoming or \
+                    table_names.get(src_key) in self.incoming_table_names:
+                incoming[dst_key].add(src_key)
+
+        todo = [k for (k, name) in table_names.items()
+                if name in self.table_names]
+        reachable = set(todo)
+        while len(todo) > 0:
+            key = todo.pop()
+            for next_key in outgoing[key] | incoming[key]:
+                if next_key not in reachable and next_key in table_names:
+                    reachable.add(next_key)
+                    todo.append(next_key)
+
+        return reachable
@@ -1,30 +1,48 @@
 from __future__ import print_function
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from queue import Queue
 from time import time
 
-from abridger.extraction_model import Relation, merge_relations
+from abridger.extraction_model import Relation
+from .compiled_plan import CompiledPlan, make_key_getter
 from .results_row import ResultsRow
+from .traversal_stats import TraversalStats
 from .work_item import WorkItem
 
 
 class Extractor(object):
     def __init__(self, database, extraction_model, explain=False,
-                 verbosity=0):
+                 verbosity=0, checkpoint=None, progress=None,
+                 memory_report=None, provenance=None, hooks=None):
         self.database = database
         self.extraction_model = extraction_model
         self.explain = explain
         self.verbosity = verbosity
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.memory_report = memory_report
+        self.provenance = provenance
+        self.hooks = hooks
         self.work_queue = Queue()
         self.results = defaultdict(lambda: defaultdict(dict))
         self.fetch_count = 0
         self.fetched_row_count = 0
         self.fetched_row_count_per_table = defaultdict(int)
+        self.new_row_count = 0
         self.max_depth = 0
         self.seen_work_items = set()
+        self.traversal_stats = TraversalStats()
 
         self.subject_table_relations = {}
+        self.compiled_plans = {}
+        for work_item in self.make_subject_work_items():
+            self.work_queue.put(work_item)
         for subject in extraction_model.subjects:
+            self._make_subject_table_relations(subject)
+
+    def make_subject_work_items(self):
+        work_items = []
+        for subject in self.extraction_model.subjects:
             for table in subject.tables:
                 if table.values is not None:
                     if not isinstance(table.values, list):
@@ -34,15 +52,14 @@ class Extractor(object):
                 else:
                     value_tuples = None
                     cols = None
-                self.work_queue.put(WorkItem(
+                work_items.append(WorkItem(
                     subject, table.table, cols, value_tuples, True))
-            self._make_subject_table_relations(subject)
+        return work_items
 
     def _make_subject_table_relations(self, subject):
         table_relations = defaultdict(list)
 
-        relations = merge_relations(self.extraction_model.relations +
-                                    subject.relations)
+        relations = self.extraction_model.merged_relations(subject)
 
         # Add subject and global relations
         for relation in relations:
@@ -50,106 +67,129 @@ class Extractor(object):
             if relation.type == Relation.TYPE_INCOMING:
                 table_relations[fk.dst_cols[0].table].append(
                     (relation.table, fk.dst_cols, fk.src_cols,
-                     relation.propagate_sticky, relation.only_if_sticky))
+                     relation.propagate_sticky, relation.only_if_sticky,
+                     relation))
             else:
                 table_relations[fk.src_cols[0].table].append(
                     (relation.table, fk.src_cols, fk.dst_cols,
-                     relation.propagate_sticky, relation.only_if_sticky))
+                     relation.propagate_sticky, relation.only_if_sticky,
+                     relation))
 
         self.subject_table_relations[subject] = table_relations
 
-    def _lookup_row_value(self, col_indexes, results_row, key_tuple):
-        value = []
-        for col in key_tuple:
-            value.append(results_row.row[col_indexes[col]])
-        return tuple(value)
+    def _compiled_plan(self, subject, table):
+        key = (subject, table)
+        compiled_plan = self.compiled_plans.get(key)
+        if compiled_plan is None:
+            table_relations = self.subject_table_relations[subject]
+            compiled_plan = CompiledPlan(table, table_relations.get(table, []))
+            self.compiled_plans[key] = compiled_plan
+        return compiled_plan
 
     def _process_work_item_relations(self, work_item, results_rows,
-                                     relations, processed_outgoing_fk_cols):
-        table = work_item.table
+                                     compiled_plan):
+        rows = [results_row.row for results_row in results_rows]
 
-        for (relation_table, src_cols, dst_cols, propagate_sticky,
-                only_if_sticky) in relations:
+        for (dst_table, dst_cols, key_getter, propagate_sticky,
+                only_if_sticky, relation) in compiled_plan.relations:
             if only_if_sticky and not work_item.sticky:
                 continue
 
             sticky = work_item.sticky and propagate_sticky
-            processed_outgoing_fk_cols |= set(src_cols)
 
-            dst_table = dst_cols[0].table
-            src_col_indexes = [table.cols.index(c) for c in src_cols]
+            if not self.explain:
+                # Don't process any foreign keys if any of the values is
+                # None.
+                dst_values = [
+                    v for v in OrderedDict.fromkeys(map(key_getter, rows))
+                    if None not in v]
+                if len(dst_values) > 0:
+                    dst_work_item = WorkItem(
+                        work_item.subject, dst_table, dst_cols,
+                        dst_values, sticky, parent_work_item=work_item,
+                        relation=relation)
+                    if self.provenance is not None:
+                        dst_work_item.parent_rows = \
+                            self.provenance.parent_rows(key_getter,
+                                                        results_rows)
+                    self.work_queue.put(dst_work_item)
+                continue
 
             dst_values = []
             seen_dst_values = set()
             for results_row in results_rows:
-                value_tuple = tuple(
-                    [results_row.row[i] for i in src_col_indexes])
-
-                if any(s is None for s in value_tuple):
-                    # Don't process any foreign keys if any of the
-                    # values is None.
+                value_tuple = key_getter(results_row.row)
+                if None in value_tuple:
                     continue
 
                 if value_tuple not in seen_dst_values:
                     dst_values.append(value_tuple)
                 seen_dst_values.add(value_tuple)
 
-                if self.explain:
-                    for dst_value in dst_values:
-                        self.work_queue.put(WorkItem(
-                            work_item.subject, dst_table, dst_cols,
-                            [dst_value], sticky,
-                            parent_work_item=work_item,
-                            parent_results_row=results_row))
-
-            if not self.explain and len(dst_values) > 0:
-                self.work_queue.put(WorkItem(
-                    work_item.subject, dst_table, dst_cols,
-                    dst_values, sticky, parent_work_item=work_item))
+                for dst_value in dst_values:
+                    dst_work_item = WorkItem(
+                        work_item.subject, dst_table, dst_cols,
+                        [dst_value], sticky,
+                        parent_work_item=work_item,
+                        parent_results_row=results_row,
+                        relation=relation)
+                    if self.provenance is not None:
+                        dst_work_item.parent_rows = {dst_value: results_row}
+                    self.work_queue.put(dst_work_item)
 
     def _process_work_item_results_rows(self, work_item, results_rows,
-                                        processed_outgoing_fk_cols):
+                                        compiled_plan):
         table = work_item.table
-        (epk, count_identical_rows) = (table.effective_primary_key,
-                                       table.can_have_duplicated_rows)
+        epk_getter = compiled_plan.epk_getter
+        count_identical_rows = compiled_plan.count_identical_rows
 
-        all_fk_cols = set()
-        for foreign_key in table.foreign_keys:
-            all_fk_cols |= set(foreign_key.src_cols)
+        if self.provenance is not None:
+            parent_rows = self.provenance.find_parents(work_item,
+                                                       results_rows)
 
-        cols_that_need_nulling = all_fk_cols - processed_outgoing_fk_cols
-        if len(cols_that_need_nulling) > 0:
-            indexes = [table.cols.index(c) for c in cols_that_need_nulling]
-            for i, results_row in enumerate(results_rows):
+        null_indexes = compiled_plan.null_indexes[work_item.sticky]
+        if len(null_indexes) > 0:
+            for results_row in results_rows:
                 row_list = list(results_row.row)
-                for j in indexes:
+                for j in null_indexes:
                     row_list[j] = None
-                results_rows[i] = ResultsRow(table, tuple(row_list),
-                                             results_row.subjects)
+                results_row.row = tuple(row_list)
 
+        new_row_count = 0
         end_results_counts = defaultdict(int)
-        table_epk_results = self.results[table][epk]
-        col_indexes = {col: table.cols.index(col) for col in table.cols}
+        table_epk_results = self.results[table][compiled_plan.epk]
 
-        for results_row in results_rows:
+        for (i, results_row) in enumerate(results_rows):
             results_row.subjects.add(work_item.subject)
-            self.fetched_row_count += 1
-            self.fetched_row_count_per_table[table] += 1
-            value = self._lookup_row_value(col_indexes, results_row, epk)
+            results_row.sticky = results_row.sticky or work_item.sticky
+            value = epk_getter(results_row.row)
             if count_identical_rows:
                 end_results_counts[value] += 1
             if value in table_epk_results:
                 found_results_row = table_epk_results[value]
                 if results_row.row != found_results_row.row:
                     results_row.merge(found_results_row)
+                if found_results_row.sticky:
+                    results_row.sticky = True
+            else:
+                new_row_count += 1
+                if self.provenance is not None:
+                    self.provenance.add(work_item, value, parent_rows[i])
 
             table_epk_results[value] = results_row
+            if self.checkpoint is not None:
+                self.checkpoint.add_row(table, value)
+
+        self.fetched_row_count += len(results_rows)
+        self.fetched_row_count_per_table[table] += len(results_rows)
 
         if count_identical_rows:
             for value in end_results_counts:
                 count = end_results_counts[value]
                 table_epk_results[value].count = count
 
+        return new_row_count
+
     def _process_work_item(self, work_item):
         if work_item.depth > self.max_depth:
             self.max_depth = work_item.depth
@@ -159,36 +199,144 @@ class Extractor(object):
 
         if self.verbosity > 1:
             table_count = len(self.fetched_row_count_per_table.keys())
+            governor = self.database.governor
             print(
                 'Processing pass=%-5d queued=%-5d depth=%-3d tables=%-4d '
-                'rows=%-7d table %s' % (
+                'rows=%-7d table %s%s' % (
                     self.fetch_count + 1,
                     self.work_queue.qsize(),
                     self.max_depth,
                     table_count,
                     self.fetched_row_count,
-                    work_item.table.name))
-
-        table = work_item.table
+                    work_item.table.name,
+                    ' (%s)' % governor if governor is not None else ''))
 
+        start_time = time()
         results_rows = work_item.fetch_rows(self.database)
         self.fetch_count += 1
 
-        if len(results_rows) == 0:
-            return
-
-        table_relations = self.subject_table_relations[work_item.subject]
-        processed_outgoing_fk_cols = set()
-
-        self._process_work_item_relations(
-            work_item, results_rows,
-            table_relations.get(table, []), processed_outgoing_fk_cols)
+        new_row_count = 0
+        if len(results_rows) > 0:
+            new_row_count = self._process_fetched_rows(work_item,
+                                                       results_rows)
+        self.new_row_count += new_row_count
+        elapsed_time = time() - start_time
+        self.traversal_stats.record(work_item, len(results_rows),
+                                    new_row_count, elapsed_time)
+        if self.hooks is not None:
+            self.hooks.on_work_item(work_item, len(results_rows),
+                                    new_row_count, elapsed_time)
+        if self.progress is not None:
+            self.progress.update(self.new_row_count,
+                                 queries=self.fetch_count,
+                                 queued=self.work_queue.qsize())
+        if self.memory_report is not None:
+            self.memory_report.work_item_processed(self)
+
+    def _process_fetched_rows(self, work_item, results_rows):
+        compiled_plan = self._compiled_plan(work_item.subject,
+                                            work_item.table)
+        self._process_work_item_relations(work_item, results_rows,
+                                          compiled_plan)
+        new_row_count = self._process_work_item_results_rows(
+            work_item, results_rows, compiled_plan)
+        if self.hooks is not None:
+            self.hooks.on_rows_merged(work_item.table, len(results_rows),
+                                      new_row_count)
+        return new_row_count
+
+    def _work_item_signatures(self, table):
+        '''Return the (subject, cols, sticky) combinations of the work
+           items that relations can make for table.'''
+        signatures = set()
+        for subject in self.extraction_model.subjects:
+            table_relations = self.subject_table_relations[subject]
+            for relations in table_relations.values():
+                for (relation_table, src_cols, dst_cols, propagate_sticky,
+                        only_if_sticky, relation) in relations:
+                    if dst_cols[0].table != table:
+                        continue
+                    signatures.add((subject, tuple(dst_cols), False))
+                    if propagate_sticky:
+                        signatures.add((subject, tuple(dst_cols), True))
+        return signatures
+
+    def reprocess_rows(self, table, rows):
+        '''
+            Process freshly fetched rows of a table again. Previously
+            extracted rows are replaced, and rows that weren't extracted
+            before are added if an already processed work item would fetch
+            them now. Their relations are processed again, which queues any
+            rows they now lead to. Returns the amount of processed rows.
+        '''
+        epk = table.effective_primary_key
+        table_epk_results = self.results[table][epk]
+        col_indexes = dict([(col, i) for (i, col) in enumerate(table.cols)])
+        signatures = self._work_item_signatures(table)
+        key_getters = dict([
+            (cols, make_key_getter([col_indexes[c] for c in cols]))
+            for cols in set([tuple(epk)] + [s[1] for s in signatures])])
+
+        grouped_rows = defaultdict(list)
+        processed_values = set()
+        for row in rows:
+            value = key_getters[tuple(epk)](row)
+            old_results_row = table_epk_results.pop(value, None)
+            if old_results_row is not None:
+                processed_values.add(value)
+                for subject in old_results_row.subjects:
+                    grouped_rows[(subject, tuple(epk),
+                                  old_results_row.sticky)].append(
+                        (value, row))
+                continue
 
-        self._process_work_item_results_rows(work_item, results_rows,
-                                             processed_outgoing_fk_cols)
+            for (subject, cols, sticky) in signatures:
+                cols_value = key_getters[cols](row)
+                work_item = WorkItem(subject, table, cols, [cols_value],
+                                     sticky)
+                if work_item.value_hash(cols_value) in self.seen_work_items:
+                    processed_values.add(value)
+                    grouped_rows[(subject, cols, sticky)].append(
+                        (cols_value, row))
+
+        # Process in a deterministic order
+        subject_indexes = dict(
+            [(s, i) for i, s in enumerate(self.extraction_model.subjects)])
+        for (subject, cols, sticky) in sorted(
+                grouped_rows, key=lambda k: (subject_indexes[k[0]],
+                                             [c.name for c in k[1]], k[2])):
+            value_rows = grouped_rows[(subject, cols, sticky)]
+            work_item = WorkItem(subject, table, cols,
+                                 [v for (v, r) in value_rows], sticky)
+            self._process_fetched_rows(
+                work_item, [ResultsRow(table, r) for (v, r) in value_rows])
+
+        return len(processed_values)
+
+    def stats(self):
+        return {
+            'fetch_count': self.fetch_count,
+            'fetched_row_count': self.fetched_row_count,
+            'fetched_row_count_per_table': dict(
+                [(t.name, c) for t, c in
+                 self.fetched_row_count_per_table.items()]),
+            'max_depth': self.max_depth,
+        }
+
+    def restore_stats(self, stats):
+        tables_by_name = self.extraction_model.schema.tables_by_name
+        self.fetch_count = stats['fetch_count']
+        self.fetched_row_count = stats['fetched_row_count']
+        for table_name, count in \
+                stats['fetched_row_count_per_table'].items():
+            self.fetched_row_count_per_table[tables_by_name[table_name]] = \
+                count
+        self.max_depth = stats['max_depth']
 
     def launch(self):
         start_time = time()
+        if self.hooks is not None:
+            self.hooks.on_phase_start('extraction')
 
         while not self.work_queue.empty():
             work_item = self.work_queue.get()
@@ -198,23 +346,33 @@ class Extractor(object):
                 h = work_item.non_value_hash()
                 if h not in self.seen_work_items:
                     self._process_work_item(work_item)
+                    if self.checkpoint is not None:
+                        self.checkpoint.add_seen(work_item, None)
                 self.seen_work_items.add(h)
             else:
-                new_values = []
-                for value in work_item.values:
-                    h = work_item.value_hash(value)
-                    if h not in self.seen_work_items:
-                        new_values.append(value)
+                hashes = [work_item.value_hash(v) for v in work_item.values]
+                new_values = [
+                    v for (v, h) in zip(work_item.values, hashes)
+                    if h not in self.seen_work_items]
 
                 if len(new_values) > 0:
                     work_item.values = new_values
                     self._process_work_item(work_item)
+                    if self.checkpoint is not None:
+                        for value in new_values:
+                            self.checkpoint.add_seen(work_item, value)
+
+                self.seen_work_items.update(hashes)
+
+            if self.checkpoint is not None:
+                self.checkpoint.maybe_write(self)
 
-                for value in work_item.values:
-                    h = work_item.value_hash(value)
-                    self.seen_work_items.add(h)
+        if self.checkpoint is not None:
+            self.checkpoint.write(self)
 
         elapsed_time = time() - start_time
+        if self.hooks is not None:
+            self.hooks.on_phase_end('extraction', elapsed_time)
 
         if self.verbosity > 0:
             table_count = len(self.fetched_row_count_per_table.keys())
@@ -230,6 +388,8 @@ class Extractor(object):
                     self.fetch_count,
                     self.max_depth,
                     elapsed_time))
+            if self.database.governor is not None:
+                print('Throttling: %s' % self.database.governor)
 
         return self
 
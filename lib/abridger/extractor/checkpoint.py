@@ -0,0 +1,210 @@
+from time import time
+import hashlib
+import json
+import pickle
+
+from abridger.exc import CheckpointError
+from .results_row import ResultsRow
+from .work_item import WorkItem
+
+
+def config_fingerprint(data):
+    '''Return a fingerprint of the extraction config data, used to check
+       that a checkpoint belongs to the same extraction.'''
+    serialized = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def read_records(path):
+    '''Read all complete records from a checkpoint file, ignoring a
+       truncated last record. Returns the records and the length of the
+       file up to the end of the last complete record.'''
+    records = []
+    valid_length = 0
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError, ValueError,
+                    AttributeError, IndexError):
+                break
+            valid_length = f.tell()
+    return (records, valid_length)
+
+
+class CheckpointState(object):
+    '''The extraction state reconstructed from a checkpoint file.'''
+
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.seen = []
+        self.rows = {}
+        self.queue = []
+        self.stats = {}
+        self.high_water_marks = None
+
+    @staticmethod
+    def load(path):
+        (records, valid_length) = read_records(path)
+        if len(records) == 0:
+            raise CheckpointError('No checkpoint found in "%s"' % path)
+
+        state = CheckpointState(records[0]['fingerprint'])
+        for record in records:
+            state.seen.extend(record['seen'])
+            for (table_name, key, row, subject_indexes, count, sticky) in \
+                    record['rows']:
+                state.rows[(table_name, key)] = (row, subject_indexes, count,
+                                                 sticky)
+
+        # The queue and stats are written in full in every record
+        state.queue = records[-1]['queue']
+        state.stats = records[-1]['stats']
+        state.high_water_marks = records[-1]['high_water_marks']
+        return state
+
+
+class Checkpoint(object):
+    '''
+        Periodically appends the extraction state to a file, so that an
+        interrupted extraction can be resumed. Each record only holds what
+        changed since the previous one, except for the work queue.
+
+        A checkpoint is written at most every interval seconds, and unless
+        max_overhead is None, the time spent writing checkpoints is kept
+        below max_overhead of the extraction time.
+    '''
+
+    def __init__(self, path, extraction_model, fingerprint=None, interval=60,
+                 max_overhead=0.02, append=False, high_water_marks=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.high_water_marks = high_water_marks
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.subject_indexes = dict(
+            [(s, i) for i, s in enumerate(extraction_model.subjects)])
+        self.pending_seen = []
+        self.dirty_rows = set()
+        self.last_write_time = time()
+        self.next_write_time = self.last_write_time + interval
+        self.write_count = 0
+        if append:
+            # Drop a partially written record from an interrupted run
+            (records, valid_length) = read_records(path)
+            self.file = open(path, 'ab')
+            self.file.truncate(valid_length)
+        else:
+            self.file = open(path, 'wb')
+
+    def close(self):
+        self.file.close()
+
+    def add_seen(self, work_item, value):
+        self.pending_seen.append(self._dump_work_item(work_item, value))
+
+    def add_row(self, table, key):
+        self.dirty_rows.add((table, key))
+
+    def _dump_work_item(self, work_item, values):
+        subject_index = self.subject_indexes[work_item.subject]
+        if work_item.cols is None:
+            cols = None
+        else:
+            cols = tuple([c.name for c in work_item.cols])
+        return (subject_index, work_item.table.name, cols, values,
+                work_item.sticky, work_item.depth)
+
+    def maybe_write(self, extractor):
+        if time() >= self.next_write_time:
+            self.write(extractor)
+
+    def write(self, extractor):
+        start_time = time()
+
+        rows = []
+        for (table, key) in self.dirty_rows:
+            results_row = extractor.results[table][
+                table.effective_primary_key][key]
+            subject_indexes = [self.subject_indexes[s]
+                               for s in results_row.subjects]
+            rows.append((table.name, key, results_row.row, subject_indexes,
+                         results_row.count, results_row.sticky))
+
+        queue = [self._dump_work_item(w, w.values)
+                 for w in list(extractor.work_queue.queue)]
+
+        record = {
+            'fingerprint': self.fingerprint,
+            'seen': self.pending_seen,
+            'rows': rows,
+            'queue': queue,
+            'stats': extractor.stats(),
+            'high_water_marks': self.high_water_marks,
+        }
+        pickle.dump(record, self.file, pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+
+        self.pending_seen = []
+        self.dirty_rows = set()
+        self.write_count += 1
+
+        end_time = time()
+        elapsed_time = end_time - start_time
+        interval = self.interval
+        if self.max_overhead is not None:
+            interval = max(interval, elapsed_time / self.max_overhead)
+        self.next_write_time = end_time + interval
+
+
+def restore_extractor(extractor, state, fingerprint=None):
+    '''Restore the extractor's work queue, seen work items and results from
+       a checkpoint.'''
+
+    if fingerprint is not None and state.fingerprint != fingerprint:
+        raise CheckpointError(
+            'The checkpoint was made with a different configuration')
+
+    schema = extractor.extraction_model.schema
+    subjects = extractor.extraction_model.subjects
+
+    def load_work_item(dumped_work_item):
+        (subject_index, table_name, col_names, values, sticky,
+         depth) = dumped_work_item
+        table = schema.tables_by_name[table_name]
+        if col_names is None:
+            cols = None
+        else:
+            cols = tuple([table.cols_by_name[c] for c in col_names])
+        work_item = WorkItem(subjects[subject_index], table, cols, values,
+                             sticky)
+        work_item.depth = depth
+        return work_item
+
+    for (subject_index, table_name, col_names, value, sticky, depth) in \
+            state.seen:
+        values = None if value is None else [value]
+        work_item = load_work_item((subject_index, table_name, col_names,
+                                    values, sticky, depth))
+        if work_item.cols is None:
+            extractor.seen_work_items.add(work_item.non_value_hash())
+        else:
+            extractor.seen_work_items.add(work_item.value_hash(value))
+
+    for (table_name, key), (row, subject_indexes, count, sticky) in \
+            state.rows.items():
+        table = schema.tables_by_name[table_name]
+        results_row = ResultsRow(
+            table, row, set([subjects[i] for i in subject_indexes]), sticky)
+        results_row.count = count
+        extractor.results[table][table.effective_primary_key][key] = \
+            results_row
+    # Progress counts the rows extracted so far, including restored ones
+    extractor.new_row_count = len(state.rows)
+
+    with extractor.work_queue.mutex:
+        extractor.work_queue.queue.clear()
+    for dumped_work_item in state.queue:
+        extractor.work_queue.put(load_work_item(dumped_work_item))
+
+    extractor.restore_stats(state.stats)
@@ -0,0 +1,55 @@
+from operator import itemgetter
+
+
+def make_key_getter(indexes):
+    '''Return a function that returns the values at indexes of a row tuple
+       as a tuple.'''
+    if len(indexes) == 1:
+        # itemgetter returns a bare value for a single index, while a
+        # slice of a tuple is a tuple.
+        return itemgetter(slice(indexes[0], indexes[0] + 1))
+    return itemgetter(*indexes)
+
+
+class CompiledPlan(object):
+    '''
+        What the extractor does with the fetched rows of a table for a
+        subject, worked out once: the relations to follow with functions
+        that get their values out of a row, the indexes of the foreign key
+        columns that need nulling and a function that gets the effective
+        primary key out of a row.
+    '''
+
+    def __init__(self, table, relations):
+        self.table = table
+        col_indexes = dict([(col, i) for (i, col) in enumerate(table.cols)])
+
+        def key_getter(cols):
+            return make_key_getter([col_indexes[c] for c in cols])
+
+        self.relations = []
+        for (relation_table, src_cols, dst_cols, propagate_sticky,
+                only_if_sticky, relation) in relations:
+            self.relations.append((
+                dst_cols[0].table, dst_cols, key_getter(src_cols),
+                propagate_sticky, only_if_sticky, relation))
+
+        self.epk = table.effective_primary_key
+        self.epk_getter = key_getter(self.epk)
+        self.count_identical_rows = table.can_have_duplicated_rows
+
+        # Foreign key columns that no relation follows are nulled. Which
+        # relations are followed depends on whether the work item is sticky.
+        all_fk_cols = set()
+        for foreign_key in table.foreign_keys:
+            all_fk_cols |= set(foreign_key.src_cols)
+
+        self.null_indexes = {}
+        for sticky in (False, True):
+            processed_cols = set()
+            for (relation_table, src_cols, dst_cols, propagate_sticky,
+                    only_if_sticky, relation) in relations:
+                if sticky or not only_if_sticky:
+                    processed_cols |= set(src_cols)
+            self.null_indexes[sticky] = tuple(sorted(
+                [col_indexes[c] for c in all_fk_cols - processed_cols]))
@@ -0,0 +1,158 @@
+import gzip
+import pickle
+
+from .compiled_plan import make_key_getter
+from abridger.exc import ProvenanceError
+
+
+# Bump when the format of the provenance file changes
+FORMAT_VERSION = 1
+
+
+def describe_relation(relation):
+    fk = relation.foreign_key
+
+    def cols_csv(cols):
+        return '%s.%s' % (cols[0].table.name, ','.join([c.name for c in cols]))
+
+    return '%s %s -> %s' % (relation.type, cols_csv(fk.src_cols),
+                            cols_csv(fk.dst_cols))
+
+
+class Provenance(object):
+    '''
+        Records why each row was extracted while extracting in batches: for
+        every row, the relation it was fetched by and the effective primary
+        key of the row that led to it. Only the first way a row was found
+        is kept, which is the shortest one since the extraction is breadth
+        first. Rows of subjects have no parent.
+    '''
+
+    def __init__(self):
+        # table -> {key: (relation index, parent table, parent key)}
+        self.rows = {}
+        self.relations = []
+        self.relation_indexes = {}
+        self.key_getters = {}
+
+    def __str__(self):
+        return 'rows=%d' % sum([len(r) for r in self.rows.values()])
+
+    def __repr__(self):
+        return '<Provenance %s>' % str(self)
+
+    def _key_getter(self, table, cols):
+        key = (table, tuple(cols))
+        key_getter = self.key_getters.get(key)
+        if key_getter is None:
+            key_getter = make_key_getter([table.cols.index(c) for c in cols])
+            self.key_getters[key] = key_getter
+        return key_getter
+
+    def parent_rows(self, key_getter, results_rows):
+        '''Return the first results row that has each value.'''
+        parent_rows = {}
+        for results_row in results_rows:
+            parent_rows.setdefault(key_getter(results_row.row), results_row)
+        return parent_rows
+
+    def find_parents(self, work_item, results_rows):
+        '''Return the parent results row of each fetched row. This must be
+           done before the rows' columns are nulled.'''
+        if work_item.parent_rows is None:
+            return [None] * len(results_rows)
+        key_getter = self._key_getter(work_item.table, work_item.cols)
+        return [work_item.parent_rows.get(key_getter(r.row))
+                for r in results_rows]
+
+    def add(self, work_item, key, parent_row):
+        table_rows = self.rows.setdefault(work_item.table, {})
+        if key in table_rows:
+            return
+
+        if work_item.relation is None:
+            table_rows[key] = None
+            return
+
+        relation_index = self.relation_indexes.get(work_item.relation)
+        if relation_index is None:
+            relation_index = len(self.relations)
+            self.relations.append(describe_relation(work_item.relation))
+            self.relation_indexes[work_item.relation] = relation_index
+
+        parent_key = None
+        if parent_row is not None:
+            parent_table = parent_row.table
+            parent_key = self._key_getter(
+                parent_table, parent_table.effective_primary_key)(
+                    parent_row.row)
+        table_rows[key] = (relation_index, work_item.parent_table.name,
+                           parent_key)
+
+    def dump(self):
+        return {
+            'version': FORMAT_VERSION,
+            'relations': self.relations,
+            'keys': dict([(t.name, [c.name for c in t.effective_primary_key])
+                          for t in self.rows]),
+            'rows': dict([(t.name, rows) for (t, rows) in self.rows.items()]),
+        }
+
+    def write(self, path):
+        with gzip.open(path, 'wb') as f:
+            pickle.dump(self.dump(), f, 2)
+
+
+def load_provenance(path):
+    try:
+        with gzip.open(path, 'rb') as f:
+            data = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError) as e:
+        raise ProvenanceError('Unable to read %s: %s' % (path, e))
+    if not isinstance(data, dict) or data.get('version') != FORMAT_VERSION:
+        raise ProvenanceError('%s is not a provenance file or was made by '
+                              'an incompatible version' % path)
+    return data
+
+
+def find_key(data, table_name, values):
+    '''Return the key of the extracted row of a table whose effective
+       primary key values are values, given as strings.'''
+    if table_name not in data['rows']:
+        raise ProvenanceError('No rows of %s were extracted' % table_name)
+    key_cols = data['keys'][table_name]
+    if len(values) != len(key_cols):
+        raise ProvenanceError('The key of %s is %s' % (
+            table_name, ', '.join(key_cols)))
+    for key in data['rows'][table_name]:
+        if [str(v) for v in key] == list(values):
+            return key
+    raise ProvenanceError('No row of %s with %s=%s was extracted' % (
+        table_name, ','.join(key_cols), ','.join(values)))
+
+
+def find_chain(data, table_name, key):
+    '''
+        Return the chain of rows that led to a row, starting with a subject
+        row, as (table name, key, relation) tuples. The relation is the one
+        the row was fetched by, or None for subject rows. If a parent row
+        wasn't recorded, the chain starts with its table and a None key.
+    '''
+    chain = []
+    while True:
+        table_rows = data['rows'].get(table_name, {})
+        if key not in table_rows:
+            chain.append((table_name, None, None))
+            break
+        entry = table_rows[key]
+        if entry is None:
+            chain.append((table_name, key, None))
+            break
+        (relation_index, parent_table_name, parent_key) = entry
+        chain.append((table_name, key, data['relations'][relation_index]))
+        if parent_key is None or \
+                (parent_table_name, parent_key) in [c[:2] for c in chain]:
+            chain.append((parent_table_name, None, None))
+            break
+        (table_name, key) = (parent_table_name, parent_key)
+    return list(reversed(chain))
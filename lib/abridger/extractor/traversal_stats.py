@@ -0,0 +1,148 @@
+from collections import defaultdict
+import json
+
+
+class EdgeStats(object):
+    def __init__(self):
+        self.query_count = 0
+        self.value_count = 0
+        self.row_count = 0
+        self.new_row_count = 0
+        self.time = 0
+
+    def record(self, value_count, row_count, new_row_count, elapsed_time):
+        self.query_count += 1
+        self.value_count += value_count
+        self.row_count += row_count
+        self.new_row_count += new_row_count
+        self.time += elapsed_time
+
+    def report(self, total_row_count):
+        fan_out = None
+        if self.value_count > 0:
+            fan_out = float(self.row_count) / self.value_count
+        row_share = None
+        if total_row_count > 0:
+            row_share = float(self.row_count) / total_row_count
+        return {
+            'queries': self.query_count,
+            'values': self.value_count,
+            'rows': self.row_count,
+            'new_rows': self.new_row_count,
+            'time': self.time,
+            'fan_out': fan_out,
+            'row_share': row_share,
+        }
+
+
+class TraversalStats(object):
+    '''
+        Attributes the queries, fetched rows, new rows and time of an
+        extraction to the relation edges that were followed, and to the
+        depth at which they were followed. An edge is identified by the
+        table the values came from, the table that was queried, the columns
+        it was queried on, the direction of the relation and whether the
+        work item was sticky.
+    '''
+
+    def __init__(self):
+        self.edges = defaultdict(EdgeStats)
+        self.depths = defaultdict(EdgeStats)
+
+    @staticmethod
+    def edge_key(work_item):
+        if work_item.relation is not None:
+            direction = work_item.relation.type
+        elif work_item.depth == 0:
+            direction = 'subject'
+        else:
+            # Work items restored from a checkpoint don't know their
+            # relation.
+            direction = 'unknown'
+
+        if work_item.cols is None:
+            cols = None
+        else:
+            cols = ','.join([c.name for c in work_item.cols])
+
+        parent_table = work_item.parent_table
+        return (parent_table.name if parent_table is not None else None,
+                work_item.table.name, cols, direction, work_item.sticky)
+
+    def record(self, work_item, row_count, new_row_count, elapsed_time):
+        value_count = 1
+        if work_item.values is not None:
+            value_count = len(work_item.values)
+        args = (value_count, row_count, new_row_count, elapsed_time)
+        self.edges[self.edge_key(work_item)].record(*args)
+        self.depths[work_item.depth].record(*args)
+
+    def report(self):
+        total_row_count = sum([e.row_count for e in self.edges.values()])
+        edges = []
+        for key in sorted(self.edges, key=lambda k: (
+                -self.edges[k].row_count, [str(v) for v in k])):
+            (src_table, dst_table, cols, direction, sticky) = key
+            edge = {
+                'src_table': src_table,
+                'dst_table': dst_table,
+                'cols': cols,
+                'direction': direction,
+                'sticky': sticky,
+            }
+            edge.update(self.edges[key].report(total_row_count))
+            edges.append(edge)
+
+        depths = []
+        for depth in sorted(self.depths):
+            stats = self.depths[depth].report(total_row_count)
+            stats['depth'] = depth
+            depths.append(stats)
+
+        return {'edges': edges, 'depths': depths}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def write_dot(self, path):
+        report = self.report()
+
+        table_rows = defaultdict(int)
+        for edge in report['edges']:
+            table_rows[edge['dst_table']] += edge['rows']
+
+        lines = ['digraph G {']
+        lines.append('\t"(subject)" [shape=point];')
+        for table_name in sorted(table_rows):
+            lines.append('\t"%s" [label="%s\\nrows=%d"];' % (
+                table_name, table_name, table_rows[table_name]))
+
+        for edge in report['edges']:
+            label = '%s%s%s\\nqueries=%d rows=%d (%.0f%%) new=%d' % (
+                edge['cols'] or '*',
+                ' %s' % edge['direction'],
+                '*' if edge['sticky'] else '',
+                edge['queries'],
+                edge['rows'],
+                100 * (edge['row_share'] or 0),
+                edge['new_rows'])
+            if edge['fan_out'] is not None:
+                label += '\\nfan-out=%.1f' % edge['fan_out']
+            lines.append('\t"%s" -> "%s" [label="%s", penwidth=%.1f];' % (
+                edge['src_table'] or '(subject)',
+                edge['dst_table'],
+                label,
+                1 + 4 * (edge['row_share'] or 0)))
+        lines.append('}')
+
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def write(self, path):
+        '''Write the stats as DOT if path ends with .dot, else as JSON.'''
+        if path.endswith('.dot'):
+            self.write_dot(path)
+        else:
+            self.write_json(path)
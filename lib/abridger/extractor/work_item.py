@@ -5,7 +5,8 @@ from .results_row import ResultsRow
 
 class WorkItem(object):
     def __init__(self, subject, table, cols, values, sticky,
-                 parent_work_item=None, parent_results_row=None):
+                 parent_work_item=None, parent_results_row=None,
+                 relation=None):
         assert (cols is None) == (values is None)
 
         self.subject = subject
@@ -13,19 +14,24 @@ class WorkItem(object):
         self.cols = cols
         self.values = values
         self.sticky = sticky
+        self.relation = relation
+        # With provenance, the results row each value was found in
+        self.parent_rows = None
         self.depth = 0
+        self.parent_table = None
 
         if parent_work_item is not None:
             self.depth = parent_work_item.depth + 1
+            self.parent_table = parent_work_item.table
 
         self._set_history(parent_work_item, parent_results_row)
 
     def value_hash(self, value):
-        return hash(tuple([self.subject, self.table, self.cols, value,
-                          self.sticky]))
+        return hash((self.subject, self.table, self.cols, value,
+                     self.sticky))
 
     def non_value_hash(self):
-        return hash(tuple([self.subject, self.table, self.sticky]))
+        return hash((self.subject, self.table, self.sticky))
 
     def fetch_rows(self, database):
         fetched_rows = database.fetch_rows(self.table, self.cols, self.values)
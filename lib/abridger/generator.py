@@ -1,14 +1,29 @@
+from contextlib import contextmanager
+from time import time
+
 from abridger.exc import CyclicDependencyError
 
 
 class Generator(object):
-    def __init__(self, schema, extractor):
+    def __init__(self, schema, extractor, generate=True, hooks=None):
         self.schema = schema
         self.extraction_model = extractor.extraction_model
         self.extractor = extractor
+        self.hooks = hooks
         self._make_table_order()
         self._make_deferred_update_rules()
-        self.generate_statements()
+        if generate:
+            with self._phase():
+                self.generate_statements()
+
+    @contextmanager
+    def _phase(self):
+        start_time = time()
+        if self.hooks is not None:
+            self.hooks.on_phase_start('generation')
+        yield
+        if self.hooks is not None:
+            self.hooks.on_phase_end('generation', time() - start_time)
 
     def _not_null_tables_graph(self, tables):
         graph = {}
@@ -84,39 +99,113 @@ class Generator(object):
     def generate_statements(self):
         self.insert_statements = []
         self.update_statements = []
+        self.delete_statements = []
+        for (table, insert_statements, update_statements) in \
+                self.iter_table_statements():
+            self.insert_statements.extend(insert_statements)
+            self.update_statements.extend(update_statements)
+
+    def generate_update_statements(self):
+        '''Generate only the update statements that set the deferred
+           columns, for when the rows are copied by other means.'''
+        with self._phase():
+            self.insert_statements = []
+            self.update_statements = []
+            self.delete_statements = []
+            for table in self.table_order:
+                if table not in self.extractor.results or \
+                        len(self.deferred_update_rules[table]) == 0:
+                    continue
+                col_indexes = {col: i for i, col in enumerate(table.cols)}
+                epk = table.effective_primary_key
+                results_rows = self.extractor.results[table][epk]
+                for results_row in sorted(results_rows.values()):
+                    update_statement = self._update_statement(
+                        table, col_indexes, results_row.row)
+                    if update_statement is not None:
+                        self.update_statements.append(update_statement)
+
+    def table_insert_statements(self, table):
+        '''Return the insert statements of the rows of a table.'''
+        col_indexes = {col: i for i, col in enumerate(table.cols)}
+        epk = table.effective_primary_key
+        insert_statements = []
+        for results_row in sorted(self.extractor.results[table][epk].values()):
+            (insert_statement, update_statement) = self._row_statements(
+                table, col_indexes, results_row)
+            for i in range(results_row.count):
+                insert_statements.append(insert_statement)
+        return insert_statements
+
+    def iter_table_statements(self):
+        '''Yield the insert and update statements of one table at a time,
+           in table order, without keeping them.'''
         for table in self.table_order:
             col_indexes = {col: table.cols.index(col) for col in table.cols}
             if table not in self.extractor.results:
                 continue
 
+            insert_statements = []
+            update_statements = []
             epk = table.effective_primary_key
             results_rows = self.extractor.results[table][epk]
             for results_row in sorted(results_rows.values()):
-                row = results_row.row
-                deferred_update_cols = self.deferred_update_rules[table]
-                deferred_update_cols = tuple(deferred_update_cols)
-
-                row = list(row)
-                final_update_cols = []
-                final_update_values = []
-                for col in deferred_update_cols:
-                    index = col_indexes[col]
-                    value = row[index]
-                    if value is not None:
-                        final_update_cols.append(col)
-                        final_update_values.append(value)
-                        row[index] = None
-
-                pk_values = []
-                for pk_col in epk:
-                    pk_values.append(row[col_indexes[pk_col]])
-
-                if len(final_update_cols) > 0:
-                    self.update_statements.append((table,
-                                                  epk,
-                                                  tuple(pk_values),
-                                                  tuple(final_update_cols),
-                                                  tuple(final_update_values)))
-
+                (insert_statement, update_statement) = self._row_statements(
+                    table, col_indexes, results_row)
+                if update_statement is not None:
+                    update_statements.append(update_statement)
                 for i in range(results_row.count):
-                    self.insert_statements.append((table, tuple(row)))
+                    insert_statements.append(insert_statement)
+            yield (table, insert_statements, update_statements)
+
+    def _generate_insert_statements(self, table, col_indexes, results_row):
+        (insert_statement, update_statement) = self._row_statements(
+            table, col_indexes, results_row)
+        if update_statement is not None:
+            self.update_statements.append(update_statement)
+        for i in range(results_row.count):
+            self.insert_statements.append(insert_statement)
+
+    def _row_statements(self, table, col_indexes, results_row):
+        '''Return the insert statement of a row and the update statement
+           that sets its deferred columns afterwards, or None.'''
+        row = results_row.row
+        update_statement = self._update_statement(table, col_indexes, row)
+        if update_statement is not None:
+            row = list(row)
+            for col in update_statement[3]:
+                row[col_indexes[col]] = None
+            row = tuple(row)
+
+        return ((table, row), update_statement)
+
+    def _update_statement(self, table, col_indexes, row):
+        '''Return the update statement that sets the deferred columns of a
+           row after it has been inserted with them nulled, or None.'''
+        epk = table.effective_primary_key
+        deferred_update_cols = self.deferred_update_rules[table]
+        deferred_update_cols = tuple(deferred_update_cols)
+
+        final_update_cols = []
+        final_update_values = []
+        for col in deferred_update_cols:
+            value = row[col_indexes[col]]
+            if value is not None:
+                final_update_cols.append(col)
+                final_update_values.append(value)
+
+        if len(final_update_cols) == 0:
+            return None
+
+        pk_values = []
+        for pk_col in epk:
+            if pk_col in final_update_cols:
+                pk_values.append(None)
+            else:
+                pk_values.append(row[col_indexes[pk_col]])
+
+        return (table,
+                epk,
+                tuple(pk_values),
+                tuple(final_update_cols),
+                tuple(final_update_values))
@@ -0,0 +1,79 @@
+from importlib import import_module
+
+from abridger.exc import HooksError
+
+
+class Hooks(object):
+    '''
+        Callbacks for instrumenting a run. The methods do nothing, override
+        the ones that are needed. Times are in seconds. An exception raised
+        by a callback aborts the run, and a callback that sleeps slows it
+        down, which can be used for throttling.
+
+        The phases are extraction, generation and output.
+    '''
+
+    def on_phase_start(self, name):
+        pass
+
+    def on_phase_end(self, name, elapsed_time):
+        pass
+
+    def on_query(self, table, cols, n_keys, latency, rows):
+        '''Called after a query on the source database fetched rows rows
+           for n_keys values of cols. cols and n_keys are None if the whole
+           table was fetched.'''
+        pass
+
+    def on_work_item(self, work_item, rows, new_rows, elapsed_time):
+        '''Called after the extractor processed a work item that fetched
+           rows rows, new_rows of which hadn't been extracted before.'''
+        pass
+
+    def on_rows_merged(self, table, rows, new_rows):
+        '''Called after the extractor merged rows fetched rows of table into
+           its results, new_rows of which hadn't been extracted before.'''
+        pass
+
+    def on_table_emitted(self, table, rows):
+        '''Called after rows rows of a table were written out.'''
+        pass
+
+
+class TableEmitter(object):
+    '''Calls on_table_emitted for each run of rows of the same table that
+       is written out.'''
+
+    def __init__(self, hooks):
+        self.hooks = hooks
+        self.table = None
+        self.rows = 0
+
+    def add(self, table, rows=1):
+        if table is not self.table:
+            self.flush()
+            self.table = table
+        self.rows += rows
+
+    def flush(self):
+        if self.table is not None:
+            self.hooks.on_table_emitted(self.table, self.rows)
+        self.table = None
+        self.rows = 0
+
+
+def load_hooks(spec):
+    '''Return the hooks made by calling the callable named by a
+       module:callable spec, e.g. a Hooks subclass.'''
+    (module_name, sep, name) = spec.partition(':')
+    if not sep or not module_name or not name:
+        raise HooksError('Hooks must be given as module:callable, got "%s"' %
+                         spec)
+    try:
+        module = import_module(module_name)
+    except ImportError as e:
+        raise HooksError('Unable to import %s: %s' % (module_name, e))
+    factory = getattr(module, name, None)
+    if factory is None:
+        raise HooksError('%s has no attribute %s' % (module_name, name))
+    return factory()
@@ -0,0 +1,195 @@
+from collections import defaultdict
+
+from abridger.exc import CheckpointError
+from abridger.extractor.checkpoint import restore_extractor
+from abridger.generator import Generator
+
+
+REFETCH_BATCH_SIZE = 500
+
+
+def capture_high_water_marks(database, extraction_model):
+    '''Record how far the source database's changes have got. This must be
+       done before extracting, so that the next incremental run doesn't
+       miss anything written during the extraction.'''
+    tables = {}
+    for table, col in extraction_model.change_tracking_cols.items():
+        tables[table.name] = (col.name, database.fetch_max_value(table, col))
+
+    return {
+        'tables': tables,
+        'transaction': database.transaction_high_water_mark(),
+    }
+
+
+class IncrementalExtraction(object):
+    '''
+        Brings the results of a previous extraction, saved with its high
+        water marks, up to date.
+
+        Rows that changed since the previous extraction are fetched again
+        using the table's change tracking column or, on postgresql, the
+        transaction ids of the rows. Tables without either have all their
+        previous queries repeated, which also finds deleted rows. The
+        changed rows and the subjects are then processed again, after which
+        the extractor fetches whatever they now lead to.
+
+        Deletions are only detected in tables without change tracking, and
+        tables without a primary key or unique index are only updated with
+        new rows.
+    '''
+
+    def __init__(self, extractor, state, fingerprint=None):
+        if state.high_water_marks is None or len(state.queue) > 0:
+            raise CheckpointError(
+                'The state is not from a completed extraction')
+
+        self.extractor = extractor
+        self.state = state
+        restore_extractor(extractor, state, fingerprint=fingerprint)
+
+        self.previous_rows = {}
+        for table, table_results in extractor.results.items():
+            epk = table.effective_primary_key
+            for key, results_row in table_results[epk].items():
+                self.previous_rows[(table, key)] = results_row.row
+
+        self.deleted_rows = []
+        self.processed_row_count = 0
+
+    def _refetch_rows(self, table):
+        '''Repeat the queries the previous extraction did on table and
+           record previously extracted rows that are no longer there.'''
+        extractor = self.extractor
+        database = extractor.database
+
+        values_by_cols = defaultdict(list)
+        fetch_all = False
+        for (subject_index, table_name, col_names, value, sticky, depth) in \
+                self.state.seen:
+            if table_name != table.name:
+                continue
+            if col_names is None:
+                fetch_all = True
+            else:
+                values_by_cols[col_names].append(value)
+
+        rows = []
+        if fetch_all:
+            rows.extend(database.fetch_rows(table, None, None))
+        else:
+            for col_names in sorted(values_by_cols):
+                cols = tuple([table.cols_by_name[c] for c in col_names])
+                values = sorted(set(values_by_cols[col_names]))
+                for i in range(0, len(values), REFETCH_BATCH_SIZE):
+                    rows.extend(database.fetch_rows(
+                        table, cols, values[i:i + REFETCH_BATCH_SIZE]))
+
+        epk = table.effective_primary_key
+        table_epk_results = extractor.results[table][epk]
+        fetched_values = set()
+        for row in rows:
+            fetched_values.add(tuple(
+                [row[i] for i in table.effective_primary_key_col_indexes]))
+        for value in sorted(table_epk_results):
+            if value not in fetched_values:
+                del table_epk_results[value]
+                self.deleted_rows.append((table, value))
+        return rows
+
+    def _fetch_changed_rows(self, table):
+        database = self.extractor.database
+        high_water_marks = self.state.high_water_marks
+
+        (col_name, since) = high_water_marks['tables'].get(table.name,
+                                                           (None, None))
+        if since is not None:
+            return database.fetch_changed_rows(
+                table, table.cols_by_name[col_name], since)
+
+        if high_water_marks['transaction'] is not None:
+            return database.fetch_changed_rows(
+                table, None, high_water_marks['transaction'])
+
+        return self._refetch_rows(table)
+
+    def prepare(self):
+        '''Process the changed rows and queue the subjects again. The
+           extractor must be launched afterwards.'''
+        extractor = self.extractor
+
+        # Tables whose queries found nothing have no results, but can have
+        # gained rows since.
+        schema = extractor.extraction_model.schema
+        tables = set(extractor.results.keys())
+        for seen in self.state.seen:
+            tables.add(schema.tables_by_name[seen[1]])
+
+        for table in sorted(tables):
+            if table.can_have_duplicated_rows:
+                continue
+            rows = self._fetch_changed_rows(table)
+            self.processed_row_count += extractor.reprocess_rows(table, rows)
+
+        # Subjects can have gained rows
+        for work_item in extractor.make_subject_work_items():
+            if work_item.cols is None:
+                extractor.seen_work_items.discard(work_item.non_value_hash())
+            else:
+                for value in work_item.values:
+                    extractor.seen_work_items.discard(
+                        work_item.value_hash(value))
+            extractor.work_queue.put(work_item)
+
+        # The new state has to include everything in the previous one
+        checkpoint = extractor.checkpoint
+        if checkpoint is not None:
+            checkpoint.pending_seen.extend(self.state.seen)
+            for table, table_results in extractor.results.items():
+                for key in table_results[table.effective_primary_key]:
+                    checkpoint.add_row(table, key)
+
+
+class DeltaGenerator(Generator):
+    '''Generates the statements that bring a database loaded from a
+       previous extraction up to date: inserts of new rows, updates of
+       changed rows and deletes of rows that are gone.'''
+
+    def __init__(self, schema, extractor, previous_rows, deleted_rows,
+                 hooks=None):
+        self.previous_rows = previous_rows
+        self.deleted_rows = deleted_rows
+        super(DeltaGenerator, self).__init__(schema, extractor, hooks=hooks)
+
+    def generate_statements(self):
+        self.insert_statements = []
+        self.update_statements = []
+        self.delete_statements = []
+        for table in self.table_order:
+            col_indexes = {col: table.cols.index(col) for col in table.cols}
+            if table not in self.extractor.results:
+                continue
+
+            epk = table.effective_primary_key
+            value_cols = tuple([c for c in table.cols if c not in epk])
+            results_rows = self.extractor.results[table][epk]
+            for key, results_row in sorted(results_rows.items(),
+                                           key=lambda i: i[1]):
+                previous_row = self.previous_rows.get((table, key))
+                if previous_row is None:
+                    self._generate_insert_statements(table, col_indexes,
+                                                     results_row)
+                elif previous_row != results_row.row and len(value_cols) > 0:
+                    values = [results_row.row[col_indexes[c]]
+                              for c in value_cols]
+                    self.update_statements.append(
+                        (table, epk, key, value_cols, tuple(values)))
+
+        # Delete referencing rows before the rows they reference
+        deleted_rows = defaultdict(list)
+        for (table, key) in self.deleted_rows:
+            deleted_rows[table].append(key)
+        for table in reversed(self.table_order):
+            for key in sorted(deleted_rows.get(table, [])):
+                self.delete_statements.append(
+                    (table, table.effective_primary_key, key))
@@ -0,0 +1,113 @@
+from abridger.extraction_model import Relation
+
+
+class Lookup(object):
+    '''
+        A table and the columns the extractor looks up its rows by, with
+        what leads to the lookups: a subject or the relations that are
+        followed to the table.
+    '''
+
+    def __init__(self, table, cols):
+        self.table = table
+        self.cols = cols
+        self.sources = []
+        self.row_count = None
+
+    def __str__(self):
+        return '%s (%s)' % (self.table.name,
+                            ', '.join([c.name for c in self.cols]))
+
+    def __repr__(self):
+        return '<Lookup %s>' % str(self)
+
+    def add_source(self, relation):
+        if relation is None:
+            source = 'subject'
+        elif relation.type == Relation.TYPE_INCOMING:
+            source = 'incoming from %s' % (
+                relation.foreign_key.dst_cols[0].table.name)
+        else:
+            source = 'outgoing from %s' % (
+                relation.foreign_key.src_cols[0].table.name)
+        if source not in self.sources:
+            self.sources.append(source)
+
+    @property
+    def indexed(self):
+        return self.table.has_index_for(self.cols)
+
+    def describe(self):
+        if self.row_count is None:
+            rows = 'unknown rows'
+        else:
+            rows = '~%d rows' % self.row_count
+        return '%s %s: %s' % (self, rows, ', '.join(self.sources))
+
+    def create_index_statement(self):
+        col_names = [c.name for c in self.cols]
+        return 'CREATE INDEX %s_%s_idx ON %s (%s);' % (
+            self.table.name, '_'.join(col_names), self.table.name,
+            ', '.join(col_names))
+
+
+def find_lookups(extraction_model):
+    '''
+        Return the lookups the extractor can do for an extraction model:
+        subject tables by their column and, for the relations that can be
+        reached from the subject tables, the relation's table by the
+        foreign key columns on its side.
+    '''
+    lookups = {}
+    ordered_lookups = []
+
+    def add_lookup(cols, relation):
+        table = cols[0].table
+        key = (table.name, frozenset([c.name for c in cols]))
+        lookup = lookups.get(key)
+        if lookup is None:
+            lookup = lookups[key] = Lookup(table, tuple(cols))
+            ordered_lookups.append(lookup)
+        lookup.add_source(relation)
+
+    for subject in extraction_model.subjects:
+        table_relations = extraction_model.lookup_relations(subject)
+        queue = []
+        for subject_table in subject.tables:
+            if subject_table.values is not None:
+                add_lookup((subject_table.col,), None)
+            queue.append(subject_table.table)
+
+        seen_tables = set(queue)
+        while len(queue) > 0:
+            table = queue.pop(0)
+            for (relation, cols) in table_relations[table]:
+                add_lookup(cols, relation)
+                dst_table = cols[0].table
+                if dst_table not in seen_tables:
+                    seen_tables.add(dst_table)
+                    queue.append(dst_table)
+
+    return ordered_lookups
+
+
+def find_unindexed_lookups(extraction_model, database=None):
+    '''
+        Return the lookups that can't use the primary key or an index of
+        their table, with the largest tables first if a database is passed
+        to estimate row counts with.
+    '''
+    unindexed = [lookup for lookup in find_lookups(extraction_model)
+                 if not lookup.indexed]
+    if database is None:
+        return unindexed
+
+    row_counts = {}
+    for lookup in unindexed:
+        if lookup.table.name not in row_counts:
+            row_counts[lookup.table.name] = \
+                database.estimate_row_count(lookup.table)
+        lookup.row_count = row_counts[lookup.table.name]
+
+    return sorted(unindexed, key=lambda lookup: (
+        lookup.row_count is None, -(lookup.row_count or 0), str(lookup)))
@@ -0,0 +1,170 @@
+from __future__ import print_function
+from collections import deque
+import json
+import os
+import sys
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None  # Python 2
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # Windows
+
+
+def current_rss():
+    '''Return the resident set size of the process in bytes, or None if it
+       can't be determined.'''
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def peak_rss():
+    '''Return the peak resident set size of the process in bytes, or None
+       if it can't be determined.'''
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # pragma: no cover
+        return peak
+    return peak * 1024
+
+
+def deep_size(obj, stop_types=()):
+    '''
+        Return the approximate amount of bytes held by an object and
+        everything it refers to through containers and instance
+        attributes. Objects of stop_types, such as the schema, are neither
+        counted nor followed.
+    '''
+    seen = set()
+    size = 0
+    stack = [obj]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, stop_types):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+            stack.append(obj.__dict__)
+    return size
+
+
+def schema_types():
+    '''Return the types that are shared by all extracted data and aren't
+       counted towards it.'''
+    from abridger.extraction_model import ExtractionModel, Relation
+    from abridger.extraction_model.subject import Subject
+    from abridger.schema.base import (Column, ForeignKeyConstraint, Schema,
+                                      Table)
+    return (Column, ExtractionModel, ForeignKeyConstraint, Relation, Schema,
+            Subject, Table)
+
+
+def extractor_structures(extractor):
+    return [
+        ('results', extractor.results),
+        ('seen_work_items', extractor.seen_work_items),
+        ('work_queue', extractor.work_queue.queue),
+    ]
+
+
+def generator_structures(generator):
+    return [
+        ('insert_statements', generator.insert_statements),
+        ('update_statements', generator.update_statements),
+        ('delete_statements', generator.delete_statements),
+    ]
+
+
+class MemoryReport(object):
+    '''
+        Samples the process's memory at the end of each phase and every
+        interval work items of the extraction: the current and peak RSS,
+        the memory currently allocated by Python and the peak since the
+        previous sample according to tracemalloc, and, at the end of a
+        phase, the approximate size of its main data structures.
+
+        Tracing slows down a run, so it's only done when a report is
+        asked for.
+    '''
+
+    def __init__(self, interval=1000):
+        self.interval = interval
+        self.samples = []
+        self.work_item_count = 0
+        self.stop_types = schema_types()
+        if tracemalloc is not None:
+            tracemalloc.start()
+
+    def sample(self, name, rows=None, structures=()):
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        (traced, traced_peak) = (None, None)
+        if tracing:
+            (traced, traced_peak) = tracemalloc.get_traced_memory()
+        sample = {
+            'name': name,
+            'rows': rows,
+            'rss': current_rss(),
+            'peak_rss': peak_rss(),
+            'traced': traced,
+            'traced_peak': traced_peak,
+            'structures': dict([(s_name, deep_size(obj, self.stop_types))
+                                for (s_name, obj) in structures]),
+        }
+
+        # Measuring the structures allocates memory too, so the peak is
+        # reset after it, if this Python can.
+        if tracing and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.samples.append(sample)
+        return sample
+
+    def work_item_processed(self, extractor):
+        self.work_item_count += 1
+        if self.work_item_count % self.interval == 0:
+            self.sample('extraction:%d' % self.work_item_count,
+                        rows=extractor.new_row_count)
+
+    def stop(self):
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self):
+        return {'samples': self.samples}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def print_summary(self):
+        def mb(value):
+            if value is None:
+                return '%9s' % '-'
+            return '%8.1fM' % (value / 1048576.0)
+
+        print('%-20s %9s %9s %9s %9s %9s' % (
+            'Phase', 'Rows', 'RSS', 'Peak RSS', 'Traced', 'Peak'))
+        for sample in self.samples:
+            rows = '-' if sample['rows'] is None else str(sample['rows'])
+            print('%-20s %9s %s %s %s %s' % (
+                sample['name'], rows, mb(sample['rss']),
+                mb(sample['peak_rss']), mb(sample['traced']),
+                mb(sample['traced_peak'])))
+            for (name, size) in sorted(sample['structures'].items()):
+                print('  %-18s %9s %s' % (name, '', mb(size)))
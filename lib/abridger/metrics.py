@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from time import time
+import json
+import math
+import six
+
+
+def percentile(sorted_values, fraction):
+    '''Return the nearest-rank percentile of a sorted list.'''
+    if len(sorted_values) == 0:
+        return None
+    rank = int(math.ceil(fraction * len(sorted_values)))
+    return sorted_values[max(rank - 1, 0)]
+
+
+def row_size(row):
+    '''Approximate the amount of bytes of a row by the lengths of the text
+       representations of its values.'''
+    size = 0
+    for value in row:
+        if value is None:
+            continue
+        if isinstance(value, (six.binary_type, six.text_type)):
+            size += len(value)
+        else:
+            size += len(str(value))
+    return size
+
+
+class TableStats(object):
+    def __init__(self):
+        self.query_count = 0
+        self.row_count = 0
+        self.byte_count = 0
+        self.latencies = []
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        return {
+            'queries': self.query_count,
+            'rows': self.row_count,
+            'bytes': self.byte_count,
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+
+class Metrics(object):
+    '''
+        Collects the wall time of each phase of a run and, when attached to
+        a database, statistics of the queries done on each table. Times are
+        in seconds.
+    '''
+
+    def __init__(self):
+        self.start_time = time()
+        self.phases = []
+        self.phase_times = {}
+        self.table_stats = {}
+
+    def add_phase_time(self, name, elapsed_time):
+        if name not in self.phase_times:
+            self.phases.append(name)
+            self.phase_times[name] = 0
+        self.phase_times[name] += elapsed_time
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time() - start_time)
+
+    def record_query(self, table, rows, elapsed_time):
+        stats = self.table_stats.get(table.name)
+        if stats is None:
+            stats = self.table_stats[table.name] = TableStats()
+        stats.query_count += 1
+        stats.row_count += len(rows)
+        stats.byte_count += sum([row_size(row) for row in rows])
+        stats.latencies.append(elapsed_time)
+
+    def report(self):
+        tables = dict([(name, stats.report())
+                       for (name, stats) in self.table_stats.items()])
+        totals = {}
+        for key in ('queries', 'rows', 'bytes'):
+            totals[key] = sum([t[key] for t in tables.values()])
+
+        return {
+            'total_time': time() - self.start_time,
+            'phases': [{'name': name, 'time': self.phase_times[name]}
+                       for name in self.phases],
+            'tables': tables,
+            'totals': totals,
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,193 @@
+from __future__ import print_function
+from collections import deque
+
+from abridger.extraction_model import Relation
+
+
+# The default amount of estimated rows above which a table is flagged
+DEFAULT_MAX_ROWS = 100000
+
+
+def expected_distinct(n, k):
+    '''Return the expected amount of distinct items when picking k items
+       at random, with replacement, out of n.'''
+    if n is None:
+        return k
+    if n == 0:
+        return 0
+    n = float(n)
+    return n * (1 - (1 - 1 / n) ** k)
+
+
+class TablePlan(object):
+    def __init__(self, table, row_count):
+        self.table = table
+        self.row_count = row_count
+        self.estimated_rows = 0.0
+        self.query_count = 0
+
+    def __repr__(self):
+        return '<TablePlan %s rows=%.0f queries=%d>' % (
+            self.table.name, self.estimated_rows, self.query_count)
+
+    def add_rows(self, rows):
+        '''Add the distinct rows fetched by a query and return how many of
+           them are expected to be new, assuming the rows are picked at
+           random.'''
+        self.query_count += 1
+        if self.row_count is None:
+            new_rows = rows
+        elif self.row_count == 0:
+            new_rows = 0
+        else:
+            rows = min(rows, self.row_count)
+            new_rows = rows * (1 - self.estimated_rows / self.row_count)
+        self.estimated_rows += new_rows
+        return new_rows
+
+
+class Planner(object):
+    '''
+        Estimates the amount of rows an extraction fetches from each table
+        and the amount of queries it does, without fetching any rows. The
+        relations are followed from the subjects the way the extractor
+        follows them, using the database's planner statistics for the
+        amount of rows per looked up value. Without statistics, rows are
+        assumed to be spread evenly over the rows they refer to.
+
+        Sticky relations are always followed, so the estimates for
+        configs that use them are upper bounds.
+    '''
+
+    # Stop following relations after this many queries
+    MAX_QUERIES = 100000
+
+    def __init__(self, database, extraction_model,
+                 max_rows=DEFAULT_MAX_ROWS):
+        self.database = database
+        self.extraction_model = extraction_model
+        self.max_rows = max_rows
+        self.table_plans = {}
+        self.row_counts = {}
+        self.rows_per_value_cache = {}
+        self.truncated = False
+
+    def row_count(self, table):
+        if table not in self.row_counts:
+            self.row_counts[table] = self.database.estimate_row_count(table)
+        return self.row_counts[table]
+
+    def rows_per_value(self, table, cols):
+        key = (table, tuple(cols))
+        if key not in self.rows_per_value_cache:
+            self.rows_per_value_cache[key] = self._rows_per_value(
+                table, cols)
+        return self.rows_per_value_cache[key]
+
+    def _rows_per_value(self, table, cols):
+        estimate = self.database.estimate_rows_per_value(table, cols)
+        if estimate is not None:
+            return estimate
+
+        col_set = set(cols)
+        if table.primary_key is not None and \
+                set(table.primary_key) <= col_set:
+            return 1.0
+        for unique_index in table.unique_indexes:
+            if unique_index.cols <= col_set:
+                return 1.0
+
+        for fk in table.foreign_keys:
+            if set(fk.src_cols) == col_set:
+                row_count = self.row_count(table)
+                dst_row_count = self.row_count(fk.dst_cols[0].table)
+                if row_count is not None and dst_row_count:
+                    return float(row_count) / dst_row_count
+
+        return 1.0
+
+    def _table_plan(self, table):
+        table_plan = self.table_plans.get(table)
+        if table_plan is None:
+            table_plan = TablePlan(table, self.row_count(table))
+            self.table_plans[table] = table_plan
+        return table_plan
+
+    def plan(self):
+        query_count = 0
+        for subject in self.extraction_model.subjects:
+            table_relations = self.extraction_model.lookup_relations(subject)
+
+            # Work items are (table, rows, foreign key they were fetched by)
+            queue = deque()
+            for subject_table in subject.tables:
+                table = subject_table.table
+                if subject_table.values is None:
+                    rows = self.row_count(table) or 0
+                else:
+                    values = subject_table.values
+                    if not isinstance(values, list):
+                        values = [values]
+                    rows = len(values) * self.rows_per_value(
+                        table, (subject_table.col,))
+                queue.append((table, rows, None))
+
+            while len(queue) > 0:
+                if query_count >= self.MAX_QUERIES:
+                    self.truncated = True
+                    break
+                (table, rows, via_fk) = queue.popleft()
+                new_rows = self._table_plan(table).add_rows(rows)
+                query_count += 1
+                if new_rows < 0.5:
+                    continue
+
+                for (relation, cols) in table_relations[table]:
+                    dst_table = cols[0].table
+                    if relation.foreign_key is via_fk:
+                        # Following the foreign key back only finds the
+                        # rows the work item's rows were fetched by.
+                        values = 0
+                    elif relation.type == Relation.TYPE_OUTGOING:
+                        # Many rows can refer to the same row
+                        values = expected_distinct(
+                            self.row_count(dst_table), new_rows)
+                    else:
+                        values = new_rows
+                    rows = values * self.rows_per_value(dst_table, cols)
+                    queue.append((dst_table, rows, relation.foreign_key))
+
+        return self.table_plans_by_rows()
+
+    def table_plans_by_rows(self):
+        return sorted(self.table_plans.values(),
+                      key=lambda p: (-p.estimated_rows, p.table.name))
+
+    def exceeds_max_rows(self, table_plan):
+        return self.max_rows is not None and \
+            table_plan.estimated_rows > self.max_rows
+
+    def print_plan(self):
+        table_plans = self.table_plans_by_rows()
+        width = max([len(p.table.name) for p in table_plans] + [5])
+        print('%-*s  %12s  %8s  %8s' % (
+            width + 3, 'Table', 'Rows', 'Of table', 'Queries'))
+        for table_plan in table_plans:
+            share = '?'
+            if table_plan.row_count:
+                share = '%.1f%%' % (
+                    100.0 * table_plan.estimated_rows / table_plan.row_count)
+            flag = '!' if self.exceeds_max_rows(table_plan) else ' '
+            print('%-*s %s  %12.0f  %8s  %8d' % (
+                width + 1, table_plan.table.name, flag,
+                table_plan.estimated_rows, share, table_plan.query_count))
+
+        print('Estimated total: %.0f rows in %d queries' % (
+            sum([p.estimated_rows for p in table_plans]),
+            sum([p.query_count for p in table_plans])))
+        if self.truncated:
+            print('Stopped estimating after %d queries' % self.MAX_QUERIES)
+        for table_plan in table_plans:
+            if self.exceeds_max_rows(table_plan):
+                print('Warning: %s is estimated to exceed %d rows' % (
+                    table_plan.table.name, self.max_rows))
@@ -0,0 +1,170 @@
+from threading import Event, Lock, Thread
+from time import time
+import json
+import sys
+
+
+class ProgressReporter(object):
+    '''
+        Reports the progress of the phases of a run, once per interval
+        seconds. update only records the counts; the reports are written
+        by tick, which start calls from a timer thread so that a phase
+        stuck on a slow query keeps being reported. Each report has the
+        phase's elapsed time, the amount of rows and queries with their
+        rates, the queue depth and, if the phase's total amount of rows is
+        known, an ETA. Reports are written as text lines or, for machines,
+        as JSON lines.
+    '''
+
+    def __init__(self, stream=None, interval=1.0, json_lines=False):
+        self.stream = stream if stream is not None else sys.stderr
+        self.interval = interval
+        self.json_lines = json_lines
+        self.start_time = time()
+        self.phase = None
+        self.phase_times = []
+        self.phase_start_time = None
+        self.last_report_time = None
+        self.total_rows = None
+        self.rows = 0
+        self.start_rows = 0
+        self.start_queries = 0
+        self.queries = None
+        self.queued = None
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        '''Start the timer thread that reports the progress.'''
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        delay = self.interval
+        while not self.stopped.wait(delay):
+            delay = self.tick()
+
+    def start_phase(self, name, total_rows=None, start_rows=0,
+                    start_queries=0):
+        '''start_rows and start_queries are what a resumed phase has
+           already done, they don't count towards the rates and the ETA.'''
+        with self.lock:
+            self._start_phase(name, total_rows, start_rows, start_queries)
+
+    def _start_phase(self, name, total_rows, start_rows, start_queries):
+        if self.phase is not None:
+            self._finish_phase()
+        self.phase = name
+        self.phase_start_time = time()
+        self.last_report_time = self.phase_start_time
+        self.total_rows = total_rows
+        self.rows = start_rows
+        self.start_rows = start_rows
+        self.start_queries = start_queries
+        self.queries = None
+        self.queued = None
+
+    def update(self, rows, queries=None, queued=None):
+        with self.lock:
+            self.rows = rows
+            self.queries = queries
+            self.queued = queued
+
+    def tick(self):
+        '''Report the last recorded counts if interval seconds have passed
+           since the last report. Returns the seconds until the next report
+           is due.'''
+        with self.lock:
+            now = time()
+            if self.phase is None:
+                return self.interval
+            if now - self.last_report_time >= self.interval:
+                self.last_report_time = now
+                self.report(now)
+            return self.last_report_time + self.interval - now
+
+    def finish_phase(self):
+        with self.lock:
+            self._finish_phase()
+
+    def _finish_phase(self):
+        if self.queued is not None:
+            self.queued = 0
+        now = time()
+        self.report(now, done=True)
+        self.phase_times.append((self.phase, now - self.phase_start_time))
+        self.phase = None
+
+    def status(self, now, done=False):
+        elapsed = now - self.phase_start_time
+        done_rows = self.rows - self.start_rows
+        status = {
+            'phase': self.phase,
+            'elapsed': elapsed,
+            'total_elapsed': now - self.start_time,
+            'done': done,
+            'phases': [{'name': name, 'time': phase_time}
+                       for (name, phase_time) in self.phase_times],
+            'rows': self.rows,
+            'rows_per_second': done_rows / elapsed if elapsed > 0 else None,
+        }
+        if self.queries is not None:
+            status['queries'] = self.queries
+            status['queries_per_second'] = \
+                (self.queries - self.start_queries) / elapsed \
+                if elapsed > 0 else None
+        if self.queued is not None:
+            status['queued'] = self.queued
+
+        eta = None
+        if done:
+            eta = 0
+        elif self.total_rows is not None and done_rows > 0:
+            # Estimates can be too low, in which case the ETA is unknown
+            remaining_rows = self.total_rows - self.rows
+            if remaining_rows > 0:
+                eta = remaining_rows * elapsed / done_rows
+        status['total_rows'] = self.total_rows
+        status['eta'] = eta
+        return status
+
+    def format(self, status):
+        parts = ['%s %.1fs' % (status['phase'], status['elapsed'])]
+        if 'queued' in status:
+            parts.append('queued=%d' % status['queued'])
+        if status['rows'] > 0 or status['total_rows'] is not None:
+            rows = 'rows=%d' % status['rows']
+            if status['total_rows'] is not None:
+                rows += '/~%d' % status['total_rows']
+            if status['rows_per_second'] is not None:
+                rows += ' (%.0f/s)' % status['rows_per_second']
+            parts.append(rows)
+        if 'queries' in status:
+            queries = 'queries=%d' % status['queries']
+            if status['queries_per_second'] is not None:
+                queries += ' (%.1f/s)' % status['queries_per_second']
+            parts.append(queries)
+        if status['done']:
+            parts.append('done')
+        elif status['eta'] is not None:
+            parts.append('eta %.0fs' % status['eta'])
+        return ' '.join(parts)
+
+    def report(self, now, done=False):
+        status = self.status(now, done=done)
+        if self.json_lines:
+            line = json.dumps(status, sort_keys=True)
+        else:
+            line = self.format(status)
+        self.stream.write(line + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        if self.phase is not None:
+            self.finish_phase()
@@ -57,6 +57,42 @@ class Column(object):
         return '%s.%s' % (self.table.name, self.name)
 
 
+def is_prefix(cols, index_cols):
+    '''Return whether cols, in any order, are the leading columns of
+       index_cols.'''
+    return len(cols) <= len(index_cols) and \
+        set(index_cols[:len(cols)]) == set(cols)
+
+
+class Index(object):
+    '''An index of any kind, with its columns in index order.'''
+
+    def __init__(self, name, cols, unique):
+        self.name = name
+        self.cols = cols
+        self.unique = unique
+
+    @staticmethod
+    def create_and_add_to_table(table, name, cols, unique):
+        index = Index(name, cols, unique)
+        table.indexes.append(index)
+        if unique:
+            UniqueIndex.create_and_add_to_table(table, name, set(cols))
+        return index
+
+    def covers(self, cols):
+        '''Return whether lookups on cols can use the index.'''
+        return is_prefix(cols, self.cols)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return '<Index %s on (%s)%s>' % (
+            self.name, ','.join([c.name for c in self.cols]),
+            ' unique' if self.unique else '')
+
+
 class UniqueIndex(object):
     def __init__(self, name, cols):
         self.name = name
@@ -85,6 +121,7 @@ class Table(object):
         self.foreign_keys = []
         self.incoming_foreign_keys = []
         self.unique_indexes = []
+        self.indexes = []
 
     def __str__(self):
         return self.name
@@ -101,6 +138,14 @@ class Table(object):
         self.cols_by_name[name] = col
         return col
 
+    def has_index_for(self, cols):
+        '''Return whether lookups on cols can use the primary key or an
+           index.'''
+        if self.primary_key is not None and \
+                is_prefix(cols, self.primary_key):
+            return True
+        return any([index.covers(cols) for index in self.indexes])
+
     def _set_effective_primary_key(self):
         if self.primary_key is not None:
             self.effective_primary_key = self.primary_key
@@ -120,6 +165,74 @@ class Schema(object):
     def __init__(self):
         self.tables = []
         self.tables_by_name = {}
+        # Set by the schema cache when the schema is loaded through it
+        self.cache_fingerprint = None
+
+    def _restore_table(self, name):
+        return self._add_table(name)
+
+    def _dump_column(self, col):
+        return (col.name, col.notnull)
+
+    def _restore_column(self, table, data):
+        (name, notnull) = data
+        return table.add_column(name, notnull)
+
+    def dump(self):
+        '''Return the schema as plain data, which restore() accepts.'''
+        def names(cols):
+            return [c.name for c in cols]
+
+        tables = []
+        foreign_keys = []
+        for table in self.tables:
+            primary_key = None
+            if table.primary_key is not None:
+                primary_key = names(table.primary_key)
+            tables.append({
+                'name': table.name,
+                'cols': [self._dump_column(c) for c in table.cols],
+                'primary_key': primary_key,
+                'indexes': [(index.name, names(index.cols), index.unique)
+                            for index in table.indexes],
+            })
+            for fk in table.foreign_keys:
+                foreign_keys.append((fk.name, table.name, names(fk.src_cols),
+                                     fk.dst_cols[0].table.name,
+                                     names(fk.dst_cols)))
+
+        return {'tables': tables, 'foreign_keys': foreign_keys}
+
+    @classmethod
+    def restore(cls, data):
+        schema = cls()
+        for table_data in data['tables']:
+            table = schema._restore_table(table_data['name'])
+            for col_data in table_data['cols']:
+                schema._restore_column(table, col_data)
+
+            if table_data['primary_key'] is None:
+                table.primary_key = None
+            else:
+                table.primary_key = tuple(
+                    [table.cols_by_name[c] for c in table_data['primary_key']])
+
+            for (name, col_names, unique) in table_data['indexes']:
+                Index.create_and_add_to_table(
+                    table, name, tuple([table.cols_by_name[c]
+                                        for c in col_names]), unique)
+
+        for (name, src_table_name, src_col_names, dst_table_name,
+                dst_col_names) in data['foreign_keys']:
+            src_table = schema.tables_by_name[src_table_name]
+            dst_table = schema.tables_by_name[dst_table_name]
+            ForeignKeyConstraint.create_and_add_to_tables(
+                name,
+                tuple([src_table.cols_by_name[c] for c in src_col_names]),
+                tuple([dst_table.cols_by_name[c] for c in dst_col_names]))
+
+        schema._add_alternate_primary_keys()
+        return schema
 
     def _relation_fk_col_or_cols(self, fk):
         if len(fk.src_cols) == 1:
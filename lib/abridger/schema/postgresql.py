@@ -1,6 +1,4 @@
-from collections import defaultdict
-
-from .base import Schema, Table, Column, ForeignKeyConstraint, UniqueIndex
+from .base import Schema, Table, Column, ForeignKeyConstraint, Index
 
 
 class PostgresqlColumn(Column):
@@ -24,18 +22,72 @@ class PostgresqlTable(Table):
 
 class PostgresqlSchema(Schema):
     @classmethod
-    def create_from_conn(cls, conn):
+    def create_from_conn(cls, conn, scope=None):
         schema = cls()
         schema.tables_by_oid = {}
+        schema.pruned = scope is not None
 
-        schema._add_tables_from_conn(conn)
+        schema._add_tables_from_conn(conn, scope)
         schema._add_columns_from_conn(conn)
         schema._add_foreign_key_constraints_from_conn(conn)
         schema._add_primary_key_constraints(conn)
-        schema._add_unique_indexes(conn)
+        schema._add_indexes(conn)
         schema._add_alternate_primary_keys()
         return schema
 
+    @staticmethod
+    def fingerprint(conn):
+        '''Return a hash of the parts of the catalog that make up the
+           schema, which is much quicker than introspecting it.'''
+        stmt = '''
+            SELECT md5(string_agg(item, ',' ORDER BY item)) FROM (
+                SELECT 'c' || pg_class.oid || ':' || relname || ':' ||
+                    relkind AS item
+                FROM pg_class
+                JOIN pg_namespace ON (relnamespace = pg_namespace.oid)
+                WHERE relkind IN ('r', 'i') AND
+                    nspname not in ('information_schema', 'pg_catalog')
+                UNION ALL
+                SELECT 'a' || attrelid || ':' || attname || ':' || attnum ||
+                    ':' || attnotnull || ':' || atttypid || ':' ||
+                    attisdropped
+                FROM pg_attribute
+                JOIN pg_class ON (attrelid = pg_class.oid)
+                JOIN pg_namespace ON (relnamespace = pg_namespace.oid)
+                WHERE relkind = 'r' AND attnum > 0 AND
+                    nspname not in ('information_schema', 'pg_catalog')
+                UNION ALL
+                SELECT 'o' || conrelid || ':' || conname || ':' || contype ||
+                    ':' || coalesce(conkey::text, '') || ':' || confrelid ||
+                    ':' || coalesce(confkey::text, '') || ':' || conindid
+                FROM pg_constraint
+                UNION ALL
+                SELECT 'i' || indexrelid || ':' || indrelid || ':' ||
+                    indisunique || ':' || indkey::text || ':' ||
+                    (indpred IS NULL)
+                FROM pg_index
+            ) AS items
+        '''
+
+        cur = conn.cursor()
+        cur.execute(stmt)
+        fingerprint = cur.fetchone()[0]
+        cur.close()
+        return fingerprint
+
+    def _restore_table(self, name):
+        table = PostgresqlTable(name, None)
+        self.tables.append(table)
+        self.tables_by_name[name] = table
+        return table
+
+    def _dump_column(self, col):
+        return (col.name, col.notnull, col.attrnum)
+
+    def _restore_column(self, table, data):
+        (name, notnull, attrnum) = data
+        return table.add_column(name, notnull, attrnum)
+
     def _add_table(self, name, oid):
         table = PostgresqlTable(name, oid)
         self.tables.append(table)
@@ -43,7 +95,15 @@ class PostgresqlSchema(Schema):
         self.tables_by_oid[oid] = table
         return table
 
-    def _add_tables_from_conn(self, conn):
+    def _table_filter(self, column):
+        '''Return a condition and parameters that restrict a catalog query
+           to the schema's tables if the schema is pruned.'''
+        if not self.pruned:
+            return ('', None)
+        return ('AND %s = ANY(%%s::oid[])' % column,
+                (list(self.tables_by_oid.keys()),))
+
+    def _add_tables_from_conn(self, conn, scope):
         stmt = '''
             SELECT pg_class.oid, relname
             FROM pg_class
@@ -58,11 +118,23 @@ class PostgresqlSchema(Schema):
 
         cur = conn.cursor()
         cur.execute(stmt)
-        for (oid, name) in cur.fetchall():
+        tables = cur.fetchall()
+
+        if scope is not None:
+            cur.execute('''
+                SELECT conrelid, confrelid FROM pg_constraint
+                WHERE contype = 'f'
+            ''')
+            reachable = scope.reachable_tables(dict(tables), cur.fetchall())
+            tables = [(oid, name) for (oid, name) in tables
+                      if oid in reachable]
+
+        for (oid, name) in tables:
             self._add_table(name, oid)
         cur.close()
 
     def _add_columns_from_conn(self, conn):
+        (table_filter, params) = self._table_filter('pg_class.oid')
         stmt = '''
             SELECT pg_class.oid, attname, attnum, attnotnull
             FROM pg_class
@@ -75,28 +147,29 @@ class PostgresqlSchema(Schema):
             WHERE relkind = 'r' AND
                 nspname not in ('information_schema', 'pg_catalog') AND
                 typname IS NOT NULL AND
-                attnum > 0
+                attnum > 0 %s
             ORDER BY relname, attnum
-        '''
+        ''' % table_filter
 
         cur = conn.cursor()
-        cur.execute(stmt)
+        cur.execute(stmt, params)
         for (oid, name, attrnum, notnull) in cur.fetchall():
             table = self.tables_by_oid[oid]
             table.add_column(name, notnull, attrnum)
         cur.close()
 
     def _add_foreign_key_constraints_from_conn(self, conn):
+        (table_filter, params) = self._table_filter('base_table.oid')
         stmt = '''
             SELECT conname, base_table.oid, conkey, ref_table.oid, confkey
             FROM pg_class AS base_table
                 INNER JOIN pg_constraint ON (base_table.oid = conrelid)
                 LEFT JOIN pg_class AS ref_table ON (confrelid = ref_table.oid)
-            WHERE contype = 'f'
-        '''
+            WHERE contype = 'f' %s
+        ''' % table_filter
 
         cur = conn.cursor()
-        cur.execute(stmt)
+        cur.execute(stmt, params)
         for (name, src_oid, src_attrnum, dst_oid, dst_attrnum) \
                 in cur.fetchall():
             src_table = self.tables_by_oid[src_oid]
@@ -117,15 +190,16 @@ class PostgresqlSchema(Schema):
         cur.close()
 
     def _add_primary_key_constraints(self, conn):
+        (table_filter, params) = self._table_filter('base_table.oid')
         stmt = '''
             SELECT conname, base_table.oid, conkey
             FROM pg_class AS base_table
                 INNER JOIN pg_constraint ON (base_table.oid = conrelid)
-            WHERE contype = 'p'
-        '''
+            WHERE contype = 'p' %s
+        ''' % table_filter
 
         cur = conn.cursor()
-        cur.execute(stmt)
+        cur.execute(stmt, params)
         for (name, oid, attrnums) in cur.fetchall():
             table = self.tables_by_oid[oid]
             assert type(attrnums) is list
@@ -136,44 +210,41 @@ class PostgresqlSchema(Schema):
 
         cur.close()
 
-    def _add_unique_indexes(self, conn):
+    def _add_indexes(self, conn):
+        # Partial indexes can't be used for all lookups, so they are left
+        # out. INCLUDE columns, which come after the key columns in indkey,
+        # aren't searchable. They only exist as of postgresql 11.
+        if conn.server_version >= 110000:
+            key_attr_count = 'i.indnkeyatts'
+        else:
+            key_attr_count = 'i.indnatts'
+        (table_filter, params) = self._table_filter('c1.oid')
         stmt = '''
-            SELECT c1.oid, c2.relname, i.indisunique, i.indkey
+            SELECT c1.oid, c2.relname, i.indisunique, i.indkey, %s
             FROM pg_class c1
             JOIN pg_index i on c1.oid = i.indrelid
             JOIN pg_class c2 on c2.oid = i.indexrelid
-            LEFT JOIN pg_constraint c ON (
-                i.indrelid = c.conrelid AND
-                i.indexrelid = c.conindid AND
-                c.contype in ('p', 'u'))
-            WHERE c1.relkind = 'r'
-        '''
+            WHERE c1.relkind = 'r' AND i.indpred IS NULL %s
+            ORDER BY c2.relname
+        ''' % (key_attr_count, table_filter)
 
         cur = conn.cursor()
-        cur.execute(stmt)
-        unique_indexes = defaultdict(dict)
+        cur.execute(stmt, params)
         for row in cur.fetchall():
-            (table_oid, name, is_unique, attrs) = (
-                row[0], row[1], bool(row[2]), row[3])
-            if not is_unique:
-                continue
-
+            (table_oid, name, is_unique, attrs, key_attr_count) = (
+                row[0], row[1], bool(row[2]), row[3], row[4])
             if table_oid not in self.tables_by_oid:
                 continue
 
             table = self.tables_by_oid[table_oid]
             col_attrs = [int(a.strip()) for a in attrs.split()]
+            col_attrs = col_attrs[:key_attr_count]
 
             # Ignore indexes that have an expression on one of the columns
             if 0 in col_attrs:
                 continue
 
-            cols = set([table.cols_by_attrnum[a] for a in col_attrs])
-            unique_indexes[table][name] = cols
+            cols = tuple([table.cols_by_attrnum[a] for a in col_attrs])
+            Index.create_and_add_to_table(table, name, cols, is_unique)
 
         cur.close()
-
-        for table in unique_indexes:
-            for name in unique_indexes[table]:
-                cols = unique_indexes[table][name]
-                UniqueIndex.create_and_add_to_table(table, name, cols)
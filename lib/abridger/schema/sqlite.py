@@ -1,44 +1,97 @@
 from collections import defaultdict
+import hashlib
 import re
 
-from .base import Schema, Table, ForeignKeyConstraint, UniqueIndex
+from .base import Schema, Table, ForeignKeyConstraint, Index
 from abridger.exc import UnknownTableError, UnknownColumnError
 
 
+# The first version that has table-valued pragma functions
+PRAGMA_FUNCTIONS_VERSION = (3, 16, 0)
+
+
 class SqliteSchema(Schema):
     @classmethod
-    def create_from_conn(cls, conn):
+    def create_from_conn(cls, conn, scope=None):
         schema = cls()
-        schema._add_tables_from_conn(conn)
+        schema.pragma_functions = cls.has_pragma_functions(conn)
+        schema._add_tables_from_conn(conn, scope)
         schema._add_columns_from_conn(conn)
         schema._add_foreign_key_constraints_from_conn(conn)
-        schema._add_unique_indexes(conn)
+        schema._add_indexes(conn)
         schema._add_alternate_primary_keys()
         return schema
 
+    @staticmethod
+    def fingerprint(conn):
+        '''Return a hash that changes whenever the schema changes.'''
+        rows = conn.execute('''
+            SELECT type, name, tbl_name, sql FROM sqlite_master
+            ORDER BY type, name
+        ''').fetchall()
+        return hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def has_pragma_functions(conn):
+        (version,) = conn.execute('SELECT sqlite_version()').fetchone()
+        version = tuple([int(v) for v in version.split('.')])
+        return version >= PRAGMA_FUNCTIONS_VERSION
+
+    def _pragma_rows(self, conn, pragma, names):
+        '''
+            Return the rows of a pragma such as table_info for all tables in
+            names, keyed by table name. With pragma functions this is a
+            single query, otherwise the pragma is run once per table.
+        '''
+        rows = defaultdict(list)
+        if self.pragma_functions:
+            names = set(names)
+            stmt = '''
+                SELECT m.name, p.* FROM sqlite_master AS m
+                JOIN pragma_%s(m.name) AS p
+                WHERE m.type = 'table'
+            ''' % pragma
+            for row in conn.execute(stmt):
+                if row[0] in names:
+                    rows[row[0]].append(row[1:])
+        else:
+            for name in names:
+                stmt = "PRAGMA %s('%s')" % (pragma, name)
+                rows[name].extend(conn.execute(stmt))
+        return rows
+
     def _add_table(self, name):
         table = Table(name)
         self.tables.append(table)
         self.tables_by_name[name] = table
         return table
 
-    def _add_tables_from_conn(self, conn):
+    def _add_tables_from_conn(self, conn, scope):
         stmt = '''
             SELECT name FROM sqlite_master
             WHERE type='table' ORDER BY name
         '''
 
-        rs = conn.execute(stmt)
-        for (name,) in rs:
+        names = [name for (name,) in conn.execute(stmt)]
+        if scope is not None:
+            fk_rows = self._pragma_rows(conn, 'foreign_key_list', names)
+            edges = []
+            for name in names:
+                for row in fk_rows[name]:
+                    edges.append((name, row[2]))
+            reachable = scope.reachable_tables(
+                dict([(name, name) for name in names]), edges)
+            names = [name for name in names if name in reachable]
+
+        for name in names:
             self._add_table(name)
 
     def _add_columns_from_conn(self, conn):
+        rows = self._pragma_rows(conn, 'table_info',
+                                 self.tables_by_name.keys())
         for table in self.tables:
-            stmt = "PRAGMA table_info('%s')" % table.name
-            rs = conn.execute(stmt)
-
             primary_key = list()
-            for row in rs:
+            for row in rows[table.name]:
                 (name, notnull, primary_key_index) = (
                     row[1], bool(row[3]), row[5])
                 col = table.add_column(name, notnull)
@@ -51,12 +104,15 @@ class SqliteSchema(Schema):
                 table.primary_key = None
 
     def _add_foreign_key_constraints_from_conn(self, conn):
+        rows = self._pragma_rows(conn, 'foreign_key_list',
+                                 self.tables_by_name.keys())
+        table_sqls = dict(conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table'"))
+
         for src_table in self.tables:
-            stmt = "PRAGMA foreign_key_list('%s')" % src_table.name
-            rs = conn.execute(stmt)
             foreign_keys = defaultdict(list)
             fks = {}
-            for row in rs:
+            for row in rows[src_table.name]:
                 (fk_index, dst_table_name, src_col_name,
                  dst_col_name) = (row[0], row[2], row[3], row[4])
                 foreign_keys[fk_index].append((dst_table_name,
@@ -101,12 +157,7 @@ class SqliteSchema(Schema):
                 assert len(dst_table_names) == 1
 
             # Find constraint names by parsing the schema SQL
-            stmt = '''
-                SELECT sql FROM sqlite_master WHERE name = '%s'
-                AND type = 'table'
-            ''' % src_table.name
-            rs = conn.execute(stmt)
-            table_sql = rs.fetchone()[0]
+            table_sql = table_sqls[src_table.name]
 
             fk_pattern = (
                 '(?:CONSTRAINT (\w+) +)?'
@@ -125,19 +176,47 @@ class SqliteSchema(Schema):
                     if t in fks:
                         fks[t].name = name
 
-    def _add_unique_indexes(self, conn):
+    def _add_indexes(self, conn):
+        index_names = defaultdict(list)
+        index_cols = defaultdict(list)
+        unique_index_names = set()
+        if self.pragma_functions:
+            stmt = '''
+                SELECT m.name, il.name, il."unique", ii.name
+                FROM sqlite_master AS m
+                JOIN pragma_index_list(m.name) AS il
+                JOIN pragma_index_info(il.name) AS ii
+                WHERE m.type = 'table' AND NOT il.partial
+            '''
+            for (table_name, index_name, is_unique, column_name) in \
+                    conn.execute(stmt):
+                if index_name not in index_names[table_name]:
+                    index_names[table_name].append(index_name)
+                if is_unique:
+                    unique_index_names.add(index_name)
+                index_cols[index_name].append(column_name)
+        else:
+            for table in self.tables:
+                stmt = "PRAGMA index_list('%s')" % table.name
+                for row in conn.execute(stmt).fetchall():
+                    # Partial indexes can't be used for all lookups
+                    if len(row) > 4 and row[4]:
+                        continue
+                    (index_name, is_unique) = (row[1], row[2])
+                    index_names[table.name].append(index_name)
+                    if is_unique:
+                        unique_index_names.add(index_name)
+                    stmt = "PRAGMA index_info('%s')" % index_name
+                    for row in conn.execute(stmt):
+                        index_cols[index_name].append(row[2])
+
         for table in self.tables:
-            stmt = "PRAGMA index_list('%s')" % table.name
-            rs = conn.execute(stmt)
-            for row in rs:
-                (index_name, is_unique) = (row[1], row[2])
-                if not is_unique:
+            for index_name in index_names[table.name]:
+                # Ignore indexes on expressions
+                if None in index_cols[index_name]:
                     continue
-
-                stmt = "PRAGMA index_info('%s')" % index_name
-                rs = conn.execute(stmt)
-                columns = set()
-                for row in rs:
-                    column_name = row[2]
-                    columns.add(table.cols_by_name[column_name])
-                UniqueIndex.create_and_add_to_table(table, index_name, columns)
+                columns = tuple([table.cols_by_name[c]
+                                 for c in index_cols[index_name]])
+                Index.create_and_add_to_table(
+                    table, index_name, columns,
+                    index_name in unique_index_names)
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor.checkpoint import config_fingerprint
+
+
+# Bump when the format of the dumped schema or extraction model changes
+FORMAT_VERSION = 2
+
+
+class SchemaCache(object):
+    '''
+        Caches introspected schemas and compiled extraction models in a
+        directory. Schemas are keyed by a fingerprint of the database
+        schema, which is much quicker to compute than introspecting it.
+        Extraction models are keyed by the schema fingerprint and the
+        config. Pruned schemas are also keyed by their scope.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hit_count = 0
+        self.miss_count = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __str__(self):
+        return 'hits=%d misses=%d' % (self.hit_count, self.miss_count)
+
+    def __repr__(self):
+        return '<SchemaCache %s>' % str(self)
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, '%s-v%d-%s.pickle' % (
+            kind, FORMAT_VERSION, key))
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                ValueError):
+            self.miss_count += 1
+            return None
+
+        self.hit_count += 1
+        return data
+
+    def _write(self, path, data):
+        # Write to a temporary file first so that concurrent runs never see
+        # a partially written file
+        (fd, temp_path) = tempfile.mkstemp(dir=self.directory,
+                                           suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, 2)
+        os.rename(temp_path, path)
+
+    def load_schema(self, schema_cls, conn, scope=None):
+        fingerprint = schema_cls.fingerprint(conn)
+        if scope is not None:
+            fingerprint = hashlib.sha1(('%s:%s' % (
+                fingerprint, scope.key())).encode('utf-8')).hexdigest()
+        path = self._path(schema_cls.__name__, fingerprint)
+        data = self._read(path)
+        if data is None:
+            schema = schema_cls.create_from_conn(conn, scope=scope)
+            self._write(path, schema.dump())
+        else:
+            schema = schema_cls.restore(data)
+
+        schema.cache_fingerprint = fingerprint
+        return schema
+
+    def load_extraction_model(self, schema, data):
+        key = '%s:%s' % (schema.cache_fingerprint, config_fingerprint(data))
+        path = self._path('extraction-model',
+                          hashlib.sha1(key.encode('utf-8')).hexdigest())
+        model_data = self._read(path)
+        if model_data is None:
+            model = ExtractionModel.load(schema, data)
+            self._write(path, model.dump())
+        else:
+            model = ExtractionModel.restore(schema, model_data)
+        return model
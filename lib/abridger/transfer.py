@@ -0,0 +1,341 @@
+from __future__ import print_function
+from queue import Queue, Empty
+from threading import Thread
+
+from abridger.database import SqliteDatabase, PostgresqlDatabase
+from abridger.exc import TransferError
+
+
+class Transfer(object):
+    '''
+        Copies the extracted rows from the source database straight into the
+        destination database. Only the effective primary keys and foreign
+        key values of the extracted rows are sent back to the source
+        database, the rest of the row data never passes through python.
+    '''
+
+    def __init__(self, src_database, dst_database, generator, verbosity=0,
+                 copy_format='text', hooks=None):
+        self.src_database = src_database
+        self.dst_database = dst_database
+        self.generator = generator
+        self.results = generator.extractor.results
+        self.verbosity = verbosity
+        self.copy_format = copy_format
+        self.hooks = hooks
+        self.insert_count = 0
+        self.update_count = 0
+
+    def _staged_cols(self, table):
+        # The effective primary key identifies the rows. Foreign key values
+        # are staged too, since the extractor nulls the ones that weren't
+        # followed.
+        cols = list(table.effective_primary_key)
+        for fk in table.foreign_keys:
+            for col in fk.src_cols:
+                if col not in cols:
+                    cols.append(col)
+        return cols
+
+    def _staged_rows(self, table, cols):
+        col_indexes = [table.cols.index(c) for c in cols]
+        results_rows = self.results[table][table.effective_primary_key]
+        for results_row in results_rows.values():
+            yield tuple([results_row.row[i] for i in col_indexes])
+
+    def _select_exprs(self, table, staged_cols, src_alias, keys_alias):
+        deferred_update_cols = self.generator.deferred_update_rules[table]
+        exprs = []
+        for col in table.cols:
+            if col in deferred_update_cols:
+                exprs.append('NULL')
+            elif col in staged_cols:
+                exprs.append('%s.%s' % (keys_alias, col.name))
+            else:
+                exprs.append('%s.%s' % (src_alias, col.name))
+        return exprs
+
+    def _has_nullable_key(self, table):
+        # A unique index allows several rows with NULLs in the same key,
+        # which can't be joined on, so they are inserted as-is too.
+        if table.primary_key is not None:
+            return False
+        return not all([c.notnull for c in table.effective_primary_key])
+
+    def _join_clause(self, table, src_alias, keys_alias):
+        return ' AND '.join(['%s.%s = %s.%s' % (
+            src_alias, col.name, keys_alias, col.name)
+            for col in table.effective_primary_key])
+
+    def run(self):
+        if self.verbosity > 0:
+            tables = [t for t in self.generator.table_order
+                      if t in self.results]
+            print('Copying rows directly into %d tables...' % len(tables))
+
+        self._begin()
+        try:
+            for table in self.generator.table_order:
+                if table not in self.results:
+                    continue
+
+                if self.verbosity > 1:
+                    print('Copying %s' % table)
+
+                # Rows in tables without a primary key or unique index can't
+                # be identified in the source, so they are inserted as-is.
+                insert_count = self.insert_count
+                if table.can_have_duplicated_rows or \
+                        self._has_nullable_key(table):
+                    self._insert_rows(table)
+                else:
+                    self._copy_table(table)
+                if self.hooks is not None:
+                    self.hooks.on_table_emitted(
+                        table, self.insert_count - insert_count)
+
+            self._update_rows(self.generator.update_statements)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        finally:
+            self._end()
+
+        return self
+
+    def _insert_rows(self, table):
+        rows = self.generator.table_insert_statements(table)
+        self._insert_statements(rows)
+        self.insert_count += len(rows)
+
+
+class SqliteTransfer(Transfer):
+    '''Copies rows by attaching the destination database to the source
+       connection and using INSERT ... SELECT.'''
+
+    schema_name = 'abridger_dst'
+    keys_table_name = 'abridger_keys'
+
+    def _begin(self):
+        self.connection = self.src_database.connection
+        self.connection.execute('ATTACH DATABASE ? AS %s' % self.schema_name,
+                                [self.dst_database.path])
+
+    def _copy_table(self, table):
+        conn = self.connection
+        staged_cols = self._staged_cols(table)
+        keys_table = 'temp.%s' % self.keys_table_name
+
+        conn.execute('CREATE TEMP TABLE %s (%s)' % (
+            self.keys_table_name, ', '.join([c.name for c in staged_cols])))
+        conn.executemany('INSERT INTO %s VALUES (%s)' % (
+            keys_table, ', '.join(['?'] * len(staged_cols))),
+            self._staged_rows(table, staged_cols))
+
+        cur = conn.execute(
+            'INSERT INTO %s.%s (%s) SELECT %s FROM main.%s AS t '
+            'JOIN %s AS k ON (%s)' % (
+                self.schema_name, table.name,
+                ', '.join([c.name for c in table.cols]),
+                ', '.join(self._select_exprs(table, staged_cols, 't', 'k')),
+                table.name,
+                keys_table,
+                self._join_clause(table, 't', 'k')))
+        self.insert_count += cur.rowcount
+
+        conn.execute('DROP TABLE %s' % keys_table)
+
+    def _insert_statements(self, rows):
+        for row in rows:
+            (stmt, values) = self.src_database.make_insert_statement(
+                row, schema_name=self.schema_name)
+            self.connection.execute(stmt, values)
+
+    def _update_rows(self, rows):
+        for row in rows:
+            (stmt, values) = self.src_database.make_update_statement(
+                row, schema_name=self.schema_name)
+            self.connection.execute(stmt, values)
+            self.update_count += 1
+
+    def _commit(self):
+        self.connection.commit()
+
+    def _rollback(self):
+        self.connection.rollback()
+
+    def _end(self):
+        self.connection.execute('DETACH DATABASE %s' % self.schema_name)
+
+
+class CopyPipe(object):
+    '''
+        A bounded buffer which connects a COPY TO writer on one connection
+        to a COPY FROM reader on another. Data is passed on as raw bytes in
+        chunks of around chunk_size bytes.
+    '''
+
+    def __init__(self, max_chunks=16, chunk_size=65536):
+        self.queue = Queue(maxsize=max_chunks)
+        self.chunk_size = chunk_size
+        self.write_buffer = []
+        self.write_buffer_size = 0
+        self.read_buffer = b''
+        self.eof = False
+        self.aborted = False
+        self.error = None
+
+    def write(self, data):
+        if self.aborted:
+            raise IOError('The COPY reader has gone away')
+
+        self.write_buffer.append(data)
+        self.write_buffer_size += len(data)
+        if self.write_buffer_size >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.write_buffer:
+            self.queue.put(b''.join(self.write_buffer))
+            self.write_buffer = []
+            self.write_buffer_size = 0
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+
+    def abort(self):
+        # Unblock the writer if it is waiting for space in the queue
+        self.aborted = True
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+
+    def read(self, size=-1):
+        if not self.read_buffer:
+            if self.eof:
+                return b''
+            chunk = self.queue.get()
+            if chunk is None:
+                self.eof = True
+                return b''
+            self.read_buffer = chunk
+
+        if size < 0 or size >= len(self.read_buffer):
+            (data, self.read_buffer) = (self.read_buffer, b'')
+        else:
+            data = self.read_buffer[:size]
+            self.read_buffer = self.read_buffer[size:]
+        return data
+
+
+class PostgresqlTransfer(Transfer):
+    '''Copies rows by streaming COPY ... TO STDOUT on the source into
+       COPY ... FROM STDIN on the destination.'''
+
+    keys_table_name = 'abridger_keys'
+    keys_batch_size = 1000
+
+    def _begin(self):
+        self.src_cursor = self.src_database.connection.cursor()
+        self.dst_cursor = self.dst_database.connection.cursor()
+
+    def _stage_keys(self, table, staged_cols):
+        cur = self.src_cursor
+        cols_csv = ', '.join([c.name for c in staged_cols])
+
+        # Copy the column types from the source table
+        cur.execute(
+            'CREATE TEMP TABLE %s AS SELECT %s FROM %s WITH NO DATA' % (
+                self.keys_table_name, cols_csv, table.name))
+
+        q = '(%s)' % ', '.join(['%s'] * len(staged_cols))
+        rows = list(self._staged_rows(table, staged_cols))
+        for i in range(0, len(rows), self.keys_batch_size):
+            values = b', '.join([cur.mogrify(q, row) for row in
+                                 rows[i:i + self.keys_batch_size]])
+            cur.execute(b'INSERT INTO ' + self.keys_table_name.encode() +
+                        b' VALUES ' + values)
+        return len(rows)
+
+    def _copy_to(self, stmt, pipe):
+        try:
+            self.src_cursor.copy_expert(stmt, pipe)
+        except Exception as e:
+            pipe.error = e
+        finally:
+            pipe.close()
+
+    def _copy_table(self, table):
+        staged_cols = self._staged_cols(table)
+        row_count = self._stage_keys(table, staged_cols)
+
+        if self.copy_format == 'binary':
+            options = ' WITH (FORMAT binary)'
+        else:
+            options = ''
+
+        copy_to = 'COPY (SELECT %s FROM %s AS t JOIN %s AS k ON (%s)) ' \
+            'TO STDOUT%s' % (
+                ', '.join(self._select_exprs(table, staged_cols, 't', 'k')),
+                table.name,
+                self.keys_table_name,
+                self._join_clause(table, 't', 'k'),
+                options)
+        copy_from = 'COPY %s (%s) FROM STDIN%s' % (
+            table.name, ', '.join([c.name for c in table.cols]), options)
+
+        pipe = CopyPipe()
+        thread = Thread(target=self._copy_to, args=(copy_to, pipe))
+        thread.start()
+        try:
+            self.dst_cursor.copy_expert(copy_from, pipe)
+        finally:
+            pipe.abort()
+            thread.join()
+
+        if pipe.error is not None:
+            raise pipe.error
+
+        self.src_cursor.execute('DROP TABLE %s' % self.keys_table_name)
+        self.insert_count += row_count
+
+    def _insert_statements(self, rows):
+        self.dst_database.insert_rows(rows, cursor=self.dst_cursor)
+
+    def _update_rows(self, rows):
+        for row in rows:
+            (stmt, values) = self.dst_database.make_update_statement(row)
+            self.dst_cursor.execute(stmt, values)
+            self.update_count += 1
+
+    def _commit(self):
+        self.dst_database.connection.commit()
+
+    def _rollback(self):
+        self.dst_database.connection.rollback()
+
+    def _end(self):
+        # Throw away the staged keys
+        self.src_database.connection.rollback()
+
+
+TRANSFER_CLASSES = [
+    (SqliteDatabase, SqliteTransfer),
+    (PostgresqlDatabase, PostgresqlTransfer),
+]
+
+
+def get_transfer_class(src_database, dst_database):
+    for (database_cls, transfer_cls) in TRANSFER_CLASSES:
+        if isinstance(src_database, database_cls) and \
+                isinstance(dst_database, database_cls):
+            return transfer_cls
+
+    raise TransferError(
+        'Direct transfers are not supported from %s to %s' % (
+            type(src_database).__name__, type(dst_database).__name__))
@@ -0,0 +1,54 @@
+from signal import signal, SIGPIPE, SIG_DFL
+import argparse
+import sys
+
+from abridger.exc import ProvenanceError
+from abridger.extractor.provenance import (find_chain, find_key,
+                                           load_provenance)
+
+
+def format_row(data, table_name, key):
+    if key is None:
+        return '%s (unknown row)' % table_name
+    cols_csv = ','.join(data['keys'][table_name])
+    values_csv = ','.join([str(v) for v in key])
+    if len(key) > 1:
+        cols_csv = '(%s)' % cols_csv
+        values_csv = '(%s)' % values_csv
+    return '%s.%s=%s' % (table_name, cols_csv, values_csv)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Explain why a row was extracted, from a provenance '
+                    'file written by abridge-db --provenance')
+    parser.add_argument(dest='path', metavar='PROVENANCE_PATH',
+                        help='path to the provenance file')
+    parser.add_argument(dest='table', metavar='TABLE', help='table name')
+    parser.add_argument(dest='key', metavar='KEY', nargs='+',
+                        help='values of the effective primary key of the '
+                             'row')
+
+    # Ignore SIG_PIPE and don't throw exceptions on it
+    signal(SIGPIPE, SIG_DFL)
+
+    args = parser.parse_args(args)
+    try:
+        data = load_provenance(args.path)
+        key = find_key(data, args.table, args.key)
+    except ProvenanceError as e:
+        print(str(e))
+        sys.exit(1)
+
+    chain = find_chain(data, args.table, key)
+    rows = [format_row(data, table_name, key)
+            for (table_name, key, relation) in chain]
+    width = max([len(row) for row in rows])
+    for (row, (table_name, key, relation)) in zip(rows, chain):
+        if relation is not None:
+            reason = 'via %s' % relation
+        elif key is not None:
+            reason = 'subject'
+        else:
+            reason = ''
+        print(('%-*s  %s' % (width, row, reason)).rstrip())
@@ -41,5 +41,6 @@ setup(
     ],
     keywords=['database', 'subset', 'filter', 'reduce', 'sqlite', 'postgresql',
               'sql'],
-    scripts=['bin/abridge-db', 'bin/abridger-dump-relations'],
+    scripts=['bin/abridge-db', 'bin/abridger-dump-relations',
+             'bin/abridger-advise-indexes', 'bin/abridger-why'],
 )
@@ -60,9 +60,12 @@ class TestAbridgeDbBase(object):
             dst_database.disconnect()
 
     def run_with_dst_database(self, src_url, dst_url, dst_database,
-                              explain=False, verbosity=1, check=True):
+                              explain=False, verbosity=1, check=True,
+                              extra_args=None):
         config_tempfile = self.make_config_tempfile()
         args = [config_tempfile.name, src_url]
+        if extra_args is not None:
+            args.extend(extra_args)
 
         if explain:
             args.append('-e')
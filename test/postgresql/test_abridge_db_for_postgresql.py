@@ -53,6 +53,41 @@ class TestAbridgeDbForPostgresql(TestAbridgeDbBase):
             self.dst_database)
         out, err = capsys.readouterr()
 
+    def test_fast_load(self, capsys, postgresql, postgresql2):
+        self.prepare_src(postgresql)
+        self.prepare_dst(postgresql2, disconnect=False)
+        self.dst_database.execute(
+            'CREATE INDEX test2_test1_id_idx ON test2(test1_id)')
+        self.dst_conn.commit()
+        self.dst_database.disconnect()
+
+        self.run_with_dst_database(
+            self.src_database.url(),
+            self.dst_database.url(),
+            self.dst_database,
+            extra_args=['--fast-load', '--unlogged', '--index-jobs', '2'])
+        out, err = capsys.readouterr()
+        assert 'Rebuilding indexes...' in out
+
+        self.dst_database.connect()
+        rows = self.dst_database.execute_and_fetchall(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'test2' "
+            "ORDER BY indexname")
+        assert rows == [('test2_pkey',), ('test2_test1_id_idx',)]
+        self.dst_database.disconnect()
+
+    @pytest.mark.parametrize('copy_format', ['text', 'binary'])
+    def test_direct(self, capsys, postgresql, postgresql2, copy_format):
+        self.prepare_src(postgresql)
+        self.prepare_dst(postgresql2, disconnect=True)
+        self.run_with_dst_database(
+            self.src_database.url(),
+            self.dst_database.url(),
+            self.dst_database,
+            extra_args=['--direct', '--direct-format', copy_format])
+        out, err = capsys.readouterr()
+        assert 'Copied 5 rows and performed 2 updates' in out
+
     def check_statements(self, postgresql2, stmts):
         self.prepare_dst(postgresql2, disconnect=False)
         for stmt in stmts.split("\n"):
@@ -2,6 +2,8 @@ import mock
 import pytest
 
 from abridger.database import PostgresqlDatabase
+from abridger.database.governor import Governor
+from abridger.exc import QueryTimeoutError
 from abridger.schema import PostgresqlSchema
 from database import DatabaseTestBase
 from test.conftest import got_postgresql
@@ -63,3 +65,112 @@ class TestPostgresqlDatabase(DatabaseTestBase):
         with pytest.raises(ImportError) as e:
             self.database.connect()
         assert 'Please install psycopg2 package' in str(e)
+
+    def make_consistent_database(self, read_only):
+        database = self.database
+        return PostgresqlDatabase(
+            host=database.host, port=database.port, dbname=database.dbname,
+            user=database.user, read_only=read_only, consistent=True)
+
+    def test_read_only(self):
+        database = self.make_consistent_database(read_only=True)
+        with pytest.raises(Exception) as e:
+            database.execute("INSERT INTO table1 (name) VALUES ('foo')")
+        assert 'read-only transaction' in str(e)
+        database.disconnect()
+
+    def test_worker_snapshot(self):
+        self.database.execute("INSERT INTO table1 (id, name) VALUES (1, 'a')")
+        self.database.connection.commit()
+
+        database = self.make_consistent_database(read_only=True)
+        assert len(database.fetch_rows(self.table1, None, None)) == 1
+        database.export_snapshot()
+
+        # Data added after the snapshot was taken isn't seen by workers
+        self.database.execute("INSERT INTO table1 (id, name) VALUES (2, 'b')")
+        self.database.connection.commit()
+
+        worker_conn = database.connect_worker()
+        cur = worker_conn.cursor()
+        cur.execute('SELECT id FROM table1')
+        assert cur.fetchall() == [(1,)]
+        worker_conn.close()
+        database.disconnect()
+
+    def test_changed_rows(self):
+        self.database.execute("INSERT INTO table1 (id, name) VALUES (1, 'a')")
+        self.database.connection.commit()
+
+        database = self.make_consistent_database(read_only=True)
+        mark = database.transaction_high_water_mark()
+        database.disconnect()
+
+        self.database.execute("INSERT INTO table1 (id, name) VALUES (2, 'b')")
+        self.database.connection.commit()
+
+        database = self.make_consistent_database(read_only=True)
+        rows = database.fetch_changed_rows(self.table1, None, mark)
+        assert [r[0] for r in rows] == [2]
+        database.disconnect()
+
+    def test_statement_timeout_is_restored(self):
+        self.database.execute("INSERT INTO table1 (id, name) VALUES (1, 'a')")
+        previous_timeout = self.database.execute_and_fetchall(
+            'SHOW statement_timeout')
+        self.database.governor = Governor(statement_timeout=10)
+        try:
+            rows = self.database.fetch_rows(self.table1, None, None)
+        finally:
+            self.database.governor = None
+        assert len(rows) == 1
+        assert self.database.execute_and_fetchall(
+            'SHOW statement_timeout') == previous_timeout
+
+    def test_statement_timeout_rollback(self):
+        previous_timeout = self.database.execute_and_fetchall(
+            'SHOW statement_timeout')
+        with pytest.raises(QueryTimeoutError):
+            self.database._execute_and_fetchall_with_timeout(
+                0.01, 'SELECT pg_sleep(1)')
+
+        # The savepoint is gone and the transaction can still be used
+        assert self.database.execute_and_fetchall(
+            'SHOW statement_timeout') == previous_timeout
+        with pytest.raises(Exception):
+            self.database.execute('RELEASE SAVEPOINT abridger_query')
+
+    def test_fast_load_unlogged(self):
+        database = self.database
+        database.execute('CREATE TABLE "Table2" (id INTEGER)')
+        database.create_schema(PostgresqlSchema)
+
+        def persistence():
+            return database.execute_and_fetchall(
+                "SELECT relpersistence FROM pg_class "
+                "WHERE relname = 'Table2'")[0][0]
+
+        # Names that need quoting can be altered too
+        state = database.begin_fast_load(unlogged=True)
+        assert persistence() == 'u'
+        database.end_fast_load(state)
+        assert persistence() == 'p'
+
+    def test_explain_query(self):
+        plan = self.database.explain_query(
+            'SELECT * FROM table1 WHERE id IN (%s, %s)', (1, 2))
+        assert len(plan) > 0
+        assert any(['table1' in line for line in plan])
+
+    def test_statistics(self):
+        for i in range(1, 101):
+            self.database.execute(
+                "INSERT INTO table1 (id, name) VALUES (%d, 'n%d')" % (
+                    i, i % 10))
+        self.database.execute('ANALYZE table1')
+        assert self.database.estimate_row_count(self.table1) == 100
+        rows_per_value = self.database.estimate_rows_per_value(
+            self.table1, (self.table1.cols_by_name['name'],))
+        assert round(rows_per_value) == 10
+        assert self.database.estimate_rows_per_value(
+            self.table1, tuple(self.table1.cols)) is None
@@ -3,7 +3,7 @@ import tempfile
 import yaml
 
 from abridger.exc import RelationIntegrityError
-from abridger.extraction_model import Relation
+from abridger.extraction_model import Relation, SchemaScope
 from abridger.schema import PostgresqlSchema
 from test.conftest import got_postgresql
 
@@ -242,6 +242,53 @@ class TestPostgresqlSchema(object):
         assert('col2', 'col3') not in tuples
         assert('col2', 'col4') not in tuples
 
+    def test_indexes(self, postgresql_conn):
+        cur = postgresql_conn.cursor()
+        cur.execute('''
+            CREATE TABLE test1 (
+                id SERIAL PRIMARY KEY,
+                col1 TEXT,
+                col2 TEXT
+            );
+
+            CREATE INDEX index1 ON test1(col2, col1);
+            CREATE INDEX index2 ON test1(lower(col1));
+        ''')
+        cur.close()
+
+        schema = PostgresqlSchema.create_from_conn(postgresql_conn)
+        table = schema.tables[0]
+        indexes = dict([(i.name, i) for i in table.indexes])
+        assert sorted(indexes.keys()) == ['index1', 'test1_pkey']
+        assert [c.name for c in indexes['index1'].cols] == ['col2', 'col1']
+        assert not indexes['index1'].unique
+        assert indexes['test1_pkey'].unique
+        assert table.has_index_for((table.cols_by_name['col2'],))
+        assert not table.has_index_for((table.cols_by_name['col1'],))
+
+    def test_partial_and_include_indexes(self, postgresql_conn):
+        if postgresql_conn.server_version < 110000:
+            pytest.skip('INCLUDE needs postgresql 11')
+        cur = postgresql_conn.cursor()
+        cur.execute('''
+            CREATE TABLE test1 (
+                id SERIAL PRIMARY KEY,
+                col1 TEXT,
+                col2 TEXT
+            );
+
+            CREATE INDEX index1 ON test1(col1) WHERE col2 IS NULL;
+            CREATE INDEX index2 ON test1(col2) INCLUDE (col1);
+        ''')
+        cur.close()
+
+        schema = PostgresqlSchema.create_from_conn(postgresql_conn)
+        table = schema.tables[0]
+        indexes = dict([(i.name, i) for i in table.indexes])
+        assert sorted(indexes.keys()) == ['index2', 'test1_pkey']
+        assert [c.name for c in indexes['index2'].cols] == ['col2']
+        assert not table.has_index_for((table.cols_by_name['col1'],))
+
     def test_self_referencing_non_null_foreign_key(self, postgresql_conn):
         cur = postgresql_conn.cursor()
         for stmt in [
@@ -260,3 +307,55 @@ class TestPostgresqlSchema(object):
 
         with pytest.raises(RelationIntegrityError):
             PostgresqlSchema.create_from_conn(postgresql_conn)
+
+    def test_dump_and_restore(self, postgresql_conn):
+        cur = postgresql_conn.cursor()
+        cur.execute(self.test_relations_stmts)
+        cur.close()
+
+        fingerprint = PostgresqlSchema.fingerprint(postgresql_conn)
+        assert PostgresqlSchema.fingerprint(postgresql_conn) == fingerprint
+
+        schema = PostgresqlSchema.create_from_conn(postgresql_conn)
+        restored = PostgresqlSchema.restore(schema.dump())
+        assert restored.dump() == schema.dump()
+        for table in schema.tables:
+            restored_table = restored.tables_by_name[table.name]
+            assert [str(fk) for fk in table.foreign_keys] == \
+                [str(fk) for fk in restored_table.foreign_keys]
+            assert [c.attrnum for c in table.cols] == \
+                [c.attrnum for c in restored_table.cols]
+
+        cur = postgresql_conn.cursor()
+        cur.execute('ALTER TABLE test2 ADD COLUMN fk6 INTEGER')
+        cur.close()
+        assert PostgresqlSchema.fingerprint(postgresql_conn) != fingerprint
+
+    def test_pruned_schema(self, postgresql_conn):
+        cur = postgresql_conn.cursor()
+        cur.execute(self.test_relations_stmts)
+        cur.execute('''
+            CREATE TABLE test3 (
+                id SERIAL PRIMARY KEY,
+                test2_id INTEGER NOT NULL REFERENCES test2);
+            CREATE TABLE test4 (id SERIAL PRIMARY KEY);
+        ''')
+        cur.close()
+
+        schema = PostgresqlSchema.create_from_conn(
+            postgresql_conn, scope=SchemaScope(['test2']))
+        assert sorted(schema.tables_by_name.keys()) == ['test1', 'test2']
+        full_schema = PostgresqlSchema.create_from_conn(postgresql_conn)
+        for name in ('test1', 'test2'):
+            table = schema.tables_by_name[name]
+            full_table = full_schema.tables_by_name[name]
+            for attr in ('cols', 'primary_key', 'foreign_keys',
+                         'unique_indexes', 'indexes'):
+                assert sorted([str(v) for v in getattr(table, attr)]) == \
+                    sorted([str(v) for v in getattr(full_table, attr)])
+
+        schema = PostgresqlSchema.create_from_conn(
+            postgresql_conn,
+            scope=SchemaScope(['test2'], incoming_table_names=['test3']))
+        assert sorted(schema.tables_by_name.keys()) == [
+            'test1', 'test2', 'test3']
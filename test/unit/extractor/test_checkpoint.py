@@ -0,0 +1,112 @@
+from tempfile import NamedTemporaryFile
+import pickle
+import pytest
+
+from abridger.exc import CheckpointError
+from abridger.extraction_model import ExtractionModel, Relation
+from abridger.extractor import Extractor
+from abridger.extractor.checkpoint import (Checkpoint, CheckpointState,
+                                           config_fingerprint, read_records,
+                                           restore_extractor)
+from abridger.schema import SqliteSchema
+from test.unit.extractor.base import TestExtractorBase
+
+
+class TestExtractorCheckpoint(TestExtractorBase):
+    extraction_model_data = [
+        {'subject': [{'tables': [{'table': 'departments', 'column': 'id',
+                                  'values': [1, 2]}]}]},
+        {'subject': [{'tables': [{'table': 'employees', 'column': 'id',
+                                  'values': 5}]}]},
+        {'relations': [{'defaults': Relation.DEFAULT_EVERYTHING}]},
+    ]
+
+    @pytest.fixture()
+    def schema1(self):
+        for stmt in [
+            '''CREATE TABLE departments (
+                id INTEGER PRIMARY KEY,
+                manager_id INTEGER REFERENCES employees
+            );''',
+            '''CREATE TABLE employees (
+                id INTEGER PRIMARY KEY,
+                department_id INTEGER NOT NULL REFERENCES departments
+            );''',
+            '''CREATE TABLE notes (
+                employee_id INTEGER REFERENCES employees,
+                note TEXT
+            );''',
+        ]:
+            self.database.execute(stmt)
+
+        schema = SqliteSchema.create_from_conn(self.database.connection)
+        (departments, employees, notes) = schema.tables
+        self.database.insert_rows(
+            [(departments, (i, None)) for i in range(1, 4)] +
+            [(employees, (i, i % 3 + 1)) for i in range(1, 10)] +
+            [(notes, (i, 'note')) for i in range(1, 10)] +
+            [(notes, (1, 'note'))])
+        self.database.execute('UPDATE departments SET manager_id = id')
+        return schema
+
+    def make_extractor(self, schema, path, append=False):
+        extraction_model = ExtractionModel.load(
+            schema, self.extraction_model_data)
+        checkpoint = Checkpoint(
+            path, extraction_model, interval=0, max_overhead=None,
+            fingerprint=config_fingerprint(self.extraction_model_data),
+            append=append)
+        return Extractor(self.database, extraction_model,
+                         checkpoint=checkpoint)
+
+    def test_resume(self, schema1):
+        temp = NamedTemporaryFile(suffix='.checkpoint')
+        extractor = self.make_extractor(schema1, temp.name).launch()
+        extractor.checkpoint.close()
+        expected_results = extractor.flat_results()
+        (records, valid_length) = read_records(temp.name)
+        assert len(records) > extractor.fetch_count
+
+        # Resume from every possible point, including a partially written
+        # record at the end
+        for i in range(1, len(records) + 1):
+            resume_temp = NamedTemporaryFile(suffix='.checkpoint')
+            with open(resume_temp.name, 'wb') as f:
+                for record in records[:i]:
+                    pickle.dump(record, f)
+                f.write(b'garbage')
+
+            state = CheckpointState.load(resume_temp.name)
+            extractor = self.make_extractor(schema1, resume_temp.name,
+                                            append=True)
+            restore_extractor(
+                extractor, state,
+                fingerprint=config_fingerprint(self.extraction_model_data))
+            assert extractor.fetch_count == \
+                records[i - 1]['stats']['fetch_count']
+            assert extractor.new_row_count == len(state.rows)
+            extractor.launch()
+            extractor.checkpoint.close()
+            assert extractor.flat_results() == expected_results
+
+            # The resumed run has appended to the checkpoint, which
+            # can be resumed again.
+            state = CheckpointState.load(resume_temp.name)
+            assert state.queue == []
+            assert len(state.rows) == sum(
+                [len(r) for t in extractor.results.values()
+                 for r in t.values()])
+
+    def test_fingerprint_mismatch(self, schema1):
+        temp = NamedTemporaryFile(suffix='.checkpoint')
+        extractor = self.make_extractor(schema1, temp.name).launch()
+        extractor.checkpoint.close()
+
+        state = CheckpointState.load(temp.name)
+        with pytest.raises(CheckpointError):
+            restore_extractor(extractor, state, fingerprint='foo')
+
+    def test_empty_checkpoint(self):
+        temp = NamedTemporaryFile(suffix='.checkpoint')
+        with pytest.raises(CheckpointError):
+            CheckpointState.load(temp.name)
@@ -0,0 +1,54 @@
+import pytest
+
+from abridger.extraction_model import ExtractionModel, Relation
+from abridger.extractor import Extractor
+from abridger.extractor.compiled_plan import make_key_getter
+from abridger.schema import SqliteSchema
+from test.unit.extractor.base import TestExtractorBase
+
+
+class TestCompiledPlan(TestExtractorBase):
+    @pytest.fixture()
+    def schema1(self):
+        for stmt in [
+            '''CREATE TABLE test1 (
+                id INTEGER PRIMARY KEY,
+                name TEXT
+            );''',
+            '''CREATE TABLE test2 (
+                id INTEGER PRIMARY KEY,
+                test1_id INTEGER NOT NULL REFERENCES test1,
+                other_id INTEGER REFERENCES test1
+            );''',
+        ]:
+            self.database.execute(stmt)
+        return SqliteSchema.create_from_conn(self.database.connection)
+
+    def test_make_key_getter(self):
+        assert make_key_getter([1])((1, 2, 3)) == (2,)
+        assert make_key_getter([2, 0])((1, 2, 3)) == (3, 1)
+
+    def test_compiled_plan(self, schema1):
+        extraction_model = ExtractionModel.load(schema1, [
+            {'subject': [{'tables': [{'table': 'test2'}]}]},
+            {'relations': [{'table': 'test2', 'column': 'other_id',
+                            'type': Relation.TYPE_OUTGOING,
+                            'sticky': True}]},
+        ])
+        extractor = Extractor(self.database, extraction_model)
+        table2 = schema1.tables_by_name['test2']
+        compiled_plan = extractor._compiled_plan(
+            extraction_model.subjects[0], table2)
+        assert extractor._compiled_plan(
+            extraction_model.subjects[0], table2) is compiled_plan
+
+        row = (5, 1, 2)
+        assert compiled_plan.epk_getter(row) == (5,)
+        assert sorted([(r[0].name, r[2](row), r[4])
+                       for r in compiled_plan.relations]) == [
+            ('test1', (1,), False),
+            ('test1', (2,), True),
+        ]
+
+        # The sticky relation is only followed by sticky work items
+        assert compiled_plan.null_indexes == {False: (2,), True: ()}
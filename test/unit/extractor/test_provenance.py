@@ -0,0 +1,118 @@
+from tempfile import NamedTemporaryFile
+import pytest
+
+from abridger.exc import ProvenanceError
+from abridger.extraction_model import ExtractionModel, Relation
+from abridger.extractor import Extractor
+from abridger.extractor.provenance import (Provenance, find_chain, find_key,
+                                           load_provenance)
+from abridger.schema import SqliteSchema
+from abridger.why import main
+from test.unit.extractor.base import TestExtractorBase
+
+
+class TestProvenance(TestExtractorBase):
+    @pytest.fixture()
+    def schema1(self):
+        for stmt in [
+            '''CREATE TABLE test1 (
+                id INTEGER PRIMARY KEY
+            );''',
+            '''CREATE TABLE test2 (
+                id INTEGER PRIMARY KEY,
+                test1_id INTEGER NOT NULL REFERENCES test1
+            );''',
+            '''CREATE TABLE test3 (
+                id INTEGER PRIMARY KEY,
+                test2_id INTEGER NOT NULL REFERENCES test2
+            );''',
+            'INSERT INTO test1 VALUES (1), (2)',
+            'INSERT INTO test2 VALUES (1, 1), (2, 1), (3, 2)',
+            'INSERT INTO test3 VALUES (1, 1), (2, 2), (3, 3)',
+        ]:
+            self.database.execute(stmt)
+        return SqliteSchema.create_from_conn(self.database.connection)
+
+    def extract(self, schema, explain=False):
+        extraction_model = ExtractionModel.load(schema, [
+            {'subject': [{'tables': [{'table': 'test1', 'column': 'id',
+                                      'values': 1}]}]},
+            {'relations': [{'table': 'test2', 'column': 'test1_id'},
+                           {'table': 'test3', 'column': 'test2_id'}]},
+        ])
+        provenance = Provenance()
+        Extractor(self.database, extraction_model, explain=explain,
+                  provenance=provenance).launch()
+        return provenance
+
+    @pytest.mark.parametrize('explain', [False, True])
+    def test_chain(self, schema1, explain):
+        provenance = self.extract(schema1, explain=explain)
+        assert str(provenance) == 'rows=5'
+        data = provenance.dump()
+        assert data['keys'] == {'test1': ['id'], 'test2': ['id'],
+                                'test3': ['id']}
+
+        assert find_chain(data, 'test3', (2,)) == [
+            ('test1', (1,), None),
+            ('test2', (2,), 'incoming test2.test1_id -> test1.id'),
+            ('test3', (2,), 'incoming test3.test2_id -> test2.id'),
+        ]
+        assert find_chain(data, 'test1', (1,)) == [('test1', (1,), None)]
+
+    def test_outgoing(self, schema1):
+        extraction_model = ExtractionModel.load(schema1, [
+            {'subject': [{'tables': [{'table': 'test3', 'column': 'id',
+                                      'values': 3}]}]},
+            {'relations': [{'table': 'test3', 'column': 'test2_id',
+                            'type': Relation.TYPE_OUTGOING}]},
+        ])
+        provenance = Provenance()
+        Extractor(self.database, extraction_model,
+                  provenance=provenance).launch()
+        assert find_chain(provenance.dump(), 'test1', (2,)) == [
+            ('test3', (3,), None),
+            ('test2', (3,), 'outgoing test3.test2_id -> test2.id'),
+            ('test1', (2,), 'outgoing test2.test1_id -> test1.id'),
+        ]
+
+    def test_find_key(self, schema1):
+        data = self.extract(schema1).dump()
+        assert find_key(data, 'test3', ['1']) == (1,)
+        for (table_name, values, message) in (
+                ('test4', ['1'], 'No rows of test4 were extracted'),
+                ('test3', ['1', '2'], 'The key of test3 is id'),
+                ('test3', ['3'], 'No row of test3 with id=3 was extracted')):
+            with pytest.raises(ProvenanceError) as e:
+                find_key(data, table_name, values)
+            assert message in str(e.value)
+
+    def test_write_and_load(self, schema1):
+        provenance = self.extract(schema1)
+        temp = NamedTemporaryFile(suffix='.prov')
+        provenance.write(temp.name)
+        assert load_provenance(temp.name) == provenance.dump()
+
+        with open(temp.name, 'wb') as f:
+            f.write(b'foo')
+        with pytest.raises(ProvenanceError):
+            load_provenance(temp.name)
+
+    def test_why(self, schema1, capsys):
+        provenance = self.extract(schema1)
+        temp = NamedTemporaryFile(suffix='.prov')
+        provenance.write(temp.name)
+
+        main([temp.name, 'test3', '2'])
+        out, err = capsys.readouterr()
+        assert out.split('\n') == [
+            'test1.id=1  subject',
+            'test2.id=2  via incoming test2.test1_id -> test1.id',
+            'test3.id=2  via incoming test3.test2_id -> test2.id',
+            '',
+        ]
+
+        with pytest.raises(SystemExit):
+            main([temp.name, 'test3', '3'])
+        out, err = capsys.readouterr()
+        assert 'No row of test3 with id=3 was extracted' in out
@@ -0,0 +1,76 @@
+from tempfile import NamedTemporaryFile
+import json
+import pytest
+
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+from abridger.schema import SqliteSchema
+from test.unit.extractor.base import TestExtractorBase
+
+
+class TestTraversalStats(TestExtractorBase):
+    @pytest.fixture()
+    def schema1(self):
+        for stmt in [
+            '''
+                CREATE TABLE departments (
+                    id INTEGER PRIMARY KEY
+                );
+            ''', '''
+                CREATE TABLE employees (
+                    id INTEGER PRIMARY KEY,
+                    department_id INTEGER NOT NULL REFERENCES departments
+                );
+            ''',
+            'INSERT INTO departments VALUES (1)',
+            'INSERT INTO departments VALUES (2)',
+            'INSERT INTO employees VALUES (1, 1)',
+            'INSERT INTO employees VALUES (2, 1)',
+            'INSERT INTO employees VALUES (3, 1)',
+            'INSERT INTO employees VALUES (4, 2)',
+        ]:
+            self.database.execute(stmt)
+        return SqliteSchema.create_from_conn(self.database.connection)
+
+    def extract(self, schema):
+        data = [{'subject': [
+            {'tables': [{'table': 'departments', 'column': 'id',
+                         'values': 1}]},
+            {'relations': [{'table': 'employees',
+                            'column': 'department_id'}]}]}]
+        model = ExtractionModel.load(schema, data)
+        return Extractor(self.database, model).launch()
+
+    def test_report(self, schema1):
+        report = self.extract(schema1).traversal_stats.report()
+        edges = [(e['src_table'], e['dst_table'], e['cols'], e['direction'],
+                  e['queries'], e['values'], e['rows'], e['new_rows'],
+                  e['fan_out']) for e in report['edges']]
+        assert edges == [
+            ('departments', 'employees', 'department_id', 'incoming',
+             1, 1, 3, 3, 3.0),
+            (None, 'departments', 'id', 'subject', 1, 1, 1, 1, 1.0),
+            ('employees', 'departments', 'id', 'outgoing', 1, 1, 1, 0, 1.0),
+        ]
+        assert report['edges'][0]['row_share'] == 0.6
+        assert report['edges'][0]['sticky'] is False
+        assert report['edges'][1]['sticky'] is True
+
+        depths = [(d['depth'], d['queries'], d['rows'], d['new_rows'])
+                  for d in report['depths']]
+        assert depths == [(0, 1, 1, 1), (1, 1, 3, 3), (2, 1, 1, 0)]
+
+    def test_write(self, schema1):
+        stats = self.extract(schema1).traversal_stats
+        with NamedTemporaryFile(mode='w+t', suffix='.json') as f:
+            stats.write(f.name)
+            assert json.load(f) == stats.report()
+
+        with NamedTemporaryFile(mode='w+t', suffix='.dot') as f:
+            stats.write(f.name)
+            dot = f.read()
+        assert dot.startswith('digraph G {')
+        assert '"departments" -> "employees" [label="department_id ' \
+            'incoming\\nqueries=1 rows=3 (60%) new=3\\nfan-out=3.0", ' \
+            'penwidth=3.4];' in dot
+        assert '"(subject)" -> "departments"' in dot
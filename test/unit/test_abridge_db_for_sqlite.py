@@ -1,12 +1,19 @@
 from sqlite3 import OperationalError
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
+import json
+import mock
 import os
 import pytest
+import shutil
 import subprocess
 
 from abridger.abridge_db import main
 from abridger.database.sqlite import SqliteDatabase
+from abridger.exc import QueryTimeoutError
+from abridger.extractor.provenance import load_provenance
 from test.abridge_db_test_utils import TestAbridgeDbBase
+from test.unit.test_hooks import EventHooks
+from test.unit.utils import make_temp_yaml_file
 
 
 class TestAbridgeDbForSqlite(TestAbridgeDbBase):
@@ -27,12 +34,13 @@ class TestAbridgeDbForSqlite(TestAbridgeDbBase):
             self.create_schema(dst_conn)
         self.dst_database.disconnect()
 
-    def run_with_dst_database(self, explain=False, verbosity=1):
+    def run_with_dst_database(self, explain=False, verbosity=1,
+                              extra_args=None):
         src_url = self.src_database.url()
         dst_url = self.dst_database.url()
         super(TestAbridgeDbForSqlite, self).run_with_dst_database(
             src_url, dst_url, self.dst_database, explain=explain,
-            verbosity=verbosity)
+            verbosity=verbosity, extra_args=extra_args)
 
     def test_success(self, capsys):
         self.prepare_src()
@@ -40,6 +48,46 @@ class TestAbridgeDbForSqlite(TestAbridgeDbBase):
         self.run_with_dst_database()
         out, err = capsys.readouterr()
 
+    def test_fast_load(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        self.dst_database.connect()
+        self.dst_database.execute(
+            'CREATE INDEX test2_test1_id_idx ON test2(test1_id)')
+        self.dst_database.disconnect()
+
+        self.run_with_dst_database(extra_args=['--fast-load'])
+        out, err = capsys.readouterr()
+        assert 'Rebuilding indexes...' in out
+
+        self.dst_database.connect()
+        rows = self.dst_database.execute_and_fetchall(
+            "SELECT name FROM sqlite_master WHERE type='index'")
+        assert rows == [('test2_test1_id_idx',)]
+        self.dst_database.disconnect()
+
+    def test_direct(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(extra_args=['--direct', '--fast-load'])
+        out, err = capsys.readouterr()
+        assert 'Copied 5 rows and performed 2 updates' in out
+
+    def test_direct_args(self, capsys):
+        with pytest.raises(SystemExit):
+            main(['foo', 'bar', '-f', 'bar', '--direct'])
+        out, err = capsys.readouterr()
+        assert '--direct can only be used with -u' in out
+
+    def test_fast_load_args(self, capsys):
+        for args in (['-f', 'bar', '--fast-load'],
+                     ['-u', 'bar', '--unlogged']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'bar'] + args)
+        out, err = capsys.readouterr()
+        assert '--fast-load can only be used with -u' in out
+        assert '--unlogged can only be used with --fast-load' in out
+
     def test_failure_rollback(self, capsys):
         self.prepare_src()
         self.prepare_dst(with_schema=False)
@@ -101,6 +149,319 @@ class TestAbridgeDbForSqlite(TestAbridgeDbBase):
         assert 'Inserting' in out
         assert 'Updating' in out
 
+    def test_governor(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(verbosity=2, extra_args=[
+            '--max-qps', '1000', '--statement-timeout', '10'])
+        out, err = capsys.readouterr()
+        assert 'table test1 (queries=0 rows=0 throttled=' in out
+        assert 'Throttling: queries=3 rows=7 throttled=' in out
+
+    def test_statement_timeout(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        execute = SqliteDatabase._execute_and_fetchall
+
+        def execute_with_timeout(database, timeout, stmt, values):
+            if 'FROM test2' in stmt:
+                raise QueryTimeoutError(
+                    'Query took longer than %s seconds' % timeout)
+            return execute(database, stmt, values)
+
+        with mock.patch.object(SqliteDatabase,
+                               '_execute_and_fetchall_with_timeout',
+                               execute_with_timeout):
+            with pytest.raises(SystemExit):
+                self.run_with_dst_database(extra_args=[
+                    '--statement-timeout', '10'])
+        out, err = capsys.readouterr()
+        assert 'Fetching the rows of test2 with id=1 failed: ' \
+            'Query took longer than 10.0 seconds' in out
+        assert 'Traceback' not in err
+
+    def test_checkpoint_and_resume(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        checkpoint = NamedTemporaryFile(suffix='.checkpoint')
+        self.run_with_dst_database(extra_args=[
+            '--checkpoint', checkpoint.name])
+
+        # Resuming a completed extraction doesn't do any queries
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(extra_args=['--resume', checkpoint.name])
+        out, err = capsys.readouterr()
+        assert 'Resuming with 0 queued work items and 7 fetched rows' in out
+        assert 'queries=3' in out
+
+    def test_checkpoint_args(self, capsys):
+        for args in (['-e', '--resume', 'foo'],
+                     ['-f', 'foo', '--resume', 'foo', '--checkpoint', 'foo']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'bar'] + args)
+        out, err = capsys.readouterr()
+        assert '--checkpoint and --resume can\'t be used with -e' in out
+        assert '--checkpoint can\'t be used with --resume' in out
+
+    def test_fetch_cache(self, capsys):
+        self.prepare_src()
+        cache = NamedTemporaryFile(suffix='.sqlite3')
+        for i in range(2):
+            self.prepare_dst(with_schema=True)
+            self.run_with_dst_database(extra_args=[
+                '--fetch-cache', cache.name])
+        out, err = capsys.readouterr()
+        assert 'Fetch cache: hits=0 misses=5 ' in out
+        assert 'Fetch cache: hits=5 misses=0 ' in out
+
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(extra_args=[
+            '--fetch-cache', cache.name, '--invalidate-fetch-cache'])
+        out, err = capsys.readouterr()
+        assert 'Removed 5 entries from the fetch cache' in out
+        assert 'Fetch cache: hits=0 misses=5 ' in out
+
+    def test_fetch_cache_args(self, capsys):
+        for args in (['-f', 'foo', '--invalidate-fetch-cache'],
+                     ['-f', 'foo', '--fetch-cache', 'foo', '--incremental',
+                      'foo']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'bar'] + args)
+        out, err = capsys.readouterr()
+        assert '--fetch-cache-source and --invalidate-fetch-cache can only ' \
+            'be used with --fetch-cache' in out
+        assert '--fetch-cache can\'t be used with --incremental' in out
+
+    def test_record_and_replay(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        recording = NamedTemporaryFile(suffix='.rec')
+        self.run_with_dst_database(extra_args=['--record', recording.name])
+        out, err = capsys.readouterr()
+        assert 'Recording: calls=3 rows=7' in out
+
+        # The source isn't needed anymore
+        self.src_database.disconnect()
+        self.src.close()
+        self.prepare_dst(with_schema=True)
+        super(TestAbridgeDbForSqlite, self).run_with_dst_database(
+            'replay://%s' % recording.name, self.dst_database.url(),
+            self.dst_database)
+        out, err = capsys.readouterr()
+        assert 'Replaying %s' % recording.name in out
+
+    def test_record_and_replay_args(self, capsys):
+        for args in (['--record', 'foo', '--plan'],
+                     ['-u', 'foo', '--direct']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'replay://bar'] + args)
+        with pytest.raises(SystemExit):
+            main(['foo', 'replay://bar', '-f', 'foo'])
+        out, err = capsys.readouterr()
+        assert '--record can\'t be used with --plan' in out
+        assert '--direct can\'t be used with a replay:// source' in out
+        assert '-f can\'t be used with a replay:// source' in out
+
+    def test_provenance(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        provenance = NamedTemporaryFile(suffix='.prov')
+        self.run_with_dst_database(extra_args=['--provenance',
+                                               provenance.name])
+        out, err = capsys.readouterr()
+        assert 'Provenance: rows=5' in out
+        assert load_provenance(provenance.name)['keys']['test1'] == ['id']
+
+    def test_provenance_args(self, capsys):
+        for args in (['--plan'], ['-u', 'bar', '--resume', 'foo'],
+                     ['-u', 'bar', '--incremental', 'foo']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'bar', '--provenance', 'baz'] + args)
+            out, err = capsys.readouterr()
+            assert '--provenance can\'t be used with --plan, --resume or ' \
+                '--incremental' in out
+
+    @pytest.mark.parametrize('direct', [False, True])
+    def test_hooks(self, capsys, direct):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        del EventHooks.events[:]
+        self.run_with_dst_database(extra_args=[
+            '--hooks', 'test.unit.test_hooks:EventHooks'] + (
+            ['--direct'] if direct else []))
+        self.check_dst_database(self.dst_database)
+
+        events = EventHooks.events
+        assert [e[1] for e in events if e[0] == 'phase_start'] == [
+            'extraction', 'generation', 'output']
+        assert len([e for e in events if e[0] == 'query']) == 3
+        assert [e for e in events if e[0] == 'table_emitted'] == [
+            ('table_emitted', 'test1', 3),
+            ('table_emitted', 'test2', 2),
+        ]
+
+    def test_hooks_args(self, capsys):
+        with pytest.raises(SystemExit):
+            main(['foo', 'bar', '-f', 'baz', '--hooks', 'foo'])
+        out, err = capsys.readouterr()
+        assert 'Hooks must be given as module:callable' in out
+
+    def test_schema_cache(self, capsys):
+        self.prepare_src()
+        directory = mkdtemp()
+        try:
+            for i in range(2):
+                self.prepare_dst(with_schema=True)
+                self.run_with_dst_database(verbosity=2, extra_args=[
+                    '--schema-cache', directory])
+                self.check_dst_database(self.dst_database)
+        finally:
+            shutil.rmtree(directory)
+        out, err = capsys.readouterr()
+        assert 'Schema cache: hits=1 misses=2' in out
+        assert 'Schema cache: hits=3 misses=0' in out
+
+    def test_prune_schema(self, capsys):
+        self.prepare_src()
+        self.src_database.connect()
+        self.src_database.execute(
+            'CREATE TABLE unrelated (id INTEGER PRIMARY KEY)')
+        self.src_database.connection.commit()
+        self.src_database.disconnect()
+
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(verbosity=2,
+                                   extra_args=['--prune-schema'])
+        self.check_dst_database(self.dst_database)
+        out, err = capsys.readouterr()
+        assert 'Introspected 2 tables' in out
+
+    def test_stats_json(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        stats_file = NamedTemporaryFile(mode='w+t', suffix='.json')
+        self.run_with_dst_database(extra_args=['--stats-json',
+                                               stats_file.name])
+        self.check_dst_database(self.dst_database)
+        stats = json.load(stats_file)
+
+        assert [p['name'] for p in stats['phases']] == [
+            'config', 'connect', 'introspection', 'extraction', 'generation',
+            'output']
+        assert sorted(stats['tables'].keys()) == ['test1', 'test2']
+        assert stats['tables']['test1']['rows'] == 5
+        assert stats['totals']['queries'] == 3
+        assert stats['totals']['rows'] == 7
+
+    def test_traversal_stats(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        stats_file = NamedTemporaryFile(mode='w+t', suffix='.json')
+        self.run_with_dst_database(extra_args=['--traversal-stats',
+                                               stats_file.name])
+        stats = json.load(stats_file)
+        assert sum([e['rows'] for e in stats['edges']]) == 7
+        assert [d['depth'] for d in stats['depths']] == [0, 1, 2]
+
+    def test_check_indexes(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(extra_args=['--check-indexes'])
+        out, err = capsys.readouterr()
+        assert 'Warning: no index' not in out
+
+        # Extracting test1's rows makes lookups of test2 rows by test1_id
+        self.make_config_tempfile = lambda: make_temp_yaml_file([
+            {'relations': [{'table': 'test2', 'column': 'test1_id'}]},
+            {'subject': [{'tables': [{'table': 'test1'}]}]}])
+        with pytest.raises(SystemExit):
+            self.run_with_dst_database(explain=True,
+                                       extra_args=['--check-indexes'])
+        out, err = capsys.readouterr()
+        assert 'Warning: no index for lookups on test2 (test1_id) ~3 ' \
+            'rows: incoming from test1' in out
+
+    def test_plan(self, capsys):
+        self.prepare_src()
+        config_tempfile = self.make_config_tempfile()
+        with pytest.raises(SystemExit):
+            main([config_tempfile.name, self.src_database.url(), '--plan',
+                  '--plan-max-rows', '2'])
+        out, err = capsys.readouterr()
+        assert 'Estimated total: 5 rows in 3 queries' in out
+        assert 'Warning: test1 is estimated to exceed 2 rows' in out
+
+    def test_plan_args(self, capsys):
+        for args in (['--plan', '-e'], ['--plan', '-f', 'foo'],
+                     ['-f', 'foo', '--plan-max-rows', '1']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'bar'] + args)
+        out, err = capsys.readouterr()
+        assert '--plan can\'t be used with -e' in out
+        assert '-f is meaningless when using --plan' in out
+        assert '--plan-max-rows can only be used with --plan' in out
+
+    @pytest.mark.parametrize('estimate', [False, True])
+    def test_progress(self, capsys, estimate):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        self.run_with_dst_database(extra_args=['--progress', 'json'] + (
+            ['--progress-estimate'] if estimate else []))
+        self.check_dst_database(self.dst_database)
+        out, err = capsys.readouterr()
+        reports = [json.loads(line) for line in err.splitlines()]
+        assert [r['phase'] for r in reports if r['done']] == [
+            'extraction', 'generation', 'output']
+        assert reports[0]['queries'] == 3
+        assert reports[0]['rows'] == 5
+        assert reports[0]['total_rows'] == (5 if estimate else None)
+        assert reports[-1]['rows'] == 7
+
+    def test_progress_args(self, capsys):
+        with pytest.raises(SystemExit):
+            main(['foo', 'bar', '-f', 'baz', '--progress-estimate'])
+        out, err = capsys.readouterr()
+        assert '--progress-estimate can only be used with --progress' in out
+
+    def test_memory_report(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        report_file = NamedTemporaryFile(mode='w+t', suffix='.json')
+        self.run_with_dst_database(extra_args=[
+            '--memory-report', '--memory-report-json', report_file.name,
+            '--memory-sample-interval', '2'])
+        self.check_dst_database(self.dst_database)
+        out, err = capsys.readouterr()
+        assert 'Phase' in out
+
+        samples = json.load(report_file)['samples']
+        assert [s['name'] for s in samples] == [
+            'schema', 'extraction:2', 'extraction', 'generation', 'output']
+        assert samples[2]['rows'] == 5
+        assert sorted(samples[2]['structures'].keys()) == [
+            'results', 'seen_work_items', 'work_queue']
+        assert sorted(samples[3]['structures'].keys()) == [
+            'delete_statements', 'insert_statements', 'update_statements']
+
+    def test_query_journal(self, capsys):
+        self.prepare_src()
+        self.prepare_dst(with_schema=True)
+        journal_file = NamedTemporaryFile(mode='w+t', suffix='.jsonl')
+        self.run_with_dst_database(extra_args=[
+            '--query-journal', journal_file.name,
+            '--explain-slower-than', '0'])
+        self.check_dst_database(self.dst_database)
+        entries = [json.loads(line) for line in journal_file]
+        assert len(entries) == 3
+        assert sum([e['rows'] for e in entries]) == 7
+        assert all(['explain' in e for e in entries])
+
+    def test_explain_slower_than_without_query_journal(self, capsys):
+        with pytest.raises(SystemExit):
+            main(['foo', 'bar', '-f', 'bar', '--explain-slower-than', '1'])
+        out, err = capsys.readouterr()
+        assert 'can only be used with --query-journal' in out
+
     def test_f_and_u_args_mutual_exclusion(self, capsys):
         with pytest.raises(SystemExit):
             main(['foo', 'bar', '-u', 'foo', '-f', 'bar'])
@@ -0,0 +1,91 @@
+from tempfile import NamedTemporaryFile
+import pytest
+
+from abridger.api import (abridge, abridge_statements, InsertStatement,
+                          TableRows, UpdateStatement)
+from abridger.database.sqlite import SqliteDatabase
+from abridger.schema import SqliteSchema
+from test.unit.test_hooks import EventHooks
+from test.unit.utils import make_temp_yaml_file
+
+
+class TestApi(object):
+    # test1 and test2 reference each other and only test2 -> test1 is
+    # not null, so test1.test2_id is set with an update.
+    CONFIG = [
+        {'subject': [{'tables': [{'table': 'test1', 'column': 'id',
+                                  'values': 1}]}]},
+        {'relations': [{'table': 'test2', 'column': 'test1_id'}]},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, sqlite_database):
+        for stmt in [
+            '''CREATE TABLE test1 (
+                id INTEGER PRIMARY KEY,
+                test2_id INTEGER REFERENCES test2
+            );''',
+            '''CREATE TABLE test2 (
+                id INTEGER PRIMARY KEY,
+                test1_id INTEGER NOT NULL REFERENCES test1
+            );''',
+            'INSERT INTO test1 VALUES (1, NULL), (2, NULL)',
+            'INSERT INTO test2 VALUES (1, 1), (2, 1), (3, 2)',
+            'UPDATE test1 SET test2_id = 2 WHERE id = 1',
+        ]:
+            sqlite_database.execute(stmt)
+        sqlite_database.create_schema(SqliteSchema)
+        self.database = sqlite_database
+
+    def test_abridge(self, capsys):
+        results = list(abridge(self.database, self.CONFIG))
+        assert [(table.name, rows) for table, rows in results] == [
+            ('test1', [(1, 2)]),
+            ('test2', [(1, 1), (2, 1)]),
+        ]
+        assert isinstance(results[0], TableRows)
+        assert results[0].col_names == ['id', 'test2_id']
+
+        # Each table's rows are split in batches
+        iterator = abridge(self.database, self.CONFIG, batch_size=1)
+        assert [r.rows for r in iterator] == [[(1, 2)], [(1, 1)], [(2, 1)]]
+
+        out, err = capsys.readouterr()
+        assert out == ''
+
+    def test_abridge_statements(self):
+        statements = list(abridge_statements(self.database, self.CONFIG))
+        assert [type(s) for s in statements] == [
+            InsertStatement, InsertStatement, InsertStatement,
+            UpdateStatement]
+        assert [s.values for s in statements] == [
+            (1, None), (1, 1), (2, 1), (2,)]
+        assert [c.name for c in statements[3].cols] == ['test2_id']
+        assert statements[3].pk_values == (1,)
+
+    def test_hooks(self):
+        hooks = EventHooks()
+        del hooks.events[:]
+        list(abridge(self.database, self.CONFIG, hooks=hooks))
+        assert [e for e in hooks.events if e[0] == 'table_emitted'] == [
+            ('table_emitted', 'test1', 1),
+            ('table_emitted', 'test2', 2),
+        ]
+        assert ('phase_end', 'extraction') in hooks.events
+        assert self.database.hooks is None
+
+    def test_abridge_url(self, capsys):
+        src = NamedTemporaryFile(suffix='.sqlite3')
+        database = SqliteDatabase(src.name)
+        for stmt in ['CREATE TABLE test1 (id INTEGER PRIMARY KEY)',
+                     'INSERT INTO test1 VALUES (1), (2)']:
+            database.execute(stmt)
+        database.connection.commit()
+        database.disconnect()
+
+        config = make_temp_yaml_file([{'subject': [{'tables': [
+            {'table': 'test1', 'column': 'id', 'values': 2}]}]}])
+        results = abridge('sqlite:///%s' % src.name, config.name)
+        assert [(t.name, rows) for t, rows in results] == [('test1', [(2,)])]
+        out, err = capsys.readouterr()
+        assert out == ''
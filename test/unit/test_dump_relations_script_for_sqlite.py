@@ -1,3 +1,7 @@
+from tempfile import mkdtemp
+import os
+import shutil
+
 from abridger.dump_relations import main
 
 
@@ -8,3 +12,14 @@ class TestDumpRelationsScriptForSqlite(object):
         sqlite_database.disconnect()
         main([url])
         out, err = capsys.readouterr()
+
+    def test_schema_cache(self, capsys, sqlite_database):
+        url = 'sqlite://%s' % (sqlite_database.path)
+        sqlite_database.disconnect()
+        directory = mkdtemp()
+        try:
+            for i in range(2):
+                main([url, '--schema-cache', directory])
+            assert len(os.listdir(directory)) == 1
+        finally:
+            shutil.rmtree(directory)
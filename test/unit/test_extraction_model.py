@@ -46,7 +46,8 @@ class TestExtractionModel(TestExtractionModelBase):
 
     def test_toplevel_key_value(self):
         # Check bad None value for top level keys
-        for key in ('subject', 'relations', 'not-null-columns'):
+        for key in ('subject', 'relations', 'not-null-columns',
+                    'change-tracking-columns'):
             with pytest.raises(ValidationError) as e:
                 data = [{key: None}]
                 ExtractionModel.load(self.schema_sl, data)
@@ -433,6 +434,36 @@ class TestExtractionModel(TestExtractionModelBase):
         with pytest.raises(UnknownColumnError):
             ExtractionModel.load(self.schema_sl, data)
 
+    def test_change_tracking_cols(self):
+        relation = dict(self.relations[0])
+        table = relation['table']
+        col = relation['column']
+
+        with pytest.raises(ValidationError) as e:
+            data = [{'change-tracking-columns': [{'table': table}]}]
+            ExtractionModel.load(self.schema_sl, data)
+        assert "'column' is a required property" in str(e)
+
+        data = [
+            {'change-tracking-columns': [{'table': table, 'column': col}]}]
+        model = ExtractionModel.load(self.schema_sl, data)
+        assert len(model.change_tracking_cols) == 1
+        (table_obj, col_obj) = list(model.change_tracking_cols.items())[0]
+        assert table_obj.name == table
+        assert col_obj.name == col
+
+        data = [
+            {'change-tracking-columns': [{'table': table, 'column': 'foo'}]}]
+        with pytest.raises(UnknownColumnError):
+            ExtractionModel.load(self.schema_sl, data)
+
+        # Only one column per table
+        data = [
+            {'change-tracking-columns': [{'table': table, 'column': col},
+                                         {'table': table, 'column': col}]}]
+        with pytest.raises(InvalidConfigError):
+            ExtractionModel.load(self.schema_sl, data)
+
     def test_not_null_cols_must_be_a_foreign_key(self):
         # The assumption there is that the first table doesn't have any
         # foreign keys.
@@ -0,0 +1,140 @@
+from tempfile import NamedTemporaryFile
+import mock
+import pytest
+
+from abridger.database import SqliteDatabase
+from abridger.database.fetch_cache import FetchCache
+from abridger.schema import SqliteSchema
+
+
+class TestFetchCache(object):
+    @pytest.fixture(autouse=True)
+    def prepare(self, request):
+        self.src = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+        self.cache_file = NamedTemporaryFile(suffix='.sqlite3')
+        database = SqliteDatabase(self.src.name)
+        for stmt in [
+            '''CREATE TABLE test1 (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                value INTEGER)''',
+            "INSERT INTO test1 VALUES (1, 'one', 10)",
+            "INSERT INTO test1 VALUES (2, 'two', 10)",
+            "INSERT INTO test1 VALUES (3, 'three', 30)",
+        ]:
+            database.execute(stmt)
+        database.connection.commit()
+        database.disconnect()
+
+        self.database = SqliteDatabase(self.src.name)
+        self.table = self.database.schema.tables_by_name['test1']
+        self.cache = self.make_cache()
+        self.database.fetch_cache = self.cache
+
+        def fin():
+            self.cache.close()
+            self.database.disconnect()
+        request.addfinalizer(fin)
+
+    def make_cache(self, source='src', max_size=None):
+        return FetchCache(self.cache_file.name, source, max_size=max_size)
+
+    def col(self, name):
+        return (self.table.cols_by_name[name],)
+
+    def fetch(self, col_name, values):
+        with mock.patch.object(
+                self.database, '_execute_and_fetchall',
+                wraps=self.database._execute_and_fetchall) as execute:
+            if col_name is None:
+                rows = self.database.fetch_rows(self.table, None, None)
+            else:
+                rows = self.database.fetch_rows(self.table,
+                                                self.col(col_name), values)
+            return (sorted(rows), execute.call_count)
+
+    def test_fetch_rows(self):
+        assert self.fetch('value', [(10,), (20,)]) == (
+            [(1, 'one', 10), (2, 'two', 10)], 1)
+        assert (self.cache.hit_count, self.cache.miss_count) == (0, 2)
+
+        # Both values are cached, including the one without rows
+        assert self.fetch('value', [(20,), (10,)]) == (
+            [(1, 'one', 10), (2, 'two', 10)], 0)
+
+        # Only the missing value is queried
+        assert self.fetch('value', [(10,), (30,)]) == (
+            [(1, 'one', 10), (2, 'two', 10), (3, 'three', 30)], 1)
+        assert (self.cache.hit_count, self.cache.miss_count) == (3, 3)
+
+        assert self.fetch(None, None)[1] == 1
+        assert self.fetch(None, None) == (
+            [(1, 'one', 10), (2, 'two', 10), (3, 'three', 30)], 0)
+
+    def test_persistence(self):
+        self.fetch('id', [(1,)])
+        self.cache.close()
+
+        self.cache = self.make_cache()
+        self.database.fetch_cache = self.cache
+        assert self.fetch('id', [(1,)]) == ([(1, 'one', 10)], 0)
+
+        # Other sources don't share entries
+        self.cache.close()
+        self.cache = self.make_cache(source='other')
+        self.database.fetch_cache = self.cache
+        assert self.fetch('id', [(1,)]) == ([(1, 'one', 10)], 1)
+
+    def test_type_mismatch(self):
+        # sqlite converts '1' to an integer, so the fetched row can't be
+        # attributed to the value and isn't cached.
+        assert self.fetch('id', [('1',)]) == ([(1, 'one', 10)], 1)
+        assert self.fetch('id', [('1',)]) == ([(1, 'one', 10)], 1)
+
+    def test_eviction(self):
+        self.cache.close()
+        self.cache = self.make_cache(max_size=60)
+        self.database.fetch_cache = self.cache
+
+        for i in (1, 2, 3):
+            self.fetch('id', [(i,)])
+        assert self.cache.eviction_count > 0
+        assert self.cache.size <= 60
+
+        # The most recently used row is still there, the oldest isn't
+        assert self.fetch('id', [(3,)])[1] == 0
+        assert self.fetch('id', [(1,)])[1] == 1
+
+    def test_invalidate(self):
+        self.fetch('id', [(1,), (2,)])
+        self.fetch('value', [(10,)])
+        assert self.cache.size > 0
+        assert self.cache.invalidate(self.table) == 3
+        assert self.cache.size == 0
+        assert self.fetch('id', [(1,)])[1] == 1
+
+    def test_unpicklable_rows(self):
+        assert self.cache.put(self.table, self.col('id'),
+                              {(1,): [((x for x in []),)]}) is False
+        assert self.cache.size == 0
+
+    def test_table_change(self):
+        self.fetch('id', [(1,)])
+        self.database.execute('ALTER TABLE test1 ADD COLUMN extra TEXT')
+        self.database.create_schema(SqliteSchema)
+        self.table = self.database.schema.tables_by_name['test1']
+
+        # Rows cached before the column was added aren't reused
+        assert self.fetch('id', [(1,)]) == ([(1, 'one', 10, None)], 1)
+        assert self.fetch('id', [(1,)]) == ([(1, 'one', 10, None)], 0)
+
+    def test_wal_fingerprint(self):
+        writer = SqliteDatabase(self.src.name)
+        writer.execute('PRAGMA journal_mode=WAL')
+        fingerprint = self.database.cache_fingerprint()
+
+        # The write stays in the WAL while the writer is connected
+        writer.execute("INSERT INTO test1 VALUES (4, 'four', 40)")
+        writer.connection.commit()
+        assert self.database.cache_fingerprint() != fingerprint
+        writer.disconnect()
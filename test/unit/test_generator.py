@@ -349,6 +349,11 @@ class TestGenerator(TestExtractorBase):
         generator.generate_statements()
         self.check_statements(generator, inserts, updates)
 
+        # The same updates can be generated without the inserts
+        generator.generate_update_statements()
+        self.check_statements(generator, [], updates)
+        assert generator.table_insert_statements(table3) == [inserts[0]]
+
     @pytest.mark.parametrize('table, start, end', [
         ('test1', 0, 3),
         ('test2', 3, 5),
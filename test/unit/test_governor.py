@@ -0,0 +1,89 @@
+import mock
+import pytest
+
+from abridger.database.governor import Governor
+from abridger.exc import QueryTimeoutError
+from abridger.schema import SqliteSchema
+
+
+class TestGovernor(object):
+    @pytest.fixture(autouse=True)
+    def prepare(self, sqlite_database):
+        self.database = sqlite_database
+        self.database.execute(
+            'CREATE TABLE test1 (id INTEGER PRIMARY KEY, name TEXT)')
+        for i in range(1, 9):
+            self.database.execute(
+                "INSERT INTO test1 VALUES (%d, 'name%d')" % (i, i))
+        self.schema = SqliteSchema.create_from_conn(self.database.connection)
+        self.table = self.schema.tables[0]
+
+    @mock.patch('abridger.database.governor.sleep')
+    @mock.patch('abridger.database.governor.time', return_value=100)
+    def test_max_qps(self, time, sleep):
+        governor = Governor(max_qps=4)
+        self.database.governor = governor
+        for i in range(3):
+            self.database.fetch_rows(self.table, None, None)
+
+        assert [c[0][0] for c in sleep.call_args_list] == [0.25, 0.5]
+        assert governor.query_count == 3
+        assert governor.row_count == 24
+        assert governor.throttled_time == 0.75
+
+    @mock.patch('abridger.database.governor.sleep')
+    @mock.patch('abridger.database.governor.time', return_value=100)
+    def test_max_rows_per_second(self, time, sleep):
+        governor = Governor(max_rows_per_second=16)
+        self.database.governor = governor
+        for i in range(3):
+            self.database.fetch_rows(self.table, None, None)
+
+        assert [c[0][0] for c in sleep.call_args_list] == [0.5, 1.0]
+
+    def test_max_concurrent_queries(self):
+        governor = Governor(max_concurrent_queries=1)
+        self.database.governor = governor
+        self.database.fetch_rows(self.table, None, None)
+        assert governor.semaphore.acquire(False)
+
+    def test_statement_timeout(self):
+        self.database.governor = Governor(statement_timeout=0.01)
+        with pytest.raises(QueryTimeoutError):
+            self.database.execute_and_fetchall('''
+                WITH RECURSIVE c(x) AS (
+                    SELECT 1 UNION ALL SELECT x + 1 FROM c)
+                SELECT max(x) FROM c''')
+        assert self.database.governor.timeout_count == 1
+
+        # The connection is still usable
+        assert len(self.database.fetch_rows(self.table, None, None)) == 8
+
+    def test_split_on_timeout(self):
+        governor = Governor(statement_timeout=10)
+        self.database.governor = governor
+        execute = self.database._execute_and_fetchall
+
+        # Pretend that queries for everything or for more than two values
+        # time out
+        def execute_with_timeout(timeout, stmt, values):
+            if len(values) == 0 or len(values) > 2:
+                raise QueryTimeoutError('Query took too long')
+            return execute(stmt, values)
+
+        self.database._execute_and_fetchall_with_timeout = \
+            execute_with_timeout
+
+        values = [(i,) for i in range(1, 9)]
+        rows = self.database.fetch_rows(self.table, self.table.cols[:1],
+                                        values)
+        assert sorted(rows) == [(i, 'name%d' % i) for i in range(1, 9)]
+        assert governor.split_count == 3
+        assert governor.timeout_count == governor.split_count
+        assert 'splits=3' in str(governor)
+
+        # The error names what couldn't be fetched
+        with pytest.raises(QueryTimeoutError) as e:
+            self.database.fetch_rows(self.table, None, None)
+        assert str(e.value) == \
+            'Fetching all rows of test1 failed: Query took too long'
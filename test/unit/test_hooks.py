@@ -0,0 +1,109 @@
+import pytest
+
+from abridger.exc import HooksError
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+from abridger.generator import Generator
+from abridger.hooks import Hooks, TableEmitter, load_hooks
+from abridger.schema import SqliteSchema
+from test.unit.extractor.base import TestExtractorBase
+
+
+class EventHooks(Hooks):
+    '''Records the callbacks without times, in a class attribute so that
+       tests can get at the hooks made by load_hooks.'''
+    events = []
+
+    def on_phase_start(self, name):
+        self.events.append(('phase_start', name))
+
+    def on_phase_end(self, name, elapsed_time):
+        self.events.append(('phase_end', name))
+
+    def on_query(self, table, cols, n_keys, latency, rows):
+        self.events.append(('query', table.name,
+                            [c.name for c in cols] if cols else None,
+                            n_keys, rows))
+
+    def on_work_item(self, work_item, rows, new_rows, elapsed_time):
+        self.events.append(('work_item', work_item.table.name, rows,
+                            new_rows))
+
+    def on_rows_merged(self, table, rows, new_rows):
+        self.events.append(('rows_merged', table.name, rows, new_rows))
+
+    def on_table_emitted(self, table, rows):
+        self.events.append(('table_emitted', table.name, rows))
+
+
+class TestHooks(TestExtractorBase):
+    @pytest.fixture()
+    def schema1(self):
+        for stmt in [
+            '''CREATE TABLE test1 (
+                id INTEGER PRIMARY KEY
+            );''',
+            '''CREATE TABLE test2 (
+                id INTEGER PRIMARY KEY,
+                test1_id INTEGER NOT NULL REFERENCES test1
+            );''',
+            'INSERT INTO test1 VALUES (1), (2)',
+            'INSERT INTO test2 VALUES (1, 1), (2, 1), (3, 2)',
+        ]:
+            self.database.execute(stmt)
+        return SqliteSchema.create_from_conn(self.database.connection)
+
+    def test_extraction_and_generation(self, schema1):
+        extraction_model = ExtractionModel.load(schema1, [
+            {'subject': [{'tables': [{'table': 'test1', 'column': 'id',
+                                      'values': 1}]}]},
+            {'relations': [{'table': 'test2', 'column': 'test1_id'}]},
+        ])
+        hooks = EventHooks()
+        del hooks.events[:]
+        self.database.hooks = hooks
+        extractor = Extractor(self.database, extraction_model, hooks=hooks)
+        extractor.launch()
+        Generator(schema1, extractor, hooks=hooks)
+        assert hooks.events == [
+            ('phase_start', 'extraction'),
+            ('query', 'test1', ['id'], 1, 1),
+            ('rows_merged', 'test1', 1, 1),
+            ('work_item', 'test1', 1, 1),
+            ('query', 'test2', ['test1_id'], 1, 2),
+            ('rows_merged', 'test2', 2, 2),
+            ('work_item', 'test2', 2, 2),
+            ('query', 'test1', ['id'], 1, 1),
+            ('rows_merged', 'test1', 1, 0),
+            ('work_item', 'test1', 1, 0),
+            ('phase_end', 'extraction'),
+            ('phase_start', 'generation'),
+            ('phase_end', 'generation'),
+        ]
+
+    def test_table_emitter(self, schema1):
+        hooks = EventHooks()
+        del hooks.events[:]
+        (table1, table2) = schema1.tables
+        emitter = TableEmitter(hooks)
+        for table in (table1, table1, table2, table1):
+            emitter.add(table)
+        emitter.flush()
+        emitter.flush()
+        assert hooks.events == [
+            ('table_emitted', 'test1', 2),
+            ('table_emitted', 'test2', 1),
+            ('table_emitted', 'test1', 1),
+        ]
+
+    def test_load_hooks(self):
+        assert isinstance(load_hooks('test.unit.test_hooks:EventHooks'),
+                          EventHooks)
+        for (spec, message) in (
+                ('foo', 'Hooks must be given as module:callable'),
+                ('test.unit.test_hooks:', 'Hooks must be given as'),
+                ('test.unit.nonexistent:Foo', 'Unable to import'),
+                ('test.unit.test_hooks:Foo', 'has no attribute Foo')):
+            with pytest.raises(HooksError) as e:
+                load_hooks(spec)
+            assert message in str(e.value)
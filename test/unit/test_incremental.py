@@ -0,0 +1,198 @@
+from tempfile import NamedTemporaryFile
+import os
+import pytest
+
+from abridger.abridge_db import main
+from abridger.database import SqliteDatabase
+from test.unit.utils import make_temp_yaml_file
+
+
+class TestIncremental(object):
+    schema = [
+        '''CREATE TABLE departments (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            updated_at INTEGER)''',
+        '''CREATE TABLE employees (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            department_id INTEGER NOT NULL REFERENCES departments,
+            boss_id INTEGER REFERENCES employees,
+            updated_at INTEGER)''',
+        '''CREATE TABLE addresses (
+            id INTEGER PRIMARY KEY,
+            employee_id INTEGER NOT NULL REFERENCES employees,
+            street TEXT)''',
+    ]
+
+    data = [
+        "INSERT INTO departments VALUES (1, 'R&D', 1)",
+        "INSERT INTO departments VALUES (2, 'Sales', 1)",
+        "INSERT INTO employees VALUES (1, 'John', 1, NULL, 1)",
+        "INSERT INTO employees VALUES (2, 'Jane', 1, 1, 1)",
+        "INSERT INTO employees VALUES (3, 'Jim', 2, NULL, 1)",
+        "INSERT INTO employees VALUES (4, 'Jill', 2, 3, 1)",
+        "INSERT INTO addresses VALUES (1, 1, 'Main Street')",
+        "INSERT INTO addresses VALUES (2, 2, 'High Street')",
+        "INSERT INTO addresses VALUES (3, 3, 'Park Lane')",
+    ]
+
+    changes = [
+        "UPDATE departments SET name='Research', updated_at=2 WHERE id=1",
+        "UPDATE employees SET name='Janet', updated_at=2 WHERE id=2",
+        "INSERT INTO employees VALUES (5, 'Joe', 1, 4, 2)",
+        "INSERT INTO addresses VALUES (4, 5, 'Mill Road')",
+        "UPDATE addresses SET street='Main Road' WHERE id=1",
+        "DELETE FROM addresses WHERE id=2",
+    ]
+
+    config = [
+        {'subject': [
+            {'tables': [{'table': 'departments', 'column': 'id',
+                         'values': 1}]},
+            {'relations': [{'table': 'employees', 'column': 'department_id',
+                            'type': 'incoming', 'sticky': True}]},
+        ]},
+        {'relations': [{'table': 'addresses', 'column': 'employee_id',
+                        'type': 'incoming'}]},
+    ]
+
+    change_tracking_config = [
+        {'change-tracking-columns': [
+            {'table': 'departments', 'column': 'updated_at'},
+            {'table': 'employees', 'column': 'updated_at'},
+        ]},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, request):
+        self.src = self.make_database(self.data)
+        self.state = NamedTemporaryFile(suffix='.state')
+
+    def make_database(self, stmts):
+        temp = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+        database = SqliteDatabase(temp.name)
+        for stmt in self.schema + stmts:
+            database.execute(stmt)
+        database.connection.commit()
+        database.disconnect()
+        return temp
+
+    def url(self, temp):
+        return 'sqlite:///%s' % temp.name
+
+    def rows(self, temp):
+        database = SqliteDatabase(temp.name)
+        try:
+            return dict([(t, sorted(database.execute_and_fetchall(
+                'SELECT * FROM %s' % t)))
+                for t in ('departments', 'employees', 'addresses')])
+        finally:
+            database.disconnect()
+
+    def run(self, config, dst, *extra_args):
+        config_tempfile = make_temp_yaml_file(config)
+        main([config_tempfile.name, self.url(self.src), '-u', self.url(dst)] +
+             list(extra_args))
+
+    def change_src(self):
+        database = SqliteDatabase(self.src.name)
+        for stmt in self.changes:
+            database.execute(stmt)
+        database.connection.commit()
+        database.disconnect()
+
+    @pytest.mark.parametrize('change_tracking', [False, True])
+    def test_incremental(self, capsys, change_tracking):
+        config = self.config
+        if change_tracking:
+            config = config + self.change_tracking_config
+
+        dst = self.make_database([])
+        self.run(config, dst, '--save-state', self.state.name)
+        assert not os.path.exists(self.state.name + '.tmp')
+        self.change_src()
+        capsys.readouterr()
+
+        self.run(config, dst, '--incremental', self.state.name,
+                 '--save-state', self.state.name)
+        out, err = capsys.readouterr()
+
+        # The delta brings the database in line with a full extraction
+        full_dst = self.make_database([])
+        self.run(config, full_dst)
+        assert self.rows(dst) == self.rows(full_dst)
+        assert (2, 2, 'High Street') not in self.rows(dst)['addresses']
+        assert 'Performing 6 inserts and 5 updates to 3 tables' in out
+        assert 'Deleting 1 rows' in out
+
+        # Nothing changed since the last run
+        self.run(config, dst, '--incremental', self.state.name)
+        out, err = capsys.readouterr()
+        assert 'Performing 0 inserts and 0 updates' in out
+        assert self.rows(dst) == self.rows(full_dst)
+
+    @pytest.mark.parametrize('change_tracking', [False, True])
+    def test_rows_in_previously_empty_table(self, capsys, change_tracking):
+        config = self.config
+        if change_tracking:
+            config = config + self.change_tracking_config
+
+        self.src = self.make_database([
+            "INSERT INTO departments VALUES (1, 'R&D', 1)",
+            "INSERT INTO employees VALUES (1, 'John', 1, NULL, 1)",
+        ])
+        dst = self.make_database([])
+        self.run(config, dst, '--save-state', self.state.name)
+        assert self.rows(dst)['addresses'] == []
+
+        database = SqliteDatabase(self.src.name)
+        database.execute("INSERT INTO addresses VALUES (1, 1, 'Main Street')")
+        database.connection.commit()
+        database.disconnect()
+
+        self.run(config, dst, '--incremental', self.state.name)
+        assert self.rows(dst)['addresses'] == [(1, 1, 'Main Street')]
+
+    def test_sql_output(self, capsys):
+        dst = self.make_database([])
+        self.run(self.config, dst, '--save-state', self.state.name)
+        self.change_src()
+
+        sql = NamedTemporaryFile(suffix='.sql')
+        config_tempfile = make_temp_yaml_file(self.config)
+        main([config_tempfile.name, self.url(self.src), '-f', sql.name,
+              '--incremental', self.state.name])
+        stmts = sql.read().decode('UTF-8')
+        assert 'DELETE FROM addresses WHERE id=2;' in stmts
+        assert "UPDATE addresses SET employee_id=1, street='Main Road' " \
+            "WHERE id=1;" in stmts
+
+    def test_incomplete_state(self, capsys):
+        dst = self.make_database([])
+        self.run(self.config, dst, '--checkpoint', self.state.name)
+        with pytest.raises(SystemExit):
+            self.run(self.config, dst, '--incremental', self.state.name)
+        out, err = capsys.readouterr()
+        assert 'The state is not from a completed extraction' in out
+
+    def test_changed_config(self, capsys):
+        dst = self.make_database([])
+        self.run(self.config, dst, '--save-state', self.state.name)
+        with pytest.raises(SystemExit):
+            self.run(self.config + self.change_tracking_config, dst,
+                     '--incremental', self.state.name)
+        out, err = capsys.readouterr()
+        assert 'The checkpoint was made with a different configuration' in out
+
+    def test_args(self, capsys):
+        for args in (['-e', '--incremental', 'foo'],
+                     ['-f', 'foo', '--resume', 'foo', '--save-state', 'foo'],
+                     ['-u', 'foo', '--direct', '--incremental', 'foo']):
+            with pytest.raises(SystemExit):
+                main(['foo', 'bar'] + args)
+        out, err = capsys.readouterr()
+        assert '--save-state and --incremental can\'t be used with -e' in out
+        assert '--checkpoint and --resume can\'t be used with --save-state ' \
+            'or --incremental' in out
+        assert '--incremental can\'t be used with --direct' in out
@@ -0,0 +1,93 @@
+from tempfile import NamedTemporaryFile
+import pytest
+
+from abridger.advise_indexes import main
+from abridger.database.sqlite import SqliteDatabase
+from abridger.extraction_model import ExtractionModel
+from abridger.index_advisor import find_lookups, find_unindexed_lookups
+from abridger.schema import SqliteSchema
+from test.unit.utils import make_temp_yaml_file
+
+
+class TestIndexAdvisor(object):
+    CONFIG = [
+        {'relations': [{'table': 'test2', 'column': 'test1_id'},
+                       {'table': 'test4', 'column': 'test3_id'}]},
+        {'subject': [{'tables': [{'table': 'test1', 'column': 'name',
+                                  'values': 'a'}]}]},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self):
+        self.db_file = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+        self.database = SqliteDatabase(self.db_file.name)
+        for stmt in [
+            'CREATE TABLE test1 (id INTEGER PRIMARY KEY, name TEXT)',
+            '''CREATE TABLE test2 (
+                    id INTEGER PRIMARY KEY,
+                    test1_id INTEGER REFERENCES test1,
+                    other_id INTEGER)''',
+            'CREATE TABLE test3 (id INTEGER PRIMARY KEY)',
+            '''CREATE TABLE test4 (
+                    id INTEGER PRIMARY KEY,
+                    test3_id INTEGER REFERENCES test3)''',
+        ]:
+            self.database.execute(stmt)
+        for i in range(1, 4):
+            self.database.execute(
+                "INSERT INTO test1 VALUES (%d, 'name%d')" % (i, i))
+        for i in range(1, 5):
+            self.database.execute(
+                'INSERT INTO test2 VALUES (%d, 1, NULL)' % i)
+        self.database.connection.commit()
+
+    def load_model(self):
+        schema = SqliteSchema.create_from_conn(self.database.connection)
+        return ExtractionModel.load(schema, self.CONFIG)
+
+    def test_find_lookups(self):
+        lookups = find_lookups(self.load_model())
+        # test4 can't be reached from the subject
+        assert [str(l) for l in lookups] == [
+            'test1 (name)', 'test2 (test1_id)', 'test1 (id)']
+        assert [l.sources for l in lookups] == [
+            ['subject'], ['incoming from test1'], ['outgoing from test2']]
+
+    def test_find_unindexed_lookups(self):
+        lookups = find_unindexed_lookups(self.load_model(), self.database)
+        assert [l.describe() for l in lookups] == [
+            'test2 (test1_id) ~4 rows: incoming from test1',
+            'test1 (name) ~3 rows: subject']
+        assert lookups[0].create_index_statement() == \
+            'CREATE INDEX test2_test1_id_idx ON test2 (test1_id);'
+
+        # Indexes on more columns cover lookups on their leading columns
+        self.database.execute(
+            'CREATE INDEX test2_idx ON test2 (test1_id, other_id)')
+        self.database.execute(
+            'CREATE INDEX test1_idx ON test1 (id, name)')
+        lookups = find_unindexed_lookups(self.load_model())
+        assert [str(l) for l in lookups] == ['test1 (name)']
+        assert lookups[0].row_count is None
+
+    def test_main(self, capsys):
+        config_file = make_temp_yaml_file(self.CONFIG)
+        url = self.database.url()
+        self.database.disconnect()
+
+        main([config_file.name, url, '--sql'])
+        out, err = capsys.readouterr()
+        assert out.splitlines() == [
+            '-- test2 (test1_id) ~4 rows: incoming from test1',
+            'CREATE INDEX test2_test1_id_idx ON test2 (test1_id);',
+            '-- test1 (name) ~3 rows: subject',
+            'CREATE INDEX test1_name_idx ON test1 (name);']
+
+        self.database.connect()
+        self.database.execute('CREATE INDEX test1_idx ON test1 (name)')
+        self.database.execute('CREATE INDEX test2_idx ON test2 (test1_id)')
+        self.database.connection.commit()
+        self.database.disconnect()
+        main([config_file.name, url])
+        out, err = capsys.readouterr()
+        assert out == 'All lookups are indexed\n'
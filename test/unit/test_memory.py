@@ -0,0 +1,69 @@
+from collections import deque
+from tempfile import NamedTemporaryFile
+import json
+import sys
+
+from abridger.memory import MemoryReport, current_rss, deep_size, peak_rss
+
+
+class Holder(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class TestMemory(object):
+    def test_deep_size(self):
+        value = 'x' * 1000
+        assert deep_size(value) == sys.getsizeof(value)
+
+        # Shared objects are counted once
+        size = deep_size([value, value])
+        assert size == sys.getsizeof([value, value]) + sys.getsizeof(value)
+
+        holder = Holder(value)
+        assert deep_size(holder) > sys.getsizeof(value)
+        assert deep_size(holder, stop_types=(Holder,)) == 0
+        assert deep_size({'a': holder}, stop_types=(Holder,)) < \
+            sys.getsizeof(value)
+        assert deep_size(deque([value])) > sys.getsizeof(value)
+
+        # Cycles are followed once
+        cycle = []
+        cycle.append(cycle)
+        assert deep_size(cycle) == sys.getsizeof(cycle)
+
+    def test_rss(self):
+        assert current_rss() > 0
+        assert peak_rss() > 0
+
+    def test_samples(self, capsys):
+        memory_report = MemoryReport(interval=2)
+        try:
+            class Extractor(object):
+                new_row_count = 10
+            for i in range(5):
+                memory_report.work_item_processed(Extractor())
+            data = ['%100d' % i for i in range(1000)]
+            memory_report.sample('generation', rows=1000,
+                                 structures=[('data', data)])
+        finally:
+            memory_report.stop()
+
+        samples = memory_report.samples
+        assert [s['name'] for s in samples] == [
+            'extraction:2', 'extraction:4', 'generation']
+        assert samples[0]['rows'] == 10
+        assert samples[2]['structures']['data'] > 100 * 1000
+        assert samples[2]['traced'] > 0
+
+        memory_report.print_summary()
+        out, err = capsys.readouterr()
+        lines = out.splitlines()
+        assert lines[0].split() == ['Phase', 'Rows', 'RSS', 'Peak', 'RSS',
+                                    'Traced', 'Peak']
+        assert lines[3].split()[:2] == ['generation', '1000']
+        assert lines[4].split()[0] == 'data'
+
+        f = NamedTemporaryFile(mode='w+t', suffix='.json')
+        memory_report.write_json(f.name)
+        assert json.load(f) == {'samples': samples}
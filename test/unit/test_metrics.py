@@ -0,0 +1,54 @@
+from tempfile import NamedTemporaryFile
+import json
+import mock
+
+from abridger.metrics import Metrics, percentile, row_size
+
+
+class TestMetrics(object):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.95) == 95
+        assert percentile(values, 1) == 100
+        assert percentile([3], 0.5) == 3
+        assert percentile([], 0.5) is None
+
+    def test_row_size(self):
+        assert row_size((1, None, 'abc', b'ab', 1.5)) == 9
+
+    def test_phases(self):
+        metrics = Metrics()
+        with mock.patch('abridger.metrics.time', side_effect=[1, 3, 4, 5]):
+            with metrics.phase('extraction'):
+                pass
+            with metrics.phase('output'):
+                pass
+        metrics.add_phase_time('extraction', 1)
+        assert metrics.report()['phases'] == [
+            {'name': 'extraction', 'time': 3},
+            {'name': 'output', 'time': 1},
+        ]
+
+    def test_tables(self, schema_sl):
+        metrics = Metrics()
+        table1 = schema_sl.tables_by_name['test1']
+        table2 = schema_sl.tables_by_name['test2']
+        for i in range(20):
+            metrics.record_query(table1, [(1, 'a')], (i + 1) / 10.0)
+        metrics.record_query(table2, [(1, 'abc'), (2, None)], 0.5)
+
+        with NamedTemporaryFile(mode='w+t', suffix='.json') as f:
+            metrics.write_json(f.name)
+            report = json.load(f)
+
+        assert report['tables']['test1'] == {
+            'queries': 20,
+            'rows': 20,
+            'bytes': 40,
+            'latency_p50': 1.0,
+            'latency_p95': 1.9,
+            'latency_max': 2.0,
+        }
+        assert report['tables']['test2']['latency_p95'] == 0.5
+        assert report['totals'] == {'queries': 21, 'rows': 22, 'bytes': 45}
@@ -0,0 +1,110 @@
+from tempfile import NamedTemporaryFile
+import pytest
+
+from abridger.database.sqlite import SqliteDatabase
+from abridger.extraction_model import ExtractionModel
+from abridger.planner import Planner, TablePlan, expected_distinct
+from abridger.schema import SqliteSchema
+
+
+class TestPlanner(object):
+    CONFIG = [
+        {'subject': [{'tables': [{'table': 'customers', 'column': 'id',
+                                  'values': [1, 2]}]}]},
+        {'relations': [{'table': 'orders', 'column': 'customer_id'}]},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self):
+        self.db_file = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+        self.database = SqliteDatabase(self.db_file.name)
+        for stmt in [
+            'CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT)',
+            'CREATE TABLE products (id INTEGER PRIMARY KEY)',
+            '''CREATE TABLE orders (
+                    id INTEGER PRIMARY KEY,
+                    customer_id INTEGER NOT NULL REFERENCES customers,
+                    product_id INTEGER REFERENCES products)''',
+            'CREATE INDEX orders_customer_idx ON orders (customer_id)',
+        ]:
+            self.database.execute(stmt)
+
+        # 10 customers with 10 orders each, half of them for 4 products
+        for i in range(1, 11):
+            self.database.execute(
+                "INSERT INTO customers VALUES (%d, 'name%d')" % (i, i))
+        for i in range(1, 5):
+            self.database.execute('INSERT INTO products VALUES (%d)' % i)
+        for i in range(100):
+            product_id = i % 4 + 1 if i % 2 else 'NULL'
+            self.database.execute('INSERT INTO orders VALUES (%d, %d, %s)' % (
+                i + 1, i % 10 + 1, product_id))
+        self.database.connection.commit()
+        self.schema = SqliteSchema.create_from_conn(self.database.connection)
+
+    def make_planner(self, **kwargs):
+        extraction_model = ExtractionModel.load(self.schema, self.CONFIG)
+        planner = Planner(self.database, extraction_model, **kwargs)
+        planner.plan()
+        return planner
+
+    def table_plans(self, planner):
+        return dict([(p.table.name, p) for p in planner.table_plans_by_rows()])
+
+    def test_expected_distinct(self):
+        assert expected_distinct(None, 10) == 10
+        assert expected_distinct(0, 10) == 0
+        assert expected_distinct(1, 10) == 1
+        assert round(expected_distinct(100, 10), 1) == 9.6
+        assert round(expected_distinct(4, 100), 1) == 4
+
+    def test_add_rows(self):
+        table_plan = TablePlan(None, 100)
+        assert table_plan.add_rows(0) == 0
+        assert table_plan.add_rows(10) == 10
+        assert table_plan.add_rows(50) == 45
+        assert round(table_plan.add_rows(1000)) == 45
+        assert round(table_plan.estimated_rows) == 100
+        assert table_plan.query_count == 4
+
+        table_plan = TablePlan(None, None)
+        assert table_plan.add_rows(10) == 10
+
+    def test_without_statistics(self):
+        plans = self.table_plans(self.make_planner())
+        assert sorted(plans.keys()) == ['customers', 'orders', 'products']
+
+        assert round(plans['customers'].estimated_rows) == 2
+        # 100 orders spread evenly over 10 customers
+        assert round(plans['orders'].estimated_rows) == 20
+        assert round(plans['products'].estimated_rows) == 4
+
+        # Orders look up their customers, which have been fetched already
+        assert plans['customers'].query_count == 2
+        assert plans['orders'].query_count == 1
+        assert plans['products'].query_count == 1
+
+    def test_with_statistics(self):
+        self.database.execute('ANALYZE')
+        assert self.database.estimate_row_count(
+            self.schema.tables_by_name['orders']) == 100
+
+        orders = self.schema.tables_by_name['orders']
+        assert self.database.estimate_rows_per_value(
+            orders, (orders.cols_by_name['customer_id'],)) == 10
+        assert self.database.estimate_rows_per_value(
+            orders, (orders.cols_by_name['product_id'],)) is None
+
+        plans = self.table_plans(self.make_planner())
+        assert round(plans['orders'].estimated_rows) == 20
+
+    def test_print_plan(self, capsys):
+        planner = self.make_planner(max_rows=10)
+        planner.print_plan()
+        out, err = capsys.readouterr()
+        lines = out.splitlines()
+        assert lines[0].split() == ['Table', 'Rows', 'Of', 'table',
+                                    'Queries']
+        assert lines[1].split() == ['orders', '!', '20', '20.0%', '1']
+        assert lines[4] == 'Estimated total: 26 rows in 4 queries'
+        assert lines[5] == 'Warning: orders is estimated to exceed 10 rows'
@@ -0,0 +1,116 @@
+from six import StringIO
+from time import sleep
+import json
+import mock
+
+from abridger.progress import ProgressReporter
+
+
+class TestProgressReporter(object):
+    time_patch = None
+
+    def make_reporter(self, times, **kwargs):
+        self.stream = StringIO()
+        self.time_patch = mock.patch('abridger.progress.time',
+                                     side_effect=times)
+        self.time_patch.start()
+        return ProgressReporter(stream=self.stream, **kwargs)
+
+    def teardown_method(self, method):
+        if self.time_patch is not None:
+            self.time_patch.stop()
+
+    def lines(self):
+        return self.stream.getvalue().splitlines()
+
+    def test_tick(self):
+        reporter = self.make_reporter([0, 10, 10.5, 11, 11.5, 12, 13])
+        reporter.start_phase('extraction', total_rows=100)
+        reporter.update(2, queries=1, queued=5)
+        assert reporter.tick() == 0.5
+        reporter.update(10, queries=3, queued=8)
+        assert reporter.tick() == 1
+        # Updates only record the counts, ticks report them
+        reporter.update(15, queries=4, queued=6)
+        assert self.lines() == [
+            'extraction 1.0s queued=8 rows=10/~100 (10/s) '
+            'queries=3 (3.0/s) eta 9s',
+        ]
+        assert reporter.tick() == 0.5
+        reporter.update(20, queries=5, queued=3)
+        reporter.tick()
+        reporter.finish_phase()
+
+        assert self.lines() == [
+            'extraction 1.0s queued=8 rows=10/~100 (10/s) '
+            'queries=3 (3.0/s) eta 9s',
+            'extraction 2.0s queued=3 rows=20/~100 (10/s) '
+            'queries=5 (2.5/s) eta 8s',
+            'extraction 3.0s queued=0 rows=20/~100 (7/s) '
+            'queries=5 (1.7/s) done',
+        ]
+
+    def test_timer(self):
+        self.stream = StringIO()
+        reporter = ProgressReporter(stream=self.stream, interval=0.01)
+        reporter.start()
+        reporter.start_phase('extraction')
+        reporter.update(5, queries=1)
+
+        # Without further updates the last counts keep being reported
+        for i in range(100):
+            if len(self.lines()) >= 2:
+                break
+            sleep(0.01)
+        reporter.close()
+        lines = self.lines()
+        assert len(lines) >= 3
+        assert all(['rows=5 ' in line for line in lines])
+        assert lines[-1].endswith(' done')
+        assert reporter.thread is None
+
+    def test_json_lines(self):
+        reporter = self.make_reporter([0, 0, 1, 2, 2, 4, 6],
+                                      json_lines=True)
+        reporter.start_phase('extraction')
+        reporter.update(10, queries=1, queued=0)
+        reporter.tick()
+        reporter.start_phase('output', total_rows=10)
+        reporter.update(5)
+        reporter.tick()
+        reporter.close()
+
+        reports = [json.loads(line) for line in self.lines()]
+        assert [(r['phase'], r['done']) for r in reports] == [
+            ('extraction', False), ('extraction', True), ('output', False),
+            ('output', True)]
+        assert reports[0]['rows_per_second'] == 10
+        assert reports[0]['queries'] == 1
+        assert reports[0]['eta'] is None
+        assert reports[2]['eta'] == 2
+        assert 'queries' not in reports[2]
+        assert reports[3]['phases'] == [{'name': 'extraction', 'time': 2}]
+        assert reports[3]['total_elapsed'] == 6
+
+    def test_resumed_phase(self):
+        reporter = self.make_reporter([0, 10, 12, 14], json_lines=True)
+        reporter.start_phase('extraction', total_rows=100, start_rows=40,
+                             start_queries=4)
+        reporter.update(60, queries=6)
+        reporter.tick()
+        reporter.finish_phase()
+
+        # Only the rows and queries done since resuming count for the rates
+        report = json.loads(self.lines()[0])
+        assert report['rows'] == 60
+        assert report['rows_per_second'] == 10
+        assert report['queries_per_second'] == 1
+        assert report['eta'] == 4
+
+    def test_estimate_too_low(self):
+        reporter = self.make_reporter([0, 0, 1])
+        reporter.start_phase('extraction', total_rows=5)
+        reporter.update(10, queries=1)
+        reporter.tick()
+        assert self.lines() == [
+            'extraction 1.0s rows=10/~5 (10/s) queries=1 (1.0/s)']
@@ -0,0 +1,86 @@
+from tempfile import NamedTemporaryFile
+import json
+import pytest
+
+from abridger.database.governor import Governor
+from abridger.database.journal import QueryJournal
+from abridger.exc import QueryTimeoutError
+from abridger.schema import SqliteSchema
+
+
+class TestQueryJournal(object):
+    @pytest.fixture(autouse=True)
+    def prepare(self, sqlite_database):
+        self.database = sqlite_database
+        self.database.execute(
+            'CREATE TABLE test1 (id INTEGER PRIMARY KEY, name TEXT)')
+        for i in range(1, 9):
+            self.database.execute(
+                "INSERT INTO test1 VALUES (%d, 'name%d')" % (i, i))
+        self.schema = SqliteSchema.create_from_conn(self.database.connection)
+        self.table = self.schema.tables[0]
+        self.journal_file = NamedTemporaryFile(mode='w+t', suffix='.jsonl')
+
+    def read_journal(self):
+        self.database.journal.close()
+        with open(self.journal_file.name) as f:
+            return [json.loads(line) for line in f]
+
+    def test_statement_shape(self):
+        shape = QueryJournal.statement_shape
+        assert shape('SELECT *\n  FROM t WHERE id IN (?, ?, ?)') == \
+            'SELECT * FROM t WHERE id IN (?, ...)'
+        assert shape('SELECT * FROM t WHERE id IN (%s)') == \
+            'SELECT * FROM t WHERE id IN (%s)'
+        assert shape('SELECT * FROM t WHERE (a=? AND b=?) OR '
+                     '(a=? AND b=?) OR (a=? AND b=?)') == \
+            'SELECT * FROM t WHERE (a=? AND b=?) OR ...'
+        assert shape('SELECT * FROM t WHERE (a, b) IN '
+                     '((%s, %s), (%s, %s))') == \
+            'SELECT * FROM t WHERE (a, b) IN ((%s, ...), ...)'
+
+    def test_records(self):
+        self.database.journal = QueryJournal(self.journal_file.name)
+        id_col = self.table.cols[0]
+        self.database.fetch_rows(self.table, (id_col,), [(1,), (2,)])
+        self.database.fetch_rows(self.table, (id_col,), [(3,), (4,), (5,)])
+        self.database.fetch_rows(self.table, None, None)
+        assert str(self.database.journal) == 'queries=3 slow=0 explained=0'
+
+        entries = self.read_journal()
+        assert [e['params'] for e in entries] == [2, 3, 0]
+        assert [e['rows'] for e in entries] == [2, 3, 8]
+        assert entries[0]['shape'] == entries[1]['shape']
+        assert '...' in entries[0]['shape']
+        assert all(['explain' not in e for e in entries])
+
+    def test_explain_once_per_shape(self):
+        self.database.journal = QueryJournal(self.journal_file.name,
+                                             slow_threshold=0)
+        id_col = self.table.cols[0]
+        self.database.fetch_rows(self.table, (id_col,), [(1,), (2,)])
+        self.database.fetch_rows(self.table, (id_col,), [(3,)])
+        self.database.fetch_rows(self.table, (id_col,), [(4,), (5,)])
+        assert str(self.database.journal) == 'queries=3 slow=3 explained=2'
+
+        entries = self.read_journal()
+        assert 'explain' in entries[0]
+        assert 'explain' in entries[1]
+        assert 'explain' not in entries[2]
+        assert any(['test1' in line for line in entries[0]['explain']])
+
+    def test_timed_out(self):
+        self.database.journal = QueryJournal(self.journal_file.name,
+                                             slow_threshold=0)
+        self.database.governor = Governor(statement_timeout=0.01)
+        with pytest.raises(QueryTimeoutError):
+            self.database.execute_and_fetchall('''
+                WITH RECURSIVE c(x) AS (
+                    SELECT 1 UNION ALL SELECT x + 1 FROM c)
+                SELECT max(x) FROM c''')
+
+        entries = self.read_journal()
+        assert len(entries) == 1
+        assert entries[0]['timed_out']
+        assert entries[0]['rows'] == 0
+        assert 'explain' not in entries[0]
@@ -0,0 +1,104 @@
+from tempfile import NamedTemporaryFile
+import gzip
+import pickle
+import pytest
+
+from abridger.database import SqliteDatabase, load
+from abridger.database.recording import Recorder, ReplayDatabase
+from abridger.exc import ReplayError
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+from abridger.generator import Generator
+
+
+class TestRecording(object):
+    CONFIG = [
+        {'subject': [{'tables': [{'table': 'test1', 'column': 'id',
+                                  'values': [1, 2]}]}]},
+        {'relations': [{'table': 'test2', 'column': 'test1_id'}]},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, request):
+        self.src = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+        self.recording = NamedTemporaryFile(suffix='.rec')
+        database = SqliteDatabase(self.src.name)
+        for stmt in [
+            'CREATE TABLE test1 (id INTEGER PRIMARY KEY, name TEXT)',
+            '''CREATE TABLE test2 (
+                id INTEGER PRIMARY KEY,
+                test1_id INTEGER NOT NULL REFERENCES test1)''',
+            "INSERT INTO test1 VALUES (1, 'one')",
+            "INSERT INTO test1 VALUES (2, 'two')",
+            "INSERT INTO test1 VALUES (3, 'three')",
+            'INSERT INTO test2 VALUES (1, 1)',
+            'INSERT INTO test2 VALUES (2, 1)',
+            'INSERT INTO test2 VALUES (3, 3)',
+        ]:
+            database.execute(stmt)
+        database.connection.commit()
+        database.disconnect()
+
+        self.database = SqliteDatabase(self.src.name)
+        request.addfinalizer(self.database.disconnect)
+
+    def extract(self, database):
+        extraction_model = ExtractionModel.load(database.schema, self.CONFIG)
+        extractor = Extractor(database, extraction_model)
+        extractor.launch()
+        generator = Generator(database.schema, extractor)
+        generator.generate_statements()
+        return [(table.name, values)
+                for (table, values) in generator.insert_statements]
+
+    def record(self):
+        recorder = Recorder(self.recording.name, self.database)
+        self.database.recorder = recorder
+        statements = self.extract(self.database)
+        recorder.close()
+        self.database.recorder = None
+        return (recorder, statements)
+
+    def test_record_and_replay(self):
+        (recorder, statements) = self.record()
+        assert str(recorder) == 'calls=3 rows=5'
+        assert statements == [('test1', (1, 'one')), ('test1', (2, 'two')),
+                              ('test2', (1, 1)), ('test2', (2, 1))]
+
+        replay_database = load('replay://%s' % self.recording.name)
+        assert isinstance(replay_database, ReplayDatabase)
+        assert replay_database.schema.tables_by_name['test2'].foreign_keys
+        assert replay_database.is_compatible_with(self.database)
+        assert self.extract(replay_database) == statements
+        assert replay_database.call_count == 3
+
+    def test_replay_by_value(self):
+        self.record()
+        replay_database = ReplayDatabase(self.recording.name)
+        table = replay_database.schema.tables_by_name['test1']
+        cols = (table.cols_by_name['id'],)
+
+        # Lookups needn't be batched the way they were recorded
+        assert replay_database.fetch_rows(table, cols, [(2,)]) == [
+            (2, 'two')]
+        assert replay_database.fetch_rows(table, cols, [(2,), (1,)]) == [
+            (2, 'two'), (1, 'one')]
+        assert replay_database.fetch_rows(table, cols, []) == []
+
+        with pytest.raises(ReplayError) as e:
+            replay_database.fetch_rows(table, cols, [(1,), (3,)])
+        assert 'No rows of test1 with id in [(1,), (3,)] were recorded' in \
+            str(e)
+        with pytest.raises(ReplayError) as e:
+            replay_database.fetch_rows(table, None, None)
+        assert 'No rows of test1 were recorded' in str(e)
+        with pytest.raises(ReplayError) as e:
+            replay_database.execute_and_fetchall('SELECT 1')
+        assert 'Only fetched rows can be replayed' in str(e)
+
+    def test_incompatible_recording(self):
+        with gzip.open(self.recording.name, 'wb') as f:
+            pickle.dump({'version': 0}, f, 2)
+        with pytest.raises(ReplayError) as e:
+            ReplayDatabase(self.recording.name)
+        assert 'incompatible version' in str(e)
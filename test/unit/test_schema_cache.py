@@ -0,0 +1,114 @@
+from tempfile import mkdtemp
+import mock
+import os
+import pytest
+import shutil
+
+from abridger.extractor import Extractor
+from abridger.schema import SqliteSchema
+from abridger.schema_cache import SchemaCache
+
+
+class TestSchemaCache(object):
+    schema = [
+        '''CREATE TABLE departments (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE)''',
+        '''CREATE TABLE employees (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            department_id INTEGER NOT NULL REFERENCES departments,
+            boss_id INTEGER REFERENCES employees)''',
+        '''CREATE TABLE tags (
+            employee_id INTEGER NOT NULL REFERENCES employees,
+            name TEXT)''',
+        "INSERT INTO departments VALUES (1, 'R&D')",
+        "INSERT INTO departments VALUES (2, 'Sales')",
+        "INSERT INTO employees VALUES (1, 'John', 1, NULL)",
+        "INSERT INTO employees VALUES (2, 'Jane', 2, 1)",
+        "INSERT INTO tags VALUES (1, 'tag')",
+    ]
+
+    config = [
+        {'subject': [
+            {'tables': [{'table': 'departments', 'column': 'name',
+                         'values': 'R&D'}]},
+            {'relations': [{'table': 'employees', 'column': 'department_id',
+                            'type': 'incoming', 'sticky': True}]},
+        ]},
+        {'relations': [{'table': 'tags', 'column': 'employee_id'}]},
+        {'not-null-columns': [{'table': 'employees', 'column': 'boss_id'}]},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, request, sqlite_conn):
+        self.conn = sqlite_conn
+        for stmt in self.schema:
+            self.conn.execute(stmt)
+        self.directory = mkdtemp()
+        self.cache = SchemaCache(self.directory)
+
+        def fin():
+            shutil.rmtree(self.directory)
+        request.addfinalizer(fin)
+
+    def test_dump_and_restore(self, schema_sl):
+        data = schema_sl.dump()
+        restored = SqliteSchema.restore(data)
+        assert restored.dump() == data
+
+        for table in schema_sl.tables:
+            restored_table = restored.tables_by_name[table.name]
+            for attr in ('foreign_keys', 'incoming_foreign_keys',
+                         'effective_primary_key', 'unique_indexes',
+                         'indexes'):
+                assert sorted([str(v) for v in getattr(table, attr)]) == \
+                    sorted([str(v) for v in getattr(restored_table, attr)])
+            assert table.can_have_duplicated_rows == \
+                restored_table.can_have_duplicated_rows
+
+    def test_fingerprint(self):
+        fingerprint = SqliteSchema.fingerprint(self.conn)
+        assert SqliteSchema.fingerprint(self.conn) == fingerprint
+        self.conn.execute('ALTER TABLE tags ADD COLUMN value TEXT')
+        assert SqliteSchema.fingerprint(self.conn) != fingerprint
+
+    def test_load_schema(self):
+        schema = self.cache.load_schema(SqliteSchema, self.conn)
+        assert (self.cache.hit_count, self.cache.miss_count) == (0, 1)
+
+        with mock.patch.object(SqliteSchema, 'create_from_conn') as create:
+            cached_schema = self.cache.load_schema(SqliteSchema, self.conn)
+            assert not create.called
+        assert cached_schema.dump() == schema.dump()
+        assert cached_schema.cache_fingerprint == schema.cache_fingerprint
+        assert (self.cache.hit_count, self.cache.miss_count) == (1, 1)
+
+        # A schema change causes a miss
+        self.conn.execute('ALTER TABLE tags ADD COLUMN value TEXT')
+        schema = self.cache.load_schema(SqliteSchema, self.conn)
+        assert 'value' in schema.tables_by_name['tags'].cols_by_name
+        assert (self.cache.hit_count, self.cache.miss_count) == (1, 2)
+        assert len(os.listdir(self.directory)) == 2
+
+    def test_load_extraction_model(self, sqlite_database):
+        def extract():
+            schema = self.cache.load_schema(SqliteSchema, self.conn)
+            model = self.cache.load_extraction_model(schema, self.config)
+            sqlite_database.schema = schema
+            extractor = Extractor(sqlite_database, model).launch()
+            results = [(t.name, row) for (t, row) in extractor.flat_results()]
+            return (model, results)
+
+        (model, results) = extract()
+        (cached_model, cached_results) = extract()
+        assert self.cache.hit_count == 2
+        assert cached_model.dump() == model.dump()
+        assert cached_results == results
+        assert ('employees', (2, 'Jane', 2, 1)) not in results
+        assert ('tags', (1, 'tag')) in results
+
+        # A different config is compiled again
+        self.cache.load_extraction_model(cached_model.schema,
+                                         self.config[:2])
+        assert self.cache.miss_count == 3
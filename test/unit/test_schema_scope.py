@@ -0,0 +1,122 @@
+from abridger.extraction_model import ExtractionModel, SchemaScope
+from abridger.extractor import Extractor
+from abridger.generator import Generator
+from abridger.schema import SqliteSchema
+
+
+class TestSchemaScope(object):
+    schema = [
+        '''CREATE TABLE departments (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE)''',
+        '''CREATE TABLE employees (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            department_id INTEGER NOT NULL REFERENCES departments,
+            boss_id INTEGER REFERENCES employees)''',
+        '''CREATE TABLE addresses (
+            id INTEGER PRIMARY KEY,
+            employee_id INTEGER NOT NULL REFERENCES employees)''',
+        '''CREATE TABLE tags (
+            employee_id INTEGER NOT NULL REFERENCES employees,
+            name TEXT)''',
+        '''CREATE TABLE unrelated (
+            id INTEGER PRIMARY KEY,
+            department_id INTEGER REFERENCES departments)''',
+        "INSERT INTO departments VALUES (1, 'R&D')",
+        "INSERT INTO employees VALUES (1, 'John', 1, NULL)",
+        "INSERT INTO employees VALUES (2, 'Jane', 1, 1)",
+        "INSERT INTO addresses VALUES (1, 2)",
+        "INSERT INTO tags VALUES (2, 'tag')",
+        "INSERT INTO unrelated VALUES (1, 1)",
+    ]
+
+    def table_names(self, schema):
+        return sorted([t.name for t in schema.tables])
+
+    def test_from_config(self):
+        scope = SchemaScope.from_config([
+            {'subject': [
+                {'tables': [{'table': 'employees'}]},
+                {'relations': [{'table': 'addresses',
+                                'column': 'employee_id'}]},
+            ]},
+            {'relations': [
+                {'table': 'tags', 'column': 'employee_id',
+                 'type': 'incoming', 'disabled': True},
+                {'table': 'employees', 'column': 'boss_id',
+                 'type': 'outgoing'},
+            ]},
+            {'not-null-columns': [{'table': 'departments',
+                                   'column': 'name'}]},
+        ])
+        assert scope.table_names == set([
+            'employees', 'addresses', 'tags', 'departments'])
+        assert scope.incoming_table_names == set(['addresses'])
+        assert scope.all_incoming is False
+
+        scope = SchemaScope.from_config([
+            {'relations': [{'defaults': 'everything'}]}])
+        assert scope.all_incoming is True
+
+    def test_reachable_tables(self):
+        scope = SchemaScope(['a'], incoming_table_names=['c'])
+        table_names = dict([(n, n) for n in 'abcde'])
+        edges = [('a', 'b'), ('c', 'a'), ('d', 'a'), ('e', 'd'), ('b', 'x')]
+        assert scope.reachable_tables(table_names, edges) == \
+            set(['a', 'b', 'c'])
+
+        scope.all_incoming = True
+        assert scope.reachable_tables(table_names, edges) == \
+            set(['a', 'b', 'c', 'd', 'e'])
+
+    def test_pruned_schema(self, sqlite_conn):
+        for stmt in self.schema:
+            sqlite_conn.execute(stmt)
+
+        # Outgoing foreign keys are always followed
+        scope = SchemaScope(['employees'])
+        schema = SqliteSchema.create_from_conn(sqlite_conn, scope=scope)
+        assert self.table_names(schema) == ['departments', 'employees']
+        departments = schema.tables_by_name['departments']
+        assert len(departments.incoming_foreign_keys) == 1
+        assert len(departments.unique_indexes) == 1
+
+        scope = SchemaScope(['employees'], incoming_table_names=['tags'])
+        schema = SqliteSchema.create_from_conn(sqlite_conn, scope=scope)
+        assert self.table_names(schema) == ['departments', 'employees',
+                                            'tags']
+
+        scope.all_incoming = True
+        schema = SqliteSchema.create_from_conn(sqlite_conn, scope=scope)
+        assert len(schema.tables) == 5
+
+    def test_extraction(self, sqlite_database, sqlite_conn):
+        for stmt in self.schema:
+            sqlite_conn.execute(stmt)
+        sqlite_conn.commit()
+
+        data = [
+            {'subject': [
+                {'tables': [{'table': 'employees', 'column': 'id',
+                             'values': 2}]},
+                {'relations': [{'table': 'addresses',
+                                'column': 'employee_id'}]},
+            ]},
+        ]
+
+        def extract(scope):
+            sqlite_database.schema = SqliteSchema.create_from_conn(
+                sqlite_conn, scope=scope)
+            model = ExtractionModel.load(sqlite_database.schema, data)
+            extractor = Extractor(sqlite_database, model).launch()
+            generator = Generator(sqlite_database.schema, extractor)
+            generator.generate_statements()
+            results = sorted([(t.name, row)
+                              for (t, row) in extractor.flat_results()])
+            return (results, [t.name for t in generator.table_order])
+
+        (results, table_order) = extract(SchemaScope.from_config(data))
+        assert table_order == ['departments', 'employees', 'addresses']
+        assert extract(None)[0] == results
+        assert ('addresses', (1, 2)) in results
@@ -1,6 +1,8 @@
+from sqlite3 import OperationalError
+from tempfile import NamedTemporaryFile
 import pytest
 
-from abridger.database import load
+from abridger.database import SqliteDatabase, load
 from abridger.exc import DatabaseUrlError
 from abridger.schema import SqliteSchema
 from database import DatabaseTestBase
@@ -16,3 +18,41 @@ class TestSqliteDatabase(DatabaseTestBase):
     def test_bad_url(self):
         with pytest.raises(DatabaseUrlError):
             load("oracle://bar")
+
+    def test_fast_load(self):
+        database = self.database
+        database.execute('CREATE TABLE table2 (id INTEGER, name TEXT)')
+        database.execute('CREATE INDEX table2_name_idx ON table2(name)')
+        database.execute('CREATE UNIQUE INDEX table2_id_idx ON table2(id)')
+        database.create_schema(SqliteSchema)
+
+        def indexes():
+            return sorted(database.execute_and_fetchall(
+                "SELECT name FROM sqlite_master "
+                "WHERE type='index' AND sql IS NOT NULL"))
+
+        state = database.begin_fast_load()
+        assert indexes() == [('table2_id_idx',)]
+        assert database.execute_and_fetchall(
+            'PRAGMA synchronous') == [(0,)]
+
+        database.insert_rows([(self.schema.tables[0], (1, 'foo'))])
+        assert database.end_fast_load(state) == 1
+        assert indexes() == [('table2_id_idx',), ('table2_name_idx',)]
+        assert database.execute_and_fetchall(
+            'PRAGMA synchronous') != [(0,)]
+
+        # Rebuilding is idempotent
+        assert database.end_fast_load(state) == 0
+
+    def test_read_only(self):
+        temp = NamedTemporaryFile(suffix='.sqlite3')
+        database = SqliteDatabase(temp.name)
+        database.execute('CREATE TABLE table2 (id INTEGER)')
+        database.disconnect()
+
+        database = load('sqlite:///%s' % temp.name, read_only=True)
+        assert database.execute_and_fetchall('SELECT * FROM table2') == []
+        with pytest.raises(OperationalError):
+            database.execute('INSERT INTO table2 VALUES (1)')
+        database.disconnect()
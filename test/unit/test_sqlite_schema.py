@@ -1,3 +1,4 @@
+import mock
 import pytest
 
 from abridger.exc import (UnknownTableError, UnknownColumnError,
@@ -274,6 +275,64 @@ class TestSqliteSchema(object):
         assert('col2', 'col3') not in tuples
         assert('col2', 'col4') not in tuples
 
+    def test_indexes(self, sqlite_conn):
+        for stmt in [
+            '''CREATE TABLE test1 (
+                    id INTEGER PRIMARY KEY,
+                    col1 TEXT UNIQUE,
+                    col2 TEXT,
+                    col3 TEXT
+                );
+            ''',
+            'CREATE INDEX index1 ON test1(col3, col2);',
+            'CREATE INDEX index2 ON test1(lower(col2));',
+        ]:
+            sqlite_conn.execute(stmt)
+
+        schema = SqliteSchema.create_from_conn(sqlite_conn)
+        table = schema.tables[0]
+        indexes = dict([(i.name, i) for i in table.indexes])
+        assert sorted(indexes.keys()) == [
+            'index1', 'sqlite_autoindex_test1_1']
+        assert [c.name for c in indexes['index1'].cols] == ['col3', 'col2']
+        assert not indexes['index1'].unique
+        assert indexes['sqlite_autoindex_test1_1'].unique
+        assert repr(indexes['index1']) == '<Index index1 on (col3,col2)>'
+
+        def has_index_for(*col_names):
+            return table.has_index_for(
+                tuple([table.cols_by_name[c] for c in col_names]))
+
+        assert has_index_for('id')
+        assert has_index_for('col1')
+        assert has_index_for('col3')
+        assert has_index_for('col2', 'col3')
+        assert not has_index_for('col2')
+        assert not has_index_for('id', 'col1')
+
+    @pytest.mark.parametrize('pragma_functions', [True, False])
+    def test_partial_indexes(self, sqlite_conn, pragma_functions):
+        for stmt in [
+            '''CREATE TABLE test1 (
+                    id INTEGER PRIMARY KEY,
+                    col1 TEXT,
+                    col2 TEXT
+                );
+            ''',
+            'CREATE INDEX index1 ON test1(col1) WHERE col2 IS NULL;',
+            'CREATE UNIQUE INDEX index2 ON test1(col2) WHERE col1 > 0;',
+            'CREATE INDEX index3 ON test1(col2);',
+        ]:
+            sqlite_conn.execute(stmt)
+
+        with mock.patch.object(SqliteSchema, 'has_pragma_functions',
+                               return_value=pragma_functions):
+            schema = SqliteSchema.create_from_conn(sqlite_conn)
+        table = schema.tables[0]
+        assert [i.name for i in table.indexes] == ['index3']
+        assert not table.has_index_for((table.cols_by_name['col1'],))
+        assert table.unique_indexes == []
+
     def test_self_referencing_non_null_foreign_key(self, sqlite_conn):
         for stmt in [
             '''CREATE TABLE test1 (
@@ -328,3 +387,30 @@ class TestSqliteSchema(object):
         assert tables[2].effective_primary_key == (tables[2].cols[0],
                                                    tables[2].cols[1])
         assert tables[2].can_have_duplicated_rows is True
+
+    def test_pragma_functions_fallback(self, sqlite_conn):
+        for stmt in self.test_relations_stmts + [
+                '''CREATE TABLE test3 (
+                    a INTEGER,
+                    b INTEGER,
+                    c TEXT UNIQUE,
+                    PRIMARY KEY (a, b)) WITHOUT ROWID''',
+                '''CREATE TABLE test4 (
+                    a INTEGER NOT NULL,
+                    b INTEGER NOT NULL,
+                    FOREIGN KEY (a, b) REFERENCES test3)''',
+                'CREATE UNIQUE INDEX test4_idx ON test4 (b, a)']:
+            sqlite_conn.execute(stmt)
+
+        schema = SqliteSchema.create_from_conn(sqlite_conn)
+        assert schema.pragma_functions is True
+        with mock.patch.object(SqliteSchema, 'has_pragma_functions',
+                               return_value=False):
+            fallback_schema = SqliteSchema.create_from_conn(sqlite_conn)
+
+        assert schema.dump() == fallback_schema.dump()
+        for table in schema.tables:
+            fallback_table = fallback_schema.tables_by_name[table.name]
+            assert [str(fk) for fk in table.foreign_keys] == \
+                [str(fk) for fk in fallback_table.foreign_keys]
+        assert len(schema.tables_by_name['test3'].unique_indexes) == 2
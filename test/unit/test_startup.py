@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+
+LIB_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib')
+
+# Importing the CLI must not take longer than this, in seconds. It's well
+# above the actual time so that slow test machines don't fail the test,
+# while still catching an accidental eager import of a heavy module.
+STARTUP_BUDGET = 0.5
+
+# Modules that must only be imported when they're needed
+LAZY_MODULES = ['jsonschema', 'yaml', 'dj_database_url', 'psycopg2',
+                'abridger.database.postgresql', 'abridger.transfer',
+                'abridger.database.fetch_cache', 'abridger.schema_cache',
+                'abridger.incremental', 'abridger.database.recording',
+                'abridger.extractor.provenance', 'abridger.hooks']
+
+
+def import_abridge_db():
+    code = '''
+from time import time
+import sys
+start = time()
+import abridger.abridge_db
+print(time() - start)
+print(' '.join(sorted(sys.modules.keys())))
+'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [LIB_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    (elapsed, modules) = output.decode('utf-8').splitlines()
+    return (float(elapsed), modules.split())
+
+
+class TestStartup(object):
+    def test_lazy_imports(self):
+        (elapsed, modules) = import_abridge_db()
+        for module in LAZY_MODULES:
+            assert module not in modules
+
+    def test_startup_budget(self):
+        # Take the best of a few runs to filter out noise
+        elapsed = min([import_abridge_db()[0] for i in range(3)])
+        assert elapsed < STARTUP_BUDGET
@@ -0,0 +1,162 @@
+from tempfile import NamedTemporaryFile
+from threading import Thread
+import pytest
+
+from abridger.database import SqliteDatabase
+from abridger.exc import TransferError
+from abridger.extraction_model import ExtractionModel
+from abridger.extractor import Extractor
+from abridger.generator import Generator
+from abridger.transfer import CopyPipe, SqliteTransfer, get_transfer_class
+
+
+class TestSqliteTransfer(object):
+    schema = [
+        '''CREATE TABLE test1 (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            test2_id INTEGER REFERENCES test2,
+            test3_id INTEGER REFERENCES test3)''',
+        '''CREATE TABLE test2 (
+            id INTEGER PRIMARY KEY,
+            test1_id INTEGER NOT NULL REFERENCES test1)''',
+        '''CREATE TABLE test3 (
+            id INTEGER PRIMARY KEY,
+            name TEXT)''',
+        '''CREATE TABLE test4 (
+            test1_id INTEGER NOT NULL REFERENCES test1,
+            name TEXT)''',
+        '''CREATE TABLE test5 (
+            a INTEGER NOT NULL,
+            b INTEGER,
+            name TEXT,
+            UNIQUE (a, b))''',
+    ]
+
+    @pytest.fixture(autouse=True)
+    def prepare(self, request):
+        self.src = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+        self.dst = NamedTemporaryFile(mode='wt', suffix='.sqlite3')
+
+        for path in (self.src.name, self.dst.name):
+            database = SqliteDatabase(path)
+            for stmt in self.schema:
+                database.execute(stmt)
+            database.connection.commit()
+            database.disconnect()
+
+        src_database = SqliteDatabase(self.src.name)
+        for stmt in [
+            "INSERT INTO test3 VALUES (1, 'three')",
+            "INSERT INTO test1 VALUES (1, 'one', NULL, 1)",
+            "INSERT INTO test1 VALUES (2, 'two', NULL, 1)",
+            'INSERT INTO test2 VALUES (1, 1)',
+            'UPDATE test1 SET test2_id = 1',
+            "INSERT INTO test4 VALUES (1, 'foo')",
+            "INSERT INTO test4 VALUES (1, 'foo')",
+            "INSERT INTO test4 VALUES (2, 'bar')",
+            "INSERT INTO test5 VALUES (1, NULL, 'foo')",
+            "INSERT INTO test5 VALUES (2, 2, 'bar')",
+        ]:
+            src_database.execute(stmt)
+        src_database.connection.commit()
+        src_database.disconnect()
+
+        self.src_database = SqliteDatabase(self.src.name)
+        self.dst_database = SqliteDatabase(self.dst.name)
+
+        def fin():
+            self.src_database.disconnect()
+            self.dst_database.disconnect()
+        request.addfinalizer(fin)
+
+    def run_transfer(self, data):
+        schema = self.src_database.schema
+        extraction_model = ExtractionModel.load(schema, data)
+        extractor = Extractor(self.src_database, extraction_model).launch()
+        generator = Generator(schema, extractor, generate=False)
+        generator.generate_update_statements()
+        return SqliteTransfer(self.src_database, self.dst_database,
+                              generator).run()
+
+    def dst_rows(self, table):
+        return sorted(self.dst_database.execute_and_fetchall(
+            'SELECT * FROM %s' % table))
+
+    def test_transfer(self):
+        transfer = self.run_transfer([
+            {'subject': [{'tables': [{'table': 'test4'}]}]},
+            {'relations': [{'table': 'test1', 'column': 'test3_id',
+                            'type': 'outgoing', 'disabled': True}]}])
+
+        assert transfer.insert_count == 6
+        assert transfer.update_count == 2
+        assert self.dst_rows('test1') == [
+            (1, 'one', 1, None), (2, 'two', 1, None)]
+        assert self.dst_rows('test2') == [(1, 1)]
+        assert self.dst_rows('test3') == []
+        assert self.dst_rows('test4') == [
+            (1, 'foo'), (1, 'foo'), (2, 'bar')]
+
+        # The destination is detached again
+        databases = self.src_database.execute_and_fetchall(
+            'PRAGMA database_list')
+        assert 'abridger_dst' not in [d[1] for d in databases]
+
+    def test_nullable_unique_key(self):
+        transfer = self.run_transfer([
+            {'subject': [{'tables': [{'table': 'test5'}]}]}])
+
+        # The row with a NULL in its key can't be joined on
+        assert transfer.insert_count == 2
+        assert self.dst_database.execute_and_fetchall(
+            'SELECT * FROM test5 ORDER BY name') == [
+                (2, 2, 'bar'), (1, None, 'foo')]
+
+    def test_failure_rollback(self):
+        self.dst_database.execute("INSERT INTO test3 VALUES (1, 'three')")
+        self.dst_database.connection.commit()
+
+        with pytest.raises(Exception):
+            self.run_transfer([
+                {'subject': [{'tables': [{'table': 'test1'}]}]},
+                {'relations': [{'defaults': 'everything'}]}])
+
+        assert self.dst_rows('test1') == []
+        assert self.dst_rows('test3') == [(1, 'three')]
+
+    def test_get_transfer_class(self):
+        assert get_transfer_class(self.src_database,
+                                  self.dst_database) == SqliteTransfer
+        with pytest.raises(TransferError):
+            get_transfer_class(self.src_database, object())
+
+
+class TestCopyPipe(object):
+    def test_read_write(self):
+        pipe = CopyPipe(max_chunks=2, chunk_size=4)
+        data = [b'%d\tfoo\n' % i for i in range(100)]
+
+        def writer():
+            for line in data:
+                pipe.write(line)
+            pipe.close()
+
+        thread = Thread(target=writer)
+        thread.start()
+        read_data = []
+        while True:
+            chunk = pipe.read(5)
+            if chunk == b'':
+                break
+            assert len(chunk) <= 5
+            read_data.append(chunk)
+        thread.join()
+        assert b''.join(read_data) == b''.join(data)
+
+    def test_abort(self):
+        pipe = CopyPipe(max_chunks=1, chunk_size=1)
+        pipe.write(b'foo')
+        pipe.abort()
+        with pytest.raises(IOError):
+            pipe.write(b'bar')